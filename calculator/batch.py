@@ -0,0 +1,194 @@
+"""
+Batches of tracks evaluated for one or more cars, for the JSON API.
+
+A batch request is a JSON object:
+
+    {
+        "tracks": [
+            {"name": "to_work.gpx", "gpx": "<?xml ..."},
+            {"digest": "<SHA-1 of a GPX file seen before>"}
+        ],
+        "cars": [
+            {"mass": 900, "motor_efficiency": 0.9},
+            {"mass": 1100}
+        ],
+        "preprocessing": "elevation=savgol:15:2"
+    }
+
+Car parameters are named and expressed like the attributes of Car,
+in SI units with efficiencies as fractions; missing ones take their
+default values. Tracks given by digest have to be in the parsed track
+cache or the kinematics cache already. Tracks and whole request bodies
+may be gzip compressed. The optional preprocessing is given as
+a specification of preprocessing.Preprocessing.parse.
+
+Results are dicts, one per track and car followed by one per car for
+the commute made of all the tracks, with stats as in utils.stats_json.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import StringIO
+import logging
+import preprocessing
+import re
+import track_gpx
+import zlib
+
+from utils import stats_json
+
+log = logging.getLogger(__name__)
+
+# Upper bound of the size of decompressed data [bytes].
+max_size = 256 << 20
+
+# Hexadecimal SHA-1 digests, the only ones cache paths are made of.
+digest_pattern = re.compile(r'[0-9a-f]{40}\Z')
+
+
+class BatchError(ValueError):
+    "An invalid batch request."
+
+
+def gunzip(data, limit=max_size):
+    "Data decompressed if it is gzip compressed."
+    if not data.startswith('\x1f\x8b'):
+        return data
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        result = decompressor.decompress(data, limit)
+    except zlib.error as error:
+        raise BatchError('invalid gzip data: %s' % error)
+    if decompressor.unconsumed_tail:
+        raise BatchError('decompressed data exceeds %d bytes' % limit)
+    return result
+
+
+def read_car(parameters):
+    "Car of a dict of parameters."
+    if not isinstance(parameters, dict):
+        raise BatchError('a car has to be an object')
+    car = track_gpx.Car()
+    for name, value in parameters.iteritems():
+        if name not in car.parameters:
+            raise BatchError('unknown car parameter: %s' % name)
+        try:
+            setattr(car, name, float(value))
+        except (TypeError, ValueError):
+            raise BatchError('invalid value of %s: %r' % (name, value))
+    return car
+
+
+def gpx_file(name, data):
+    "A named file object of (possibly compressed) GPX data."
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    file = StringIO.StringIO(gunzip(data))
+    file.name = name
+    return file
+
+
+def cached_file(digest, name=None):
+    "A CachedFile of a track known to the caches."
+    if not isinstance(digest, basestring) or not digest_pattern.match(digest):
+        raise BatchError('invalid track digest: %r' % (digest,))
+    if not track_gpx.Track.is_cached(digest):
+        raise BatchError('unknown track digest: %s' % digest)
+    return track_gpx.CachedFile(digest, name)
+
+
+def read_tracks(tracks):
+    "Files of the tracks of a batch request."
+    if not isinstance(tracks, list) or not tracks:
+        raise BatchError('tracks have to be a non-empty list')
+    files = []
+    for number, track in enumerate(tracks):
+        if not isinstance(track, dict):
+            raise BatchError('a track has to be an object')
+        if 'gpx' in track:
+            files.append(gpx_file(track.get('name', 'track%d' % number), track['gpx']))
+        elif 'digest' in track:
+            files.append(cached_file(track['digest'], track.get('name')))
+        else:
+            raise BatchError('a track needs gpx or digest')
+    return files
+
+
+def read_preprocessing(specification):
+    "Preprocessing of a specification, None if it is empty."
+    if not specification:
+        return None
+    try:
+        return preprocessing.Preprocessing.parse(specification) or None
+    except (AttributeError, ValueError) as error:
+        raise BatchError('invalid preprocessing: %s' % error)
+
+
+def read_request(request):
+    "(cars, files, preprocessing) of a decoded JSON batch request."
+    if not isinstance(request, dict):
+        raise BatchError('the request has to be an object')
+    cars = request.get('cars', [{}])
+    if not isinstance(cars, list) or not cars:
+        raise BatchError('cars have to be a non-empty list')
+    return (
+        [read_car(car) for car in cars],
+        read_tracks(request.get('tracks')),
+        read_preprocessing(request.get('preprocessing'))
+    )
+
+
+def evaluate(cars, files, preprocessing=None):
+    """Yields results of every track for every car as they are computed,
+    then results of the commutes of all the tracks, a commute per car.
+    A track which fails is reported with an error and left out of the
+    commutes."""
+    commutes = [
+        track_gpx.Commute(car, files, preprocessing=preprocessing)
+        for car in cars
+    ]
+    summaries = [[] for car in cars]
+
+    for file in files:
+        # every car gets the track of the same file in turn,
+        # so that its kinematics come from the cache
+        for number, commute in enumerate(commutes):
+            if hasattr(file, 'seek'):
+                file.seek(0)
+            track = track_gpx.Track(commute, file)
+            result = {'car': number, 'track': track.filename}
+            try:
+                result['digest'] = track.digest
+                result['stats'] = stats_json(track.stats)
+                summaries[number].append(track_gpx.Summary(track, histograms=False))
+            except Exception as error:
+                log.exception('track %s failed', track.filename)
+                result['error'] = '%s: %s' % (type(error).__name__, error)
+            yield result
+
+    for number, commute in enumerate(commutes):
+        result = {'car': number, 'commute': True}
+        if summaries[number]:
+            vars(commute)['tracks'] = summaries[number]
+            result['tracks'] = len(summaries[number])
+            result['stats'] = stats_json(commute.stats)
+        else:
+            result['error'] = 'no track could be computed'
+        yield result
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+
+"""
+Battery pack simulation: state of charge, current and voltage of
+the pack over a series of battery power demands, for example all
+the points of a year of commutes.
+
+The pack is a block of identical cells with an open circuit voltage
+depending on the state of charge and an internal resistance. At every
+point the current delivering the demanded power at the terminals
+solves P = (E - R I) I, limited by the C-rate limits of the cells;
+power the pack can't deliver is counted as a shortfall. The state of
+charge is not limited: falling below 0 means the pack ran flat.
+
+Simulation solves the whole series with array operations: the open
+circuit voltage changes slowly with the state of charge, so currents
+computed for an estimated state of charge give a better estimate,
+and a few passes make it exact. Battery steps through points one by
+one and gives the same results, for feeds of points or checking.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import numpy
+import preprocessing
+import time
+import track_gpx
+
+from utils import prop
+
+log = logging.getLogger(__name__)
+
+
+class Pack(object):
+    """A battery pack of identical cells with example
+    properties of 36 LiFePO4 cells of 160 Ah in series."""
+
+    # Names of the attributes describing the pack.
+    parameters = (
+        'cells_series',
+        'cells_parallel',
+        'cell_capacity',
+        'cell_resistance',
+        'max_discharge_rate',
+        'max_charge_rate',
+        'initial_soc',
+    )
+
+    cells_series = 36
+    cells_parallel = 1
+
+    cell_capacity = 160 # [Ah]
+
+    # DC internal resistance of a cell [ohm]
+    cell_resistance = 0.0009
+
+    # continuous current limits [C]
+    max_discharge_rate = 3.0
+    max_charge_rate = 1.0
+
+    # state of charge at the start and after every charging
+    initial_soc = 1.0
+
+    # open circuit voltage of a cell [V] at states of charge
+    ocv_soc = (0.0, 0.05, 0.1, 0.2, 0.5, 0.8, 0.9, 0.95, 1.0)
+    ocv_voltage = (2.5, 3.0, 3.15, 3.22, 3.28, 3.32, 3.34, 3.38, 3.5)
+
+    @prop
+    def capacity(self):
+        "Charge of the full pack [Ah]."
+        return self.cell_capacity * self.cells_parallel
+
+    @prop
+    def resistance(self):
+        "Internal resistance of the pack [ohm]."
+        return self.cell_resistance * self.cells_series / self.cells_parallel
+
+    @prop
+    def nominal_voltage(self):
+        "Open circuit voltage at half charge [V]."
+        return float(self.open_circuit_voltage(0.5))
+
+    @prop
+    def max_discharge_current(self):
+        "[A]"
+        return self.max_discharge_rate * self.capacity
+
+    @prop
+    def max_charge_current(self):
+        "[A]"
+        return self.max_charge_rate * self.capacity
+
+    def open_circuit_voltage(self, soc):
+        "Voltage of the pack without load at states of charge [V]."
+        return self.cells_series * numpy.interp(soc, self.ocv_soc, self.ocv_voltage)
+
+    def current(self, power, voltage):
+        """(current [A], limited) drawing power [W] from the terminals
+        of the pack with an open circuit voltage [V], limited to the
+        maximum power of the pack and the C-rate limits."""
+        power = numpy.asarray(power, float)
+        voltage = numpy.asarray(voltage, float)
+        discriminant = voltage**2 - 4 * self.resistance * power
+        # the smaller root of R I^2 - E I + P = 0, also for R = 0;
+        # past the maximum power E^2/4R the current giving it
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            current = numpy.where(
+                discriminant > 0,
+                2 * power / (voltage + numpy.sqrt(numpy.maximum(discriminant, 0))),
+                voltage / (2 * self.resistance)
+            )
+        limited = (discriminant <= 0) & (power > 0)
+        limited |= current > self.max_discharge_current
+        limited |= current < -self.max_charge_current
+        current = numpy.clip(current, -self.max_charge_current, self.max_discharge_current)
+        return current, limited
+
+
+class Battery(object):
+    "A pack discharged and charged point by point."
+
+    def __init__(self, pack, soc=None):
+        self.pack = pack
+        self.soc = pack.initial_soc if soc is None else soc
+
+    def step(self, power, period):
+        """Draws power [W] for period [s], returns the (current [A],
+        terminal voltage [V], limited) of the step."""
+        voltage = self.pack.open_circuit_voltage(self.soc)
+        current, limited = self.pack.current(power, voltage)
+        current = float(current)
+        self.soc -= current * period / (3600 * self.pack.capacity)
+        return current, float(voltage - current * self.pack.resistance), bool(limited)
+
+    def charge(self):
+        self.soc = self.pack.initial_soc
+
+
+class Simulation(object):
+    """A pack going through a series of battery powers, charged to
+    its initial_soc before the points at indices in charges."""
+
+    # Passes estimating the states of charge, a few are enough.
+    max_passes = 50
+    tolerance = 1e-12
+
+    def __init__(self, pack, power, period, charges=(0,)):
+        self.pack = pack
+        self.power = numpy.asarray(power, float)
+        self.period = numpy.asarray(period, float)
+        self.charges = numpy.union1d([0], numpy.asarray(charges, int))
+
+    def __len__(self):
+        return len(self.power)
+
+    @prop
+    def charged(self):
+        "Index of the last charging before (or at) every point."
+        charges = self.charges[self.charges < len(self)]
+        index = numpy.zeros(len(self), int)
+        index[charges] = charges
+        return numpy.maximum.accumulate(index)
+
+    def soc_before(self, current):
+        "States of charge before every point, given the currents."
+        charge = numpy.zeros(len(self) + 1)
+        numpy.cumsum(current * self.period, out=charge[1:])
+        used = charge[:-1] - charge[self.charged]
+        return self.pack.initial_soc - used / (3600 * self.pack.capacity)
+
+    @prop
+    def solution(self):
+        """(states of charge before, currents, limited flags) of all
+        points, the currents being those at the states of charge."""
+        soc = numpy.empty(len(self))
+        soc.fill(self.pack.initial_soc)
+        if not len(self):
+            return soc, numpy.zeros(0), numpy.zeros(0, bool)
+
+        for number in xrange(self.max_passes):
+            current, limited = self.pack.current(
+                self.power,
+                self.pack.open_circuit_voltage(soc)
+            )
+            estimate = self.soc_before(current)
+            error = numpy.abs(estimate - soc).max()
+            if error <= self.tolerance:
+                break
+            soc = estimate
+        else:
+            log.warning(
+                'states of charge did not converge in %d passes, '
+                'the last pass changed them by up to %g',
+                self.max_passes, error
+            )
+            current, limited = self.pack.current(
+                self.power,
+                self.pack.open_circuit_voltage(soc)
+            )
+        return soc, current, limited
+
+    def stepwise(self):
+        "Solution like the one of solution, computed point by point."
+        battery = Battery(self.pack)
+        charges = set(self.charges.tolist())
+        soc = numpy.empty(len(self))
+        current = numpy.empty(len(self))
+        limited = numpy.empty(len(self), bool)
+        for index in xrange(len(self)):
+            if index in charges:
+                battery.charge()
+            soc[index] = battery.soc
+            current[index], voltage, limited[index] = battery.step(
+                self.power[index],
+                self.period[index]
+            )
+        return soc, current, limited
+
+    @prop
+    def current(self):
+        "Pack current, negative when charging [A]."
+        return self.solution[1]
+
+    @prop
+    def soc(self):
+        "State of charge after every point."
+        soc, current, limited = self.solution
+        return soc - current * self.period / (3600 * self.pack.capacity)
+
+    @prop
+    def voltage(self):
+        "Terminal voltage of the pack [V]."
+        soc, current, limited = self.solution
+        return self.pack.open_circuit_voltage(soc) - current * self.pack.resistance
+
+    @prop
+    def terminal_power(self):
+        "Power delivered by the pack [W]."
+        return self.voltage * self.current
+
+    @prop
+    def min_soc(self):
+        "Lowest state of charge [%]."
+        return min(self.soc.min(), self.pack.initial_soc) * 100
+
+    @prop
+    def final_soc(self):
+        "State of charge at the end [%]."
+        return self.soc[-1] * 100
+
+    @prop
+    def peak_current(self):
+        "Highest discharge current [A]."
+        return max(self.current.max(), 0)
+
+    @prop
+    def peak_charge_current(self):
+        "Highest charge current [A]."
+        return max(-self.current.min(), 0)
+
+    @prop
+    def min_voltage(self):
+        "Lowest terminal voltage [V]."
+        return self.voltage.min()
+
+    @prop
+    def throughput(self):
+        "Energy discharged and charged through the terminals [Wh]."
+        return numpy.abs(self.terminal_power * self.period).sum() / 3600
+
+    @prop
+    def charge_throughput(self):
+        "Charge discharged and charged [Ah]."
+        return numpy.abs(self.current * self.period).sum() / 3600
+
+    @prop
+    def cycles(self):
+        "Equivalent full cycles."
+        return self.charge_throughput / (2 * self.pack.capacity)
+
+    @prop
+    def losses(self):
+        "Energy lost in the internal resistance [Wh]."
+        return (self.current**2 * self.pack.resistance * self.period).sum() / 3600
+
+    @prop
+    def limited_time(self):
+        "Time the demanded power could not be delivered [s]."
+        return self.period[self.solution[2]].sum()
+
+    @prop
+    def shortfall(self):
+        "Energy demanded but not delivered or accepted [Wh]."
+        return numpy.abs(
+            (self.power - self.terminal_power) * self.period
+        ).sum() / 3600
+
+    @prop
+    def stats(self):
+        "Simulation stats."
+        return {
+            'min soc': self.min_soc,
+            'final soc': self.final_soc,
+            'peak current': self.peak_current,
+            'peak charge current': self.peak_charge_current,
+            'min voltage': self.min_voltage,
+            'throughput': self.throughput,
+            'charge throughput': self.charge_throughput,
+            'equivalent cycles': self.cycles,
+            'resistive losses': self.losses,
+            'limited time': self.limited_time,
+            'shortfall': self.shortfall,
+        }
+
+
+stats_units = (
+    ('min soc', '%'),
+    ('final soc', '%'),
+    ('peak current', 'A'),
+    ('peak charge current', 'A'),
+    ('min voltage', 'V'),
+    ('throughput', 'Wh'),
+    ('charge throughput', 'Ah'),
+    ('equivalent cycles', ''),
+    ('resistive losses', 'Wh'),
+    ('limited time', 's'),
+    ('shortfall', 'Wh'),
+)
+
+
+def track_power(track):
+    """(start time, battery powers, periods) of a track, with
+    breaks between its segments taking no time."""
+    return (
+        track.start_time,
+        track.columns.battery_power,
+        track.time_at_point
+    )
+
+
+def read_track(job):
+    "track_power of a (car, file name, preprocessing) job."
+    car, file, preprocessing = job
+    track, = track_gpx.Commute(car, [file], preprocessing=preprocessing).tracks
+    return track_power(track)
+
+
+def drive_cycle(tracks, charging='daily'):
+    """(powers, periods, charges) of (start time, powers, periods)
+    of tracks in time order, charged every day (by local time),
+    before every track or never."""
+    tracks = sorted(tracks, key=lambda track: track[0])
+    charges = []
+    count = 0
+    day = None
+    for start, power, period in tracks:
+        if charging == 'track':
+            charges.append(count)
+        elif charging == 'daily':
+            if time.localtime(start)[:3] != day:
+                day = time.localtime(start)[:3]
+                charges.append(count)
+        count += len(power)
+    return (
+        numpy.concatenate([track[1] for track in tracks]),
+        numpy.concatenate([track[2] for track in tracks]),
+        charges or [0]
+    )
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Simulate a battery pack over commutes.'
+    )
+    parser.add_argument('files', metavar='file.gpx', nargs='+')
+    parser.add_argument('--charging', choices=('daily', 'track', 'never'),
+        default='daily', help='when the pack gets charged to --initial-soc')
+    parser.add_argument('--workers', type=int, default=1,
+        help='number of worker processes computing tracks')
+    parser.add_argument('--preprocess', metavar='STAGES',
+        type=preprocessing.Preprocessing.parse,
+        help='smoothing and resampling of the tracks, see preprocessing.py')
+    parser.add_argument('--stepwise', action='store_true',
+        help='simulate point by point, for checking')
+    for parameter in Pack.parameters:
+        parser.add_argument('--' + parameter.replace('_', '-'), type=float,
+            default=getattr(Pack, parameter))
+    options = parser.parse_args()
+    logging.basicConfig(format='%(message)s')
+
+    pack = Pack()
+    for parameter in Pack.parameters:
+        setattr(pack, parameter, getattr(options, parameter))
+
+    car = track_gpx.Car()
+    jobs = [(car, file, options.preprocess) for file in options.files]
+    if options.workers > 1:
+        pool = multiprocessing.Pool(options.workers)
+        tracks = pool.map(read_track, jobs, 1)
+        pool.close()
+        pool.join()
+    else:
+        tracks = map(read_track, jobs)
+
+    simulation = Simulation(pack, *drive_cycle(tracks, options.charging))
+    if options.stepwise:
+        vars(simulation)['solution'] = simulation.stepwise()
+
+    print 'Pack %.0f V, %.0f Ah, %.1f mOhm' % (
+        pack.nominal_voltage,
+        pack.capacity,
+        pack.resistance * 1000
+    )
+    for stat, unit in stats_units:
+        print '   %s: %.02f %s' % (stat, simulation.stats[stat], unit)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+"""
+Benchmarks of the calculator on synthetic tracks.
+
+Every stage of every case runs in a forked child process, so that its
+peak memory can be told apart and no cache survives between runs.
+The stages are:
+
+    parse          reading the GPX file into columns
+    track_stats    Track.stats of an already parsed track
+    commute_stats  Commute.stats of two tracks from scratch
+    web            POST of two tracks to the server form
+
+Results are written as JSON, and two result files (for example from
+two commits) can be compared with --compare.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import datetime
+import json
+import numpy
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import synthetic
+import track_gpx
+
+# Synthetic routes of the benchmark cases.
+cases = {
+    'short': dict(length=30),
+    'long': dict(length=300),
+    'segments': dict(length=300, segments=20, outliers=0.005),
+    'dense': dict(length=300, period=0.5, noise=0.2),
+    'huge': dict(length=3000),
+}
+
+default_cases = ('short', 'long', 'segments', 'dense')
+
+# Server form values for the web stage, default car in form units.
+form = {
+    'mass': '880',
+    'frontal_area': '1.95',
+    'cx': '0.37',
+    'rrc': '0.01355',
+    'power': '40',
+    'max_speed': '100',
+    'gearbox_efficiency': '90',
+    'motor_efficiency': '87',
+    'controller_efficiency': '95',
+    'battery_pack_efficiency': '95',
+    'regen_efficiency': '100',
+    'submit': 'Upload',
+}
+
+
+def parse(paths):
+    start = time.time()
+    track_gpx.Kinematics.read(paths[0])
+    return time.time() - start
+
+
+def track_stats(paths):
+    track, = track_gpx.Commute(track_gpx.Car(), paths[:1]).tracks
+    track.kinematics
+    start = time.time()
+    track.stats
+    return time.time() - start
+
+
+def commute_stats(paths):
+    start = time.time()
+    track_gpx.Commute(track_gpx.Car(), paths).stats
+    return time.time() - start
+
+
+def web(paths):
+    import server
+    track_gpx.Track.track_cache = None
+    client = server.app.test_client()
+    data = dict(form)
+    for index, path in enumerate(paths):
+        data['gpx%d' % (index + 1)] = (open(path, 'rb'), os.path.basename(path))
+    start = time.time()
+    response = client.post('/', data=data)
+    elapsed = time.time() - start
+    assert response.status_code == 200, response.status_code
+    return elapsed
+
+
+def idle(paths):
+    return 0.0
+
+
+stages = (
+    ('parse', parse),
+    ('track_stats', track_stats),
+    ('commute_stats', commute_stats),
+    ('web', web),
+)
+
+
+def measure(function, paths):
+    """Runs function in a child process. Returns the seconds it
+    reported and the peak resident memory of the child [kB]."""
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        status = 1
+        try:
+            track_gpx.Track.track_cache = None
+            seconds = function(paths)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(write, json.dumps([seconds, peak]))
+            status = 0
+        except:
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        output = pipe.read()
+    pid, status = os.waitpid(pid, 0)
+    if status:
+        raise RuntimeError('%s failed' % function.__name__)
+    return json.loads(output)
+
+
+def generate(directory, name, seed):
+    "Path of a synthetic track of a case, generating it if needed."
+    route = synthetic.Route(seed=seed, **cases[name])
+    path = os.path.join(directory, '%s-%d.gpx' % (name, seed))
+    if not os.path.exists(path):
+        with open(path, 'w') as file:
+            route.write(file, name)
+    return path, route.points
+
+
+def run(names, repeat, directory):
+    "Results of the benchmark cases."
+    results = []
+    for name in names:
+        paths = []
+        for seed in (1, 2):
+            path, points = generate(directory, name, seed)
+            paths.append(path)
+
+        case = {
+            'name': name,
+            'route': cases[name],
+            'points': points,
+            'file_size': os.path.getsize(paths[0]),
+            'baseline_rss_kb': measure(idle, paths)[1],
+            'stages': {},
+        }
+        for stage, function in stages:
+            runs = [measure(function, paths) for i in xrange(repeat)]
+            seconds = [run[0] for run in runs]
+            case['stages'][stage] = {
+                'seconds': seconds,
+                'best': min(seconds),
+                'median': float(numpy.median(seconds)),
+                'peak_rss_kb': max(run[1] for run in runs),
+            }
+            sys.stderr.write('%-10s %-14s %8.3f s %8d kB\n' % (
+                name,
+                stage,
+                min(seconds),
+                case['stages'][stage]['peak_rss_kb']
+            ))
+        results.append(case)
+    return results
+
+
+def revision():
+    "Git revision of the working tree, if there is one."
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, 'w')
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    "Prints the ratios of best times and peak memory of two result files."
+    old_cases = dict((case['name'], case) for case in old['cases'])
+    print '%-10s %-14s %10s %10s %7s %10s %10s' % (
+        'case', 'stage', 'old [s]', 'new [s]', 'ratio', 'old [kB]', 'new [kB]'
+    )
+    for case in new['cases']:
+        if case['name'] not in old_cases:
+            continue
+        for stage, result in sorted(case['stages'].items()):
+            previous = old_cases[case['name']]['stages'].get(stage)
+            if not previous:
+                continue
+            print '%-10s %-14s %10.3f %10.3f %7.2f %10d %10d' % (
+                case['name'],
+                stage,
+                previous['best'],
+                result['best'],
+                result['best'] / max(previous['best'], 1e-9),
+                previous['peak_rss_kb'],
+                result['peak_rss_kb']
+            )
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--cases', default=','.join(default_cases),
+        help='comma separated cases out of %s' % ', '.join(sorted(cases)))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--directory', default=os.path.join(
+        tempfile.gettempdir(), 'gpx2energy-benchmark'
+    ), help='directory for the synthetic tracks')
+    parser.add_argument('--output', type=argparse.FileType('w'),
+        default=sys.stdout, help='JSON results file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+        type=argparse.FileType('r'), help='compare two results files')
+    options = parser.parse_args()
+
+    if options.compare:
+        old, new = options.compare
+        compare(json.load(old), json.load(new))
+        sys.exit()
+
+    if not os.path.isdir(options.directory):
+        os.makedirs(options.directory)
+
+    names = options.cases.split(',')
+    for name in names:
+        if name not in cases:
+            parser.error('unknown case: %s' % name)
+
+    json.dump({
+        'revision': revision(),
+        'date': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'repeat': options.repeat,
+        'cases': run(names, options.repeat, options.directory),
+    }, options.output, indent=2, sort_keys=True)
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+
+"""
+Queries over the table of power semiconductors in
+spreadsheets/irf_igbt_table.fods (a flat ODS spreadsheet).
+
+The "data" sheet is parsed once, streaming, into a column store:
+number columns are float arrays (NaN for empty cells), text columns
+are integer codes into sorted lists of their distinct values. The
+store is cached in memory and on disk, keyed by the modification time
+of the spreadsheet. Every column gets a sorted index when it is first
+queried, so conditions become binary searches.
+
+Columns are named after their headers in lower case with runs of
+other characters than letters and digits replaced by _, for example
+vces_v for "VCES (V)", and key ratings have aliases: voltage, current,
+current_100c, vce_sat, rds_on, price. Conditions look like
+
+    voltage>=600  current=50..100  package=TO-247  package~247
+
+with operators =, != (also a..b ranges for =), <, <=, >, >= and
+~ (text containing), all of them having to hold.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import csv
+import errno
+import hashlib
+import json
+import numpy
+import os
+import re
+import sys
+import tempfile
+import track_cache
+import xml.etree.cElementTree
+
+default_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    'spreadsheets',
+    'irf_igbt_table.fods'
+)
+
+# Bump when the stored columns change.
+version = 1
+
+namespaces = {
+    'office': 'urn:oasis:names:tc:opendocument:xmlns:office:1.0',
+    'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
+    'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0',
+}
+table_tag = '{%(table)s}table' % namespaces
+row_tag = '{%(table)s}table-row' % namespaces
+cell_tags = (
+    '{%(table)s}table-cell' % namespaces,
+    '{%(table)s}covered-table-cell' % namespaces,
+)
+paragraph_tag = '{%(text)s}p' % namespaces
+name_attribute = '{%(table)s}name' % namespaces
+repeated_attribute = '{%(table)s}number-columns-repeated' % namespaces
+type_attribute = '{%(office)s}value-type' % namespaces
+value_attribute = '{%(office)s}value' % namespaces
+
+number_types = ('float', 'percentage', 'currency')
+
+# Aliases of key ratings, each naming the first column present
+# of its candidates (IGBT and MOSFET tables name them differently).
+aliases = {
+    'voltage': ('vces_v', 'vdss_v', 'vds_v'),
+    'current': ('ic_25c_a', 'id_25c_a'),
+    'current_100c': ('ic_100c_a', 'id_100c_a'),
+    'vce_sat': ('vce_on_25c_typ_v', 'vce_sat_typ_v'),
+    'rds_on': ('rds_on_max_mohm', 'rds_on_typ_mohm', 'rds_on_mohm'),
+    'price': ('1k_budgetary_pricing_usd',),
+}
+
+
+class QueryError(ValueError):
+    "An invalid query."
+
+
+def column_name(header):
+    "Name of a column of a header."
+    return re.sub('[^a-z0-9]+', '_', header.lower()).strip('_')
+
+
+def cell_value(cell):
+    "A float of a number cell, else the text of the cell."
+    if cell.get(type_attribute) in number_types:
+        return float(cell.get(value_attribute))
+    return u'\n'.join(
+        u''.join(paragraph.itertext())
+        for paragraph in cell.iter(paragraph_tag)
+    )
+
+
+def read_rows(file, sheet='data'):
+    """Yields lists of cell values of the rows of a sheet,
+    parsing the file as a stream."""
+    inside = False
+    for event, element in xml.etree.cElementTree.iterparse(file, ('start', 'end')):
+        if element.tag == table_tag:
+            if event == 'start':
+                inside = element.get(name_attribute) == sheet
+            elif inside:
+                return
+            continue
+        if not inside or event != 'end' or element.tag != row_tag:
+            continue
+        values = []
+        for cell in element:
+            if cell.tag not in cell_tags:
+                continue
+            value = cell_value(cell)
+            repeated = int(cell.get(repeated_attribute, 1))
+            # trailing empty cells repeat up to the last column
+            values.extend([value] * min(repeated, 1024))
+        element.clear()
+        while values and values[-1] == u'':
+            values.pop()
+        if values:
+            yield values
+
+
+class Table(object):
+    """Columns of a spreadsheet table: numbers holds float arrays,
+    codes and categories the integer codes of text cells and sorted
+    distinct texts, all by column name."""
+
+    def __init__(self, names, headers, numbers, codes, categories):
+        self.names = names
+        self.headers = headers
+        self.numbers = numbers
+        self.codes = codes
+        self.categories = categories
+        self.count = len((numbers.values() + codes.values())[0])
+        self.indexes = {}
+        self.aliases = dict(
+            (alias, next(name for name in candidates if name in names))
+            for (alias, candidates) in aliases.iteritems()
+            if any(name in names for name in candidates)
+        )
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def parse(cls, file, sheet='data'):
+        "Table of a sheet, its first row holding the headers."
+        rows = read_rows(file, sheet)
+        headers = [unicode(header) for header in next(rows)]
+        names = [column_name(header) for header in headers]
+        values = [[] for name in names]
+        for row in rows:
+            row.extend([u''] * (len(names) - len(row)))
+            for column, value in zip(values, row):
+                column.append(value)
+
+        numbers = {}
+        codes = {}
+        categories = {}
+        for name, column in zip(names, values):
+            if all(isinstance(value, float) or value == u'' for value in column):
+                numbers[name] = numpy.array(
+                    [numpy.nan if value == u'' else value for value in column]
+                )
+            else:
+                texts = [unicode(value) if not isinstance(value, float)
+                         else u'%g' % value for value in column]
+                categories[name], codes[name] = numpy.unique(
+                    numpy.array(texts, unicode),
+                    return_inverse=True
+                )
+                codes[name] = codes[name].astype(numpy.int32)
+        return cls(names, headers, numbers, codes, categories)
+
+    def resolve(self, name):
+        "Column name of a name or an alias."
+        name = self.aliases.get(name, name)
+        if name not in self.names:
+            raise QueryError('unknown column: %s' % name)
+        return name
+
+    def index(self, name):
+        """(row numbers ordered by values, ordered values) of a column,
+        texts ordered by their codes; NaN values come last."""
+        if name not in self.indexes:
+            values = self.numbers[name] if name in self.numbers else self.codes[name]
+            order = numpy.argsort(values, kind='mergesort')
+            self.indexes[name] = order, values[order]
+        return self.indexes[name]
+
+    def select(self, name, low=None, high=None, low_open=False, high_open=False):
+        "Boolean mask of rows with values of a column in a range."
+        order, ordered = self.index(name)
+        first = 0
+        end = numpy.searchsorted(ordered, numpy.nan, 'left') \
+            if name in self.numbers else len(ordered)
+        if low is not None:
+            first = numpy.searchsorted(ordered[:end], low, 'right' if low_open else 'left')
+        if high is not None:
+            end = numpy.searchsorted(ordered[:end], high, 'left' if high_open else 'right')
+        mask = numpy.zeros(len(ordered), bool)
+        mask[order[first:end]] = True
+        return mask
+
+    def text_code(self, name, value):
+        "Code of a text in a column, None if it does not occur."
+        categories = self.categories[name]
+        position = numpy.searchsorted(categories, value)
+        if position < len(categories) and categories[position] == value:
+            return position
+        return None
+
+    def condition(self, condition):
+        "Boolean mask of rows meeting a condition like voltage>=600."
+        match = re.match(r'\s*([\w]+)\s*(>=|<=|!=|=|<|>|~)\s*(.*?)\s*$', condition, re.U)
+        if not match:
+            raise QueryError('invalid condition: %s' % condition)
+        name, operator, value = match.groups()
+        name = self.resolve(name)
+
+        if name in self.codes:
+            value = unicode(value)
+            if operator == '~':
+                matching = numpy.flatnonzero(numpy.char.find(
+                    numpy.char.lower(self.categories[name]), value.lower()
+                ) >= 0)
+                return numpy.in1d(self.codes[name], matching)
+            code = self.text_code(name, value)
+            if operator in ('=', '!='):
+                if code is None:
+                    mask = numpy.zeros(len(self), bool)
+                else:
+                    mask = self.select(name, code, code)
+                return ~mask if operator == '!=' else mask
+            raise QueryError('%s is a text column, use =, != or ~' % name)
+
+        if operator == '~':
+            raise QueryError('%s is a number column' % name)
+        try:
+            if operator == '=' and '..' in value:
+                low, high = [float(bound) if bound else None for bound in value.split('..')]
+                return self.select(name, low, high)
+            value = float(value)
+        except ValueError:
+            raise QueryError('invalid number: %s' % value)
+        if operator == '=':
+            return self.select(name, value, value)
+        if operator == '!=':
+            return ~self.select(name, value, value)
+        return {
+            '<': lambda: self.select(name, high=value, high_open=True),
+            '<=': lambda: self.select(name, high=value),
+            '>': lambda: self.select(name, value, low_open=True),
+            '>=': lambda: self.select(name, value),
+        }[operator]()
+
+    def query(self, conditions=(), sort=None, descending=False, limit=None):
+        "Row numbers of the rows meeting all the conditions."
+        mask = numpy.ones(len(self), bool)
+        for condition in conditions:
+            mask &= self.condition(condition)
+        if sort:
+            sort = self.resolve(sort)
+            order, ordered = self.index(sort)
+            if descending:
+                # NaN values still come last
+                valid = len(order) if sort not in self.numbers else \
+                    numpy.searchsorted(ordered, numpy.nan, 'left')
+                order = numpy.concatenate((order[:valid][::-1], order[valid:]))
+            rows = order[mask[order]]
+        else:
+            rows = numpy.flatnonzero(mask)
+        return rows[:limit]
+
+    def value(self, name, row):
+        if name in self.numbers:
+            value = float(self.numbers[name][row])
+            return None if numpy.isnan(value) else value
+        value = self.categories[name][self.codes[name][row]]
+        return value or None
+
+    def rows(self, rows, columns=None):
+        "Dicts of column names to values of rows."
+        columns = [self.resolve(name) for name in columns] if columns else self.names
+        return [
+            dict((name, self.value(name, row)) for name in columns)
+            for row in rows
+        ]
+
+    def store(self, path, mtime):
+        "Saves the table to a file, stamped with the spreadsheet mtime."
+        arrays = {
+            'mtime': numpy.array(mtime),
+            'names': numpy.array(self.names, unicode),
+            'headers': numpy.array(self.headers, unicode),
+        }
+        for name, values in self.numbers.iteritems():
+            arrays['number_' + name] = values
+        for name, codes in self.codes.iteritems():
+            arrays['codes_' + name] = codes
+            arrays['categories_' + name] = self.categories[name]
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(path),
+            suffix='.tmp'
+        )
+        with os.fdopen(descriptor, 'wb') as file:
+            numpy.savez(file, **arrays)
+        os.rename(temporary, path)
+
+    @classmethod
+    def restore(cls, path, mtime):
+        "Table saved to a file for the spreadsheet mtime, or None."
+        try:
+            arrays = numpy.load(path)
+        except (IOError, OSError, ValueError):
+            return None
+        with arrays:
+            if float(arrays['mtime']) != mtime:
+                return None
+            names = arrays['names'].tolist()
+            numbers = {}
+            codes = {}
+            categories = {}
+            for name in names:
+                if 'number_' + name in arrays:
+                    numbers[name] = arrays['number_' + name]
+                else:
+                    codes[name] = arrays['codes_' + name]
+                    categories[name] = arrays['categories_' + name]
+            return cls(names, arrays['headers'].tolist(), numbers, codes, categories)
+
+
+# Tables loaded by this process, by path: (mtime, table).
+tables = {}
+
+
+def load(path=default_path, cache_directory=track_cache.default_directory):
+    """Table of the data sheet of a spreadsheet, parsed only when
+    neither this process nor the cache directory has it for the
+    current modification time of the file."""
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime
+    if path in tables and tables[path][0] == mtime:
+        return tables[path][1]
+
+    table = None
+    cache_path = None
+    if cache_directory:
+        cache_path = os.path.join(cache_directory, 'components-%s-v%d.npz' % (
+            hashlib.sha1(path).hexdigest(),
+            version
+        ))
+        table = Table.restore(cache_path, mtime)
+    if table is None:
+        with open(path, 'rb') as file:
+            table = Table.parse(file)
+        if cache_path:
+            try:
+                os.makedirs(cache_directory)
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+            table.store(cache_path, mtime)
+
+    tables[path] = mtime, table
+    return table
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Query the table of power semiconductors.',
+        epilog='Conditions are like voltage>=600, current=50..100, '
+               'package=TO-247 or package~247, see components.py.'
+    )
+    parser.add_argument('conditions', metavar='condition', nargs='*')
+    parser.add_argument('--file', default=default_path,
+        help='flat ODS spreadsheet with the table in a "data" sheet')
+    parser.add_argument('--columns',
+        help='comma separated columns to show, all by default')
+    parser.add_argument('--sort', metavar='COLUMN')
+    parser.add_argument('--descending', action='store_true')
+    parser.add_argument('--limit', type=int)
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    parser.add_argument('--list-columns', action='store_true',
+        help='show the column names, aliases and headers')
+    options = parser.parse_args()
+
+    table = load(options.file)
+
+    if options.list_columns:
+        aliased = dict((name, alias) for (alias, name) in table.aliases.iteritems())
+        for name, header in zip(table.names, table.headers):
+            kind = 'number' if name in table.numbers else 'text'
+            alias = aliased.get(name, '')
+            print ('%-28s %-14s %-7s %s' % (name, alias, kind, header)).encode('utf-8')
+        sys.exit()
+
+    columns = options.columns.split(',') if options.columns else None
+    try:
+        rows = table.rows(
+            table.query(options.conditions, options.sort, options.descending, options.limit),
+            columns
+        )
+    except QueryError as error:
+        parser.error(str(error))
+    columns = [table.resolve(name) for name in columns] if columns else table.names
+
+    if options.format == 'json':
+        json.dump(rows, sys.stdout, indent=1)
+        print
+    else:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([
+                '' if row[name] is None else unicode(row[name]).encode('utf-8')
+                for name in columns
+            ])
@@ -0,0 +1,147 @@
+"""
+Motor and inverter efficiency depending on the operating point.
+
+An EfficiencyMap holds the efficiency of the motor with its inverter
+on a grid of motor speeds and torques, and interpolates it bilinearly
+for whole arrays of operating points. MappedCar is a Car using such
+a map instead of constant motor and controller efficiencies, at the
+motor speed and torque which the gear ratio and the wheel radius of
+the Car give for the speed and the force of every point.
+
+Maps are CSV files with torques [Nm] in the first row (after an empty
+or label cell) and rows of a motor speed [rpm] followed by the
+efficiencies (as fractions) at the torques. Both axes have to grow.
+Without a file, EfficiencyMap.model gives an example map of a 30 kW
+induction motor from a simple loss model.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import math
+import numpy
+import track_physics
+
+from utils import prop
+
+
+def locate(axis, step, values):
+    """(indices of the cells, fractions of the way through them)
+    of values along a growing axis, values out of it being moved
+    to its ends. Arithmetic for axes of a constant step."""
+    values = numpy.clip(values, axis[0], axis[-1])
+    if step:
+        index = ((values - axis[0]) / step).astype(int)
+    else:
+        index = numpy.searchsorted(axis, values, 'right') - 1
+    index = numpy.clip(index, 0, len(axis) - 2)
+    fraction = (values - axis[index]) / (axis[index + 1] - axis[index])
+    return index, fraction
+
+
+def constant_step(axis):
+    "Step of an evenly spaced axis, None for an uneven one."
+    steps = numpy.diff(axis)
+    if numpy.allclose(steps, steps[0]):
+        return steps[0]
+    return None
+
+
+class EfficiencyMap(object):
+    "Efficiency [fraction] on a grid of motor speeds [rpm] and torques [Nm]."
+
+    # Efficiencies are kept above this, for points of next to no load.
+    min_efficiency = 0.5
+
+    def __init__(self, rpm, torque, efficiency):
+        self.rpm = numpy.asarray(rpm, float)
+        self.torque = numpy.asarray(torque, float)
+        self.efficiency = numpy.clip(
+            numpy.asarray(efficiency, float),
+            self.min_efficiency,
+            1
+        )
+        if self.efficiency.shape != (len(self.rpm), len(self.torque)):
+            raise ValueError('efficiency map of %s values for %d speeds and %d torques' % (
+                self.efficiency.shape, len(self.rpm), len(self.torque)
+            ))
+        for axis in (self.rpm, self.torque):
+            if len(axis) < 2 or numpy.any(numpy.diff(axis) <= 0):
+                raise ValueError('efficiency map axes need 2 or more growing values')
+        self.rpm_step = constant_step(self.rpm)
+        self.torque_step = constant_step(self.torque)
+
+    @classmethod
+    def load(cls, file):
+        "Map of a CSV file name or file object."
+        if not hasattr(file, 'read'):
+            file = open(file, 'rb')
+        rows = [row for row in csv.reader(file) if row]
+        torque = [float(value) for value in rows[0][1:]]
+        rpm = [float(row[0]) for row in rows[1:]]
+        efficiency = [[float(value) for value in row[1:]] for row in rows[1:]]
+        return cls(rpm, torque, efficiency)
+
+    @classmethod
+    def model(cls, max_rpm=12000, max_torque=250, fixed_loss=300,
+              copper_loss=0.1, iron_loss=0.05):
+        """Map of a motor losing fixed_loss [W], copper_loss * torque^2
+        and iron_loss * (angular speed [rad/s])^1.5."""
+        rpm = numpy.arange(0, max_rpm + 1, 250.0)
+        torque = numpy.arange(0, max_torque + 1, 5.0)
+        speed = rpm[:, None] * 2 * math.pi / 60
+        power = speed * torque[None, :]
+        losses = fixed_loss + copper_loss * torque[None, :]**2 + iron_loss * speed**1.5
+        return cls(rpm, torque, power / (power + losses))
+
+    def __call__(self, rpm, torque):
+        "Efficiencies at arrays of motor speeds [rpm] and torques [Nm]."
+        i, x = locate(self.rpm, self.rpm_step, rpm)
+        j, y = locate(self.torque, self.torque_step, torque)
+        e = self.efficiency
+        return (
+            (e[i, j] * (1 - y) + e[i, j + 1] * y) * (1 - x) +
+            (e[i + 1, j] * (1 - y) + e[i + 1, j + 1] * y) * x
+        )
+
+
+class MappedCar(track_physics.Car):
+    """A Car whose motor and inverter efficiency comes from a map
+    of operating points, by default the example model map."""
+
+    parameters = tuple(
+        parameter for parameter in track_physics.Car.parameters
+        if parameter not in ('controller_efficiency', 'motor_efficiency')
+    )
+
+    def __init__(self, efficiency_map=None):
+        if efficiency_map is not None:
+            # efficiency_map is a cached property, without a setter
+            vars(self)['efficiency_map'] = efficiency_map
+
+    @prop
+    def efficiency_map(self):
+        return EfficiencyMap.model()
+
+    def electrical_efficiency_at(self, points):
+        return self.battery_pack_efficiency * self.efficiency_map(
+            self.motor_rpm(points.speed),
+            self.motor_torque(points.force)
+        )
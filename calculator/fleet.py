@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""
+Fleet mode: stats of every GPX file of a directory tree, and
+distributions over all of them.
+
+Files are visited in sorted order and computed by a pool of worker
+processes a chunk at a time. Stats of every file are appended to
+a CSV file, and after every chunk a checkpoint records the last file
+done and the size of the CSV, so that an interrupted run can be
+resumed with --resume. Aggregates (energy rate percentiles, peak
+power histograms, energy by day) are then computed by a single pass
+over the CSV. Memory use does not depend on the number of files.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import collections
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import preprocessing
+import sketches
+import sys
+import time
+import track_cache
+import track_gpx
+
+from utils import stats_units
+
+# CSV columns besides the stats.
+columns = ('file', 'digest', 'start', 'date', 'points', 'error')
+
+# Files sent to the workers at once, per worker.
+chunk = 16
+
+
+def walk(directory, suffix='.gpx'):
+    """Paths relative to the directory of the files with the suffix
+    in the tree, in the order of their path components."""
+    def visit(parts):
+        path = os.path.join(directory, *parts)
+        for name in sorted(os.listdir(path)):
+            if os.path.isdir(os.path.join(path, name)):
+                for found in visit(parts + (name,)):
+                    yield found
+            elif name.lower().endswith(suffix):
+                yield parts + (name,)
+
+    for parts in visit(()):
+        yield os.path.join(*parts)
+
+
+def order(path):
+    "Position of a relative path in the walk order."
+    return tuple(path.split(os.sep))
+
+
+def compute(job):
+    "CSV row of a (directory, path, car, preprocessing) job."
+    directory, path, car, preprocessing = job
+    row = dict.fromkeys(columns + tuple(stat for stat, unit in stats_units), '')
+    row['file'] = path
+    try:
+        commute = track_gpx.Commute(car, [os.path.join(directory, path)],
+                                    preprocessing=preprocessing)
+        track, = commute.tracks
+        stats = track.stats
+        row['digest'] = track.digest
+        row['points'] = len(track.kinematics)
+        start = time.gmtime(track.start_time)
+        row['start'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', start)
+        row['date'] = time.strftime('%Y-%m-%d', start)
+        for stat, unit in stats_units:
+            value = stats[stat]
+            if isinstance(value, tuple):
+                value = value[0]
+            row[stat] = repr(float(value))
+    except Exception as error:
+        row['error'] = '%s: %s' % (type(error).__name__, error)
+    return row
+
+
+def worker_init(cache):
+    track_gpx.Track.track_cache = cache
+
+
+class Checkpoint(object):
+    "Progress of a run, stored next to its CSV output."
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        "(last file done, CSV size) or None."
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except (IOError, ValueError):
+            return None
+        return state['last'], state['offset']
+
+    def store(self, last, offset):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'last': last, 'offset': offset}, file)
+        os.rename(temporary, self.path)
+
+
+def run(directory, output, car, workers=1, preprocessing=None,
+        resume=False, cache=None, log=sys.stderr):
+    "Writes a CSV row for every GPX file of the directory tree."
+    checkpoint = Checkpoint(output + '.checkpoint')
+    fields = list(columns) + [stat for stat, unit in stats_units]
+
+    state = checkpoint.load() if resume else None
+    if state and os.path.exists(output):
+        last, offset = state
+        file = open(output, 'r+b')
+        # drop rows written after the checkpoint
+        file.truncate(offset)
+        file.seek(offset)
+        writer = csv.DictWriter(file, fields)
+        paths = itertools.dropwhile(
+            lambda path: order(path) <= order(last),
+            walk(directory)
+        )
+    else:
+        file = open(output, 'wb')
+        writer = csv.DictWriter(file, fields)
+        writer.writeheader()
+        paths = walk(directory)
+
+    pool = multiprocessing.Pool(workers, worker_init, (cache,))
+    done = 0
+    try:
+        while True:
+            paths_chunk = list(itertools.islice(paths, chunk * workers))
+            if not paths_chunk:
+                break
+            jobs = [(directory, path, car, preprocessing) for path in paths_chunk]
+            for row in pool.imap(compute, jobs):
+                writer.writerow(row)
+                if row['error']:
+                    log.write('%s: %s\n' % (row['file'], row['error']))
+            file.flush()
+            os.fsync(file.fileno())
+            checkpoint.store(paths_chunk[-1], file.tell())
+            done += len(paths_chunk)
+            log.write('%d files done, last %s\n' % (done, paths_chunk[-1]))
+    finally:
+        pool.close()
+        pool.join()
+        file.close()
+
+
+def aggregate(output, power_step=1000, energy_rate_step=1):
+    "Aggregate distributions over the rows of a CSV output."
+    energy_rate = sketches.Histogram.linear(0, 1000, energy_rate_step)
+    peak_output_power = sketches.Histogram.linear(0, 200000, power_step)
+    peak_regen_power = sketches.Histogram.linear(0, 200000, power_step)
+    daily_energy = collections.defaultdict(float)
+    totals = collections.Counter()
+
+    with open(output, 'rb') as file:
+        for row in csv.DictReader(file):
+            totals['files'] += 1
+            if row['error']:
+                totals['failed'] += 1
+                continue
+            totals['distance'] += float(row['distance'])
+            totals['energy'] += float(row['energy'])
+            totals['duration'] += float(row['duration'])
+            energy_rate.add([float(row['energy rate'])])
+            peak_output_power.add([float(row['peak output power'])])
+            peak_regen_power.add([float(row['peak regen power'])])
+            daily_energy[row['date']] += float(row['energy'])
+
+    percentiles = (5, 10, 25, 50, 75, 90, 95, 99)
+    return {
+        'files': totals['files'],
+        'failed': totals['failed'],
+        'distance': totals['distance'],
+        'duration': totals['duration'],
+        'energy': totals['energy'],
+        'energy_rate_percentiles': dict(
+            ('p%d' % p, energy_rate.quantile(p / 100.0)) for p in percentiles
+        ),
+        'peak_output_power_histogram': peak_output_power.as_dict(),
+        'peak_regen_power_histogram': peak_regen_power.as_dict(),
+        'daily_energy': [
+            {'date': date, 'energy': energy}
+            for date, energy in sorted(daily_energy.iteritems())
+        ],
+    }
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Calculate power and energy needs of all the GPX '
+                    'files in a directory tree.'
+    )
+    parser.add_argument('directory')
+    parser.add_argument('--output', default='fleet.csv',
+        help='CSV file with the stats of every file')
+    parser.add_argument('--aggregates', type=argparse.FileType('w'),
+        default=sys.stdout, help='JSON file with the aggregates')
+    parser.add_argument('--resume', action='store_true',
+        help='continue an interrupted run over the same directory')
+    parser.add_argument('--workers', type=int,
+        default=multiprocessing.cpu_count(),
+        help='number of worker processes')
+    parser.add_argument('--preprocess', metavar='STAGES',
+        type=preprocessing.Preprocessing.parse,
+        help='smoothing and resampling of the tracks, see preprocessing.py')
+    parser.add_argument('--cache', metavar='DIRECTORY',
+        help='directory of a parsed track cache, none by default')
+    parser.add_argument('--power-step', metavar='W', type=float, default=1000,
+        help='bin width of the peak power histograms')
+    options = parser.parse_args()
+
+    cache = None
+    if options.cache:
+        cache = track_cache.TrackCache(options.cache)
+
+    run(
+        options.directory,
+        options.output,
+        track_gpx.Car(),
+        options.workers,
+        options.preprocess,
+        options.resume,
+        cache
+    )
+    json.dump(
+        aggregate(options.output, options.power_step),
+        options.aggregates,
+        indent=2,
+        sort_keys=True
+    )
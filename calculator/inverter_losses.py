@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+
+"""
+Inverter losses over a commute for candidate power devices from the
+component table (see components.py), ranked by the energy they lose.
+
+Every point of the commute gives the electrical power of the motor,
+its motor_power over motor_efficiency (times it in regen), and the
+DC link voltage under load from a battery.Simulation of the commute.
+Like the "load" sheet of the spreadsheet the inverter runs at full
+modulation, so a phase carries the peak current
+
+    I = sqrt(2) * P / (3 * power_factor * V / (2 * sqrt(2)))
+
+Each of the six switch positions is an IGBT with its diode, both
+dropping V0 + r * i: V0 is threshold_voltage and r takes the drop
+up to VCE(ON) at the IC @ 100C rating. A leg loses, over a period
+of the fundamental,
+
+    conduction: 2 * V0 * I / pi + r * I^2 / 2
+    switching:  f * Ets * (V / (test_voltage_ratio * VCES))
+                  * ((2 * I / pi) / IC @ 100C)
+
+with Ets scaled from the test conditions assumed by test_voltage_ratio.
+With parallel devices per switch position r is divided by their number.
+
+The losses of all the devices at all the points are a product of
+a matrix of device coefficients and one of point features, computed
+for blocks of points. Peaks are those of losses and currents averaged
+over thermal_window, as the heatsink and the devices smooth out short
+bursts. Junction temperatures are steady state ones for the average
+and the peak loss of a device, with the junction to case resistance
+from the PD @25C rating.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import battery
+import components
+import math
+import numpy
+import preprocessing
+import track_gpx
+
+from utils import prop
+
+
+class Inverter(object):
+    """A three phase, two level inverter with example properties
+    of a 10 kHz drive of an induction motor."""
+
+    # Names of the attributes describing the inverter.
+    parameters = (
+        'switching_frequency',
+        'power_factor',
+        'threshold_voltage',
+        'test_voltage_ratio',
+        'heatsink_temperature',
+        'case_resistance',
+        'max_junction_temperature',
+        'voltage_margin',
+        'parallel',
+        'thermal_window',
+    )
+
+    switching_frequency = 10000 # [Hz]
+
+    # of the motor, as in the load sheet of the spreadsheet
+    power_factor = 0.83
+
+    # part of the on state voltage drop not growing with the current [V]
+    threshold_voltage = 0.8
+
+    # switching energies are given at this part of VCES
+    # and at the IC @ 100C rating
+    test_voltage_ratio = 2/3.0
+
+    heatsink_temperature = 60 # [C]
+
+    # thermal resistance from the case to the heatsink [K/W]
+    case_resistance = 0.3
+
+    max_junction_temperature = 150 # [C]
+
+    # VCES has to exceed the highest DC voltage by this part
+    voltage_margin = 0.5
+
+    # devices in parallel in every switch position; a 40 kW motor
+    # on the low voltage of the pack draws peak phase currents of
+    # 250-300 A, rated for with four devices of 90 A at 100C
+    parallel = 4
+
+    # peaks are of averages over this time [s]
+    thermal_window = 10.0
+
+    def phase_current(self, power, voltage):
+        "Peak phase current [A] for AC power [W] at DC voltage [V]."
+        phase_voltage = voltage / (2 * math.sqrt(2))
+        return math.sqrt(2) * numpy.abs(power) / (3 * self.power_factor * phase_voltage)
+
+
+class Devices(object):
+    "Candidate devices, the rows of the component table with all the ratings."
+
+    def __init__(self, table, rows):
+        self.table = table
+        ratings = [
+            table.numbers[table.resolve(name)][rows]
+            for name in ('voltage', 'current_100c', 'vce_sat')
+        ] + [table.numbers['ets_typ_mj'][rows], table.numbers['pd_25c_w'][rows]]
+        known = numpy.all(~numpy.isnan(ratings), 0)
+        self.rows = numpy.asarray(rows)[known]
+        (
+            self.voltage,
+            self.current,
+            self.vce_on,
+            switching_energy,
+            self.power_rating
+        ) = [rating[known] for rating in ratings]
+        self.switching_energy = switching_energy / 1000 # [J]
+
+    def __len__(self):
+        return len(self.rows)
+
+    @prop
+    def parts(self):
+        return [self.table.value('part', row) for row in self.rows]
+
+    def coefficients(self, inverter):
+        """Matrix of the losses [W] of the whole inverter per
+        feature of a point, a device per row, see features."""
+        threshold = numpy.minimum(inverter.threshold_voltage, self.vce_on)
+        resistance = (self.vce_on - threshold) / self.current / inverter.parallel
+        switching = inverter.switching_frequency * self.switching_energy / (
+            inverter.test_voltage_ratio * self.voltage * self.current
+        )
+        return 3 * numpy.column_stack((
+            2 * threshold / math.pi,
+            resistance / 2,
+            switching,
+        ))
+
+    def junction_resistance(self, inverter):
+        "Thermal resistance from the junction to the heatsink [K/W]."
+        return (inverter.max_junction_temperature - 25) / self.power_rating + \
+            inverter.case_resistance
+
+
+def features(current, voltage):
+    """Features of points which losses are linear in, a point per row:
+    peak phase current, its square and DC voltage times the average
+    rectified phase current."""
+    return numpy.column_stack((
+        current,
+        current**2,
+        voltage * 2 * current / math.pi,
+    ))
+
+
+def windowed(values, period, window):
+    """Averages of the rows of values over the time window [s]
+    ending at every point, weighted by the periods of the points."""
+    time = numpy.cumsum(period)
+    integral = numpy.zeros((len(values) + 1, values.shape[1]))
+    numpy.cumsum(values * period[:, None], 0, out=integral[1:])
+    start = numpy.searchsorted(time, time - window, 'right')
+    duration = time - time[start] + period[start]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        averages = (integral[1:] - integral[start]) / duration[:, None]
+    return numpy.where(duration[:, None] > 0, averages, values)
+
+
+class Estimate(object):
+    """Losses of candidate devices in an inverter over points of
+    AC power and DC voltage lasting periods."""
+
+    # Size of the blocks of the devices x points loss matrix.
+    block_size = 1 << 22
+
+    def __init__(self, devices, inverter, power, voltage, period):
+        self.devices = devices
+        self.inverter = inverter
+        self.voltage = numpy.asarray(voltage, float)
+        self.period = numpy.asarray(period, float)
+        self.current = inverter.phase_current(power, self.voltage)
+
+    @prop
+    def coefficients(self):
+        return self.devices.coefficients(self.inverter)
+
+    @prop
+    def features(self):
+        return features(self.current, self.voltage)
+
+    @prop
+    def windowed_features(self):
+        "Features averaged over the thermal window."
+        return windowed(self.features, self.period, self.inverter.thermal_window)
+
+    @prop
+    def energy(self):
+        "Energy lost by the inverter with every device [Wh]."
+        return self.coefficients.dot(self.features.T.dot(self.period)) / 3600
+
+    @prop
+    def duration(self):
+        return self.period.sum()
+
+    @prop
+    def average_loss(self):
+        "Average power lost by the inverter with every device [W]."
+        return self.energy * 3600 / self.duration
+
+    @prop
+    def peak_loss(self):
+        "Highest power lost by the inverter with every device [W]."
+        peak = numpy.zeros(len(self.devices))
+        block = max(self.block_size // max(len(self.devices), 1), 1)
+        for first in xrange(0, len(self.current), block):
+            losses = self.coefficients.dot(
+                self.windowed_features[first:first + block].T
+            )
+            numpy.maximum(peak, losses.max(1), out=peak)
+        return peak
+
+    @prop
+    def peak_current(self):
+        "Highest peak phase current averaged over the thermal window [A]."
+        return self.windowed_features[:, 0].max()
+
+    def junction_temperature(self, loss):
+        "Junction temperature [C] at a loss of the inverter [W]."
+        devices = 6 * self.inverter.parallel
+        return self.inverter.heatsink_temperature + \
+            loss / devices * self.devices.junction_resistance(self.inverter)
+
+    @prop
+    def average_junction_temperature(self):
+        return self.junction_temperature(self.average_loss)
+
+    @prop
+    def peak_junction_temperature(self):
+        return self.junction_temperature(self.peak_loss)
+
+    @prop
+    def fits(self):
+        """Devices rated for the highest voltage with the margin,
+        the highest current and the highest junction temperature."""
+        return (
+            (self.devices.voltage >= self.voltage.max() * (1 + self.inverter.voltage_margin)) &
+            (self.devices.current * self.inverter.parallel >= self.peak_current) &
+            (self.peak_junction_temperature <= self.inverter.max_junction_temperature)
+        )
+
+    def ranking(self, all=False):
+        "Dicts of results of the (fitting) devices by growing energy loss."
+        order = numpy.argsort(self.energy, kind='mergesort')
+        if not all:
+            order = order[self.fits[order]]
+        return [
+            {
+                'part': self.devices.parts[index],
+                'energy': float(self.energy[index]),
+                'average_loss': float(self.average_loss[index]),
+                'peak_loss': float(self.peak_loss[index]),
+                'average_junction_temperature': float(self.average_junction_temperature[index]),
+                'peak_junction_temperature': float(self.peak_junction_temperature[index]),
+                'fits': bool(self.fits[index]),
+            }
+            for index in order
+        ]
+
+
+def commute_samples(commute, pack):
+    """(AC power [W], DC voltage [V], periods [s]) of the points
+    of the tracks of a commute, with the pack charged at the start."""
+    car = commute.car
+    powers = []
+    battery_powers = []
+    periods = []
+    for track in commute.tracks:
+        columns = track.columns
+        powers.append(numpy.where(
+            columns.power_at_wheels > 0,
+            columns.motor_power / car.motor_efficiency,
+            columns.motor_power * car.motor_efficiency
+        ))
+        battery_powers.append(columns.battery_power)
+        periods.append(track.time_at_point)
+    period = numpy.concatenate(periods)
+    simulation = battery.Simulation(pack, numpy.concatenate(battery_powers), period)
+    return numpy.concatenate(powers), simulation.voltage, period
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Rank power devices by inverter losses over a commute.'
+    )
+    parser.add_argument('files', metavar='file.gpx', nargs='+')
+    parser.add_argument('--where', metavar='CONDITION', action='append', default=[],
+        help='condition on the candidate devices, see components.py')
+    parser.add_argument('--table', default=components.default_path,
+        help='flat ODS spreadsheet of the devices')
+    parser.add_argument('--all', action='store_true',
+        help='rank devices which do not fit as well')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--cells-series', type=int, default=battery.Pack.cells_series,
+        help='cells of the battery pack in series, setting the DC voltage')
+    parser.add_argument('--preprocess', metavar='STAGES',
+        type=preprocessing.Preprocessing.parse,
+        help='smoothing and resampling of the tracks, see preprocessing.py')
+    for parameter in Inverter.parameters:
+        parser.add_argument('--' + parameter.replace('_', '-'), type=float,
+            default=getattr(Inverter, parameter))
+    options = parser.parse_args()
+
+    inverter = Inverter()
+    for parameter in Inverter.parameters:
+        setattr(inverter, parameter, getattr(options, parameter))
+
+    table = components.load(options.table)
+    try:
+        devices = Devices(table, table.query(options.where))
+    except components.QueryError as error:
+        parser.error(str(error))
+
+    commute = track_gpx.Commute(track_gpx.Car(), options.files, preprocessing=options.preprocess)
+    pack = battery.Pack()
+    pack.cells_series = options.cells_series
+    estimate = Estimate(devices, inverter, *commute_samples(commute, pack))
+
+    print '%d devices, %d points, highest DC voltage %.0f V, peak phase current %.0f A' % (
+        len(devices), len(estimate.current), estimate.voltage.max(), estimate.peak_current
+    )
+    print '%-16s %10s %10s %10s %8s %8s %s' % (
+        'part', 'loss [Wh]', 'avg [W]', 'peak [W]', 'Tj [C]', 'max Tj', 'fits'
+    )
+    ranking = estimate.ranking(options.all)
+    if not ranking:
+        print 'no device fits, more of them in --parallel may, --all ranks them all'
+    for result in ranking[:options.limit]:
+        print '%-16s %10.2f %10.2f %10.2f %8.1f %8.1f %s' % (
+            result['part'],
+            result['energy'],
+            result['average_loss'],
+            result['peak_loss'],
+            result['average_junction_temperature'],
+            result['peak_junction_temperature'],
+            'yes' if result['fits'] else 'no'
+        )
@@ -0,0 +1,173 @@
+"""
+In-process queue of background jobs.
+
+Jobs wait in a bounded queue and are run by a fixed number of worker
+threads, so a burst of uploads can't take more than the given number
+of threads at once, and submitting to a full queue fails right away
+instead of piling up. Finished jobs are kept for polling until newer
+ones push them out.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import Queue
+import collections
+import logging
+import numpy
+import threading
+import time
+import uuid
+
+from utils import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    "The job queue has no room for another job."
+
+
+class Job(object):
+    "A function call run in the background."
+
+    def __init__(self, function, args):
+        self.id = uuid.uuid4().hex
+        self.function = function
+        self.args = args
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.state in ('finished', 'failed')
+
+    def run(self):
+        self.started = time.time()
+        self.state = 'running'
+        try:
+            self.result = self.function(*self.args)
+            self.state = 'finished'
+        except Exception as error:
+            log.exception('job %s failed', self.id)
+            self.error = '%s: %s' % (type(error).__name__, error)
+            self.state = 'failed'
+        finally:
+            self.finished = time.time()
+            # the arguments may be large, like uploaded files
+            self.args = None
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'state': self.state,
+            'error': self.error,
+            'submitted': self.submitted,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class JobQueue(object):
+    """A bounded queue of jobs run by worker threads.
+
+    workers - number of threads running jobs
+    depth - number of jobs which can wait to be run
+    keep - number of jobs remembered for polling
+    window - number of latest jobs the latency figures are taken from"""
+
+    def __init__(self, workers=2, depth=32, keep=256, window=1000):
+        self.workers = workers
+        self.queue = Queue.Queue(depth)
+        self.jobs = LRUCache(keep)
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        # (time waiting in the queue, time running) of the latest jobs
+        self.latencies = collections.deque(maxlen=window)
+        self.threads = []
+        for i in xrange(workers):
+            thread = threading.Thread(target=self.work, name='job-worker-%d' % i)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, function, *args):
+        "Queues function(*args), returns the Job."
+        job = Job(function, args)
+        try:
+            self.queue.put_nowait(job)
+        except Queue.Full:
+            with self.lock:
+                self.counters['rejected'] += 1
+            raise QueueFull('%d jobs are waiting already' % self.queue.maxsize)
+        self.jobs[job.id] = job
+        with self.lock:
+            self.counters['submitted'] += 1
+        return job
+
+    def get(self, id):
+        "Job of the given id, or None if it is unknown or forgotten."
+        return self.jobs.get(id)
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                self.counters['running'] += 1
+            job.run()
+            with self.lock:
+                self.counters['running'] -= 1
+                self.counters[job.state] += 1
+                self.latencies.append((
+                    job.started - job.submitted,
+                    job.finished - job.started
+                ))
+            self.queue.task_done()
+
+    def metrics(self):
+        "Queue depth, job counts and latencies [s]."
+        with self.lock:
+            metrics = {
+                'workers': self.workers,
+                'queue_depth': self.queue.qsize(),
+                'queue_size': self.queue.maxsize,
+            }
+            for counter in 'submitted', 'rejected', 'running', 'finished', 'failed':
+                metrics[counter] = self.counters[counter]
+            latencies = numpy.array(self.latencies, float).reshape(-1, 2)
+
+        for name, values in (
+            ('wait', latencies[:, 0]),
+            ('run', latencies[:, 1]),
+            ('total', latencies.sum(axis=1)),
+        ):
+            if len(values):
+                metrics[name + '_latency'] = {
+                    'mean': float(values.mean()),
+                    'p50': float(numpy.percentile(values, 50)),
+                    'p95': float(numpy.percentile(values, 95)),
+                    'max': float(values.max()),
+                }
+            else:
+                metrics[name + '_latency'] = None
+        return metrics
@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+
+"""
+Live tracks: stats of a track updated point by point, as GPS fixes
+arrive, without recomputing the whole track.
+
+Every point costs O(1) amortized time. Cumulative figures are running
+sums and peaks come from windows.Running, which only keeps the points
+of windows still open. Quantities are computed like the columns of
+Kinematics and Dynamics, so a complete live track gives the stats of
+the same track read from a GPX file.
+
+As a script it reads fixes as NDJSON from a file or stdin, an object
+per line with lat, lon, ele (or elevation), time (ISO 8601 or seconds
+since the epoch) and optionally segment: true at the first point of
+a new segment. It writes the state of the track after every point
+(or every --every points) as NDJSON, and the stats when the feed ends.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import math
+import sys
+import timestamps
+import track_gpx
+import track_physics
+import windows
+
+from utils import print_stats
+
+Earth = track_physics.Earth
+
+
+class Location(object):
+    "Where a point has been recorded."
+
+    __slots__ = ('lat', 'lon')
+
+    def __init__(self, lat, lon):
+        self.lat = lat
+        self.lon = lon
+
+
+class Sample(object):
+    """Kinematics of a single point, for computing its Dynamics."""
+
+    def __init__(self, speed, acceleration, incline_sine, incline_cosine, period):
+        self.speed = speed
+        self.acceleration = acceleration
+        self.incline_sine = incline_sine
+        self.incline_cosine = incline_cosine
+        self.period = period
+
+
+class LiveTrack(object):
+    "A track growing a point at a time."
+
+    def __init__(self, car, peak_windows=track_physics.Track.peak_windows):
+        self.car = car
+        self.running = dict(
+            (name, windows.Running(window))
+            for (name, window) in peak_windows.iteritems()
+        )
+
+        self.count = 0
+        self.previous = None # lat, lon, elevation, time
+        self.position = 0.0 # distance from the start [m]
+
+        # last valid values, standing in for invalid ones
+        self.speed = 0.0
+        self.incline_sine = 0.0
+        self.incline_cosine = 1.0
+        self.acceleration = 0.0
+
+        self.total_distance = 0.0 # [m]
+        self.total_energy = 0.0 # [J]
+        self.total_motor_power = 0.0 # [W]
+        self.segment_start = None # time of the first point of the segment
+        self.finished_duration = 0.0 # of the previous segments [s]
+        self.sample = None
+        self.dynamics = None
+
+    def append(self, lat, lon, elevation, time, segment=False):
+        "Adds the next point of the track."
+        start = segment or not self.count
+
+        if self.previous is None or start:
+            flat_distance = 0.0
+            climb = 0.0
+        else:
+            flat_distance = self.flat_distance(lat, lon)
+            climb = elevation - self.previous[2]
+        distance = math.sqrt(flat_distance**2 + climb**2)
+
+        if self.previous is None:
+            period = 1.0
+        else:
+            period = time - self.previous[3]
+
+        if distance != 0:
+            sine = climb / distance
+            cosine = flat_distance / distance
+        else:
+            sine = 1.0
+            cosine = 0.0
+        if -0.25 < sine < 0.25:
+            self.incline_sine = sine
+        if 0.75 < cosine <= 1:
+            self.incline_cosine = cosine
+
+        previous_speed = self.speed
+        if period:
+            speed = distance / period
+            if 0 <= speed < self.car.max_speed:
+                self.speed = speed
+
+        if self.count >= 2 and period:
+            acceleration = (self.speed - previous_speed) / period
+            # car accelerating/decelerating more than g/2 is unlikely
+            if Earth.g/2 < acceleration < Earth.g/2:
+                self.acceleration = acceleration
+
+        self.sample = Sample(
+            self.speed,
+            self.acceleration,
+            self.incline_sine,
+            self.incline_cosine,
+            period
+        )
+        self.dynamics = dynamics = track_physics.Dynamics(self.sample, self.car)
+
+        self.total_distance += distance
+        self.total_energy += float(dynamics.energy)
+        self.total_motor_power += float(dynamics.motor_power)
+
+        if start:
+            if self.segment_start is not None:
+                self.finished_duration += self.previous[3] - self.segment_start
+            self.segment_start = time
+
+        self.position += distance
+        positions = {'points': None, 'seconds': time, 'metres': self.position}
+        location = Location(lat, lon)
+        for running in self.running.itervalues():
+            running.add(
+                float(getattr(dynamics, running.window.attribute)),
+                positions[running.window.unit],
+                location
+            )
+
+        self.previous = lat, lon, elevation, time
+        self.count += 1
+
+    def flat_distance(self, lat, lon):
+        "Distance from the previous point as seen from the sky [m]."
+        # http://en.wikipedia.org/wiki/Haversine_formula
+        previous_lat, previous_lon = self.previous[:2]
+        dlat = math.radians(lat - previous_lat)
+        dlon = math.radians(lon - previous_lon)
+
+        a = math.sin(dlat/2) ** 2 + math.cos(math.radians(lat)) \
+            * math.cos(math.radians(previous_lat)) * \
+            math.sin(dlon/2) ** 2
+
+        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+        return Earth.radius * c
+
+    @property
+    def distance(self):
+        "Travelled distance [km]."
+        return self.total_distance / 1000
+
+    @property
+    def duration(self):
+        "Duration of the journey excluding breaks between segments [min]."
+        if self.previous is None:
+            return 0.0
+        return (self.finished_duration + self.previous[3] - self.segment_start) / 60.0
+
+    @property
+    def average_speed(self):
+        "Average speed [km/h]."
+        return self.distance/(self.duration/60)
+
+    @property
+    def energy(self):
+        "Energy needed so far [Wh]"
+        return self.total_energy/3600
+
+    @property
+    def energy_rate(self):
+        "Energy needed per km [Wh/km]."
+        return self.energy/self.distance
+
+    @property
+    def average_motor_power(self):
+        "Average power generated and regen'd by the motor [W]."
+        return self.total_motor_power / self.count
+
+    @property
+    def motor_power(self):
+        "Current motor power requirement [W]."
+        return float(self.dynamics.motor_power)
+
+    @property
+    def battery_power(self):
+        "Current power drawn from the battery, negative when charging [W]."
+        return float(self.dynamics.battery_power)
+
+    def peak(self, name, scale=1):
+        """Peak of a windowed metric so far times scale and URL of where
+        it has been reached, or None before the first window completes."""
+        peak = self.running[name].peak
+        if peak is None:
+            return None
+        value, first, last = peak
+        return value * scale, track_gpx.map_url(first, last)
+
+    @property
+    def top_speed(self):
+        "Max speed [km/h]."
+        return self.peak('top_speed', 3600/1000.0)
+
+    @property
+    def peak_output_power(self):
+        "Peak power needed [W]."
+        return self.peak('peak_output_power')
+
+    @property
+    def peak_regen_power(self):
+        "Peak power available for regen [W]."
+        return self.peak('peak_regen_power')
+
+    @property
+    def steepest_incline(self):
+        "Steepest incline [%]."
+        return self.peak('steepest_incline', 100)
+
+    @property
+    def steepest_decline(self):
+        "Steepest decline [%]."
+        return self.peak('steepest_decline', -100)
+
+    @property
+    def stats(self):
+        "Track stats so far."
+        return {
+            'distance': self.distance,
+            'duration': self.duration,
+            'average speed': self.average_speed,
+            'energy': self.energy,
+            'energy rate': self.energy_rate,
+            'top speed': self.top_speed,
+            'average motor power': self.average_motor_power,
+            'peak output power': self.peak_output_power,
+            'peak regen power': self.peak_regen_power,
+            'steepest incline': self.steepest_incline,
+            'steepest decline': self.steepest_decline,
+        }
+
+    def state(self):
+        "Current figures of the track as a JSON-friendly dict."
+        peak = lambda value: value and value[0]
+        return {
+            'points': self.count,
+            'time': self.previous[3],
+            'distance': self.distance,
+            'energy': self.energy,
+            'speed': self.speed * 3600/1000.0,
+            'motor_power': self.motor_power,
+            'battery_power': self.battery_power,
+            'average_motor_power': self.average_motor_power,
+            'top_speed': peak(self.top_speed),
+            'peak_output_power': peak(self.peak_output_power),
+            'peak_regen_power': peak(self.peak_regen_power),
+        }
+
+
+def read_fix(line):
+    "(lat, lon, elevation, time, segment) of an NDJSON line."
+    fix = json.loads(line)
+    time = fix['time']
+    if isinstance(time, basestring):
+        time = timestamps.parse_one(time)
+    return (
+        float(fix['lat']),
+        float(fix['lon']),
+        float(fix.get('ele', fix.get('elevation'))),
+        float(time),
+        bool(fix.get('segment'))
+    )
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Follow power and energy needs of a track as it is recorded.'
+    )
+    parser.add_argument('feed', nargs='?', type=argparse.FileType('r'),
+        default=sys.stdin, help='NDJSON file of GPS fixes, stdin by default')
+    parser.add_argument('--every', metavar='N', type=int, default=1,
+        help='write the state of the track every N points')
+    options = parser.parse_args()
+
+    track = LiveTrack(track_gpx.Car())
+    for line in iter(options.feed.readline, ''):
+        if not line.strip():
+            continue
+        lat, lon, elevation, time, segment = read_fix(line)
+        track.append(lat, lon, elevation, time, segment)
+        if track.count % options.every == 0:
+            sys.stdout.write(json.dumps(track.state()) + '\n')
+            sys.stdout.flush()
+
+    if track.count:
+        print_stats(track.stats)
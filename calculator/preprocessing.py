@@ -0,0 +1,241 @@
+"""
+Preprocessing of parsed tracks before the physics: smoothing of the
+elevation and the speed, and resampling of the points to a fixed
+distance or time step.
+
+Phones log elevation in whole metres, which makes momentary inclines
+and the power derived from them jump between extremes. Smoothing the
+elevation and the speed gives steadier and more realistic peaks, and
+resampling evens out the points, often leaving fewer of them.
+
+All the stages work segment by segment on whole arrays and take
+linear time. A Preprocessing is described by a specification like
+
+    resample=distance:10,elevation=savgol:15:2,speed=mean:5
+
+with these stages, applied in this order:
+
+    resample=distance:METRES    a point every METRES along the track
+    resample=time:SECONDS       a point every SECONDS
+    elevation=mean:WIDTH        moving average over WIDTH points
+    elevation=savgol:WIDTH:ORDER  Savitzky-Golay filter of WIDTH points
+                                  fitting polynomials of ORDER
+    speed=mean:WIDTH, speed=savgol:WIDTH:ORDER
+                                the same for the speed, applied to
+                                the speed after bad values are dropped
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy
+
+stages = ('resample', 'elevation', 'speed')
+
+# Number of arguments of every method.
+methods = {
+    'resample': {'distance': 1, 'time': 1},
+    'elevation': {'mean': 1, 'savgol': 2},
+    'speed': {'mean': 1, 'savgol': 2},
+}
+
+
+def segments(count, starts):
+    "(first, end) index pairs of the segments of a track."
+    ends = numpy.append(starts[1:], count)
+    return zip(starts.tolist(), ends.tolist())
+
+
+def moving_average(values, width):
+    """Centered moving average over width points, with
+    the first and last values repeated past the ends."""
+    if len(values) < 2 or width < 2:
+        return values.copy()
+    before = (width - 1) // 2
+    after = width - 1 - before
+    padded = numpy.concatenate((
+        numpy.repeat(values[:1], before),
+        values,
+        numpy.repeat(values[-1:], after)
+    ))
+    sums = numpy.zeros(len(padded) + 1)
+    numpy.cumsum(padded, out=sums[1:])
+    return (sums[width:] - sums[:-width]) / width
+
+
+def savgol_coefficients(width, order):
+    """Weights of a Savitzky-Golay filter: the value at the center
+    of a least squares polynomial fit over width points."""
+    half = width // 2
+    positions = numpy.arange(-half, half + 1, dtype=float)
+    vandermonde = numpy.vander(positions, order + 1, increasing=True)
+    return numpy.linalg.pinv(vandermonde)[0]
+
+
+def savgol(values, width, order):
+    """Savitzky-Golay smoothing over width (odd) points, with
+    the first and last values repeated past the ends."""
+    if width % 2 == 0:
+        raise ValueError('Savitzky-Golay width has to be odd: %d' % width)
+    if order >= width:
+        raise ValueError('Savitzky-Golay order has to be below the width')
+    if len(values) < 2:
+        return values.copy()
+    half = width // 2
+    padded = numpy.concatenate((
+        numpy.repeat(values[:1], half),
+        values,
+        numpy.repeat(values[-1:], half)
+    ))
+    return numpy.convolve(padded, savgol_coefficients(width, order)[::-1], 'valid')
+
+
+def smooth(values, starts, method, arguments):
+    "Values filtered by a method, segment by segment."
+    function = {'mean': moving_average, 'savgol': savgol}[method]
+    result = numpy.empty(len(values))
+    for first, end in segments(len(values), starts):
+        result[first:end] = function(values[first:end], *arguments)
+    return result
+
+
+def resample(columns, positions, step):
+    """Columns interpolated at every step of positions, which grow
+    within each segment. The last point of a segment is kept."""
+    resampled = dict((name, []) for name in ('lat', 'lon', 'elevation', 'time'))
+    starts = []
+    count = 0
+    for first, end in segments(len(positions), columns['starts']):
+        source = positions[first:end]
+        targets = numpy.arange(source[0], source[-1], step)
+        if not len(targets) or targets[-1] != source[-1]:
+            targets = numpy.append(targets, source[-1])
+        for name, values in resampled.iteritems():
+            values.append(numpy.interp(targets, source, columns[name][first:end]))
+        starts.append(count)
+        count += len(targets)
+
+    result = dict(
+        (name, numpy.concatenate(values))
+        for (name, values) in resampled.iteritems()
+    )
+    result['starts'] = numpy.array(starts, int)
+    return result
+
+
+class Preprocessing(object):
+    "Stages applied to the columns of a track before the physics."
+
+    def __init__(self, **stages):
+        """Stages given as name=(method, argument...),
+        for example elevation=('savgol', 15, 2)."""
+        for name, stage in stages.iteritems():
+            if name not in methods:
+                raise ValueError('unknown preprocessing stage: %s' % name)
+            method, arguments = stage[0], tuple(stage[1:])
+            if method not in methods[name]:
+                raise ValueError('unknown %s method: %s' % (name, method))
+            if len(arguments) != methods[name][method]:
+                raise ValueError('%s=%s takes %d arguments' % (
+                    name, method, methods[name][method]
+                ))
+            if name == 'resample':
+                arguments = tuple(float(argument) for argument in arguments)
+                if arguments[0] <= 0:
+                    raise ValueError('resampling step has to be positive')
+            else:
+                arguments = tuple(int(argument) for argument in arguments)
+                if arguments[0] < 1:
+                    raise ValueError('filter width has to be positive')
+            if method == 'savgol':
+                width, order = arguments
+                if width % 2 == 0 or not 0 <= order < width:
+                    raise ValueError(
+                        'Savitzky-Golay takes an odd width and an order below it'
+                    )
+            stages[name] = (method,) + arguments
+        self.stages = stages
+
+    @classmethod
+    def parse(cls, specification):
+        "Preprocessing of a specification like elevation=mean:9,speed=mean:5."
+        stages = {}
+        for item in specification.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            name, _, stage = item.partition('=')
+            stages[name.strip()] = stage.strip().split(':')
+        return cls(**stages)
+
+    def stage(self, name):
+        "Specification of a stage like savgol:15:2, empty if there is none."
+        return ':'.join(str(part) for part in self.stages.get(name, ()))
+
+    def __str__(self):
+        return ','.join(
+            '%s=%s' % (name, self.stage(name))
+            for name in stages if name in self.stages
+        )
+
+    def __repr__(self):
+        return '%s.parse(%r)' % (type(self).__name__, str(self))
+
+    @property
+    def key(self):
+        "Hashable identity of the preprocessing, for caches."
+        return str(self)
+
+    def __nonzero__(self):
+        return bool(self.stages)
+
+    def columns(self, kinematics):
+        "Preprocessed columns of kinematics."
+        columns = {
+            'lat': kinematics.lat,
+            'lon': kinematics.lon,
+            'elevation': kinematics.elevation,
+            'time': kinematics.time,
+            'starts': kinematics.starts,
+        }
+
+        if 'resample' in self.stages:
+            method, step = self.stages['resample']
+            if method == 'distance':
+                positions = numpy.cumsum(kinematics.flat_distance)
+            else:
+                positions = kinematics.time
+            columns = resample(columns, positions, step)
+
+        if 'elevation' in self.stages:
+            method = self.stages['elevation'][0]
+            columns['elevation'] = smooth(
+                columns['elevation'],
+                columns['starts'],
+                method,
+                self.stages['elevation'][1:]
+            )
+
+        return columns
+
+    def speed(self, speed, starts):
+        "Speed filtered by the speed stage, if there is one."
+        if 'speed' not in self.stages:
+            return speed
+        return smooth(speed, starts, self.stages['speed'][0], self.stages['speed'][1:])
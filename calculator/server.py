@@ -1,5 +1,15 @@
+import StringIO
+import batch
+import collections
+import components
 import flask
+import hashlib
+import jobs
+import json
 import logging
+import os
+import preprocessing
+import track_cache
 import track_gpx
 import utils
 
@@ -26,6 +36,26 @@ License:
 
 app = flask.Flask(__name__)
 
+track_gpx.Track.track_cache = track_cache.TrackCache()
+
+# With background jobs the form is answered with a results page
+# of a job, the /api/jobs endpoints work either way.
+app.config['BACKGROUND_JOBS'] = bool(os.environ.get('GPX2ENERGY_BACKGROUND_JOBS'))
+job_queue = jobs.JobQueue(
+    workers=int(os.environ.get('GPX2ENERGY_JOB_WORKERS', 2)),
+    depth=int(os.environ.get('GPX2ENERGY_JOB_QUEUE', 32))
+)
+
+# Stats of recently computed commutes, keyed by result_key.
+result_cache = utils.LRUCache(
+    int(os.environ.get('GPX2ENERGY_RESULT_CACHE', 256)),
+    ttl=float(os.environ.get('GPX2ENERGY_RESULT_TTL', 3600))
+)
+
+# Profiling of cached properties, see /profile.
+if os.environ.get('GPX2ENERGY_PROFILE'):
+    utils.start_profiling()
+
 
 def stats2table(stats):
     for stat, unit in utils.stats_units:
@@ -41,51 +71,320 @@ def stats2table(stats):
 
         yield stat, url, value, unit
 
-@app.route('/', methods=['GET', 'POST'])
-def index():
+def read_car(form):
+    "Car described by the form values, in the units of the form."
+    car = track_gpx.Car()
+
+    form = dict(form)
+    form.pop('submit', None)
+    for stage in preprocessing.stages:
+        form.pop(stage, None)
+
+    form = dict((k, float(v[0])) for (k,v) in form.iteritems())
+
+    form['power'] *= 1000
+    form['max_speed'] *= 1000/3600.0
+    for efficiency in [
+        'battery_pack_efficiency',
+        'controller_efficiency',
+        'motor_efficiency',
+        'gearbox_efficiency',
+        'regen_efficiency'
+    ]:
+        form[efficiency] /= 100.0
+
+    vars(car).update(form)
+    return car
+
+def read_preprocessing(form):
+    "Preprocessing chosen in the form, None if there is none."
+    stages = dict(
+        (stage, form[stage].split(':'))
+        for stage in preprocessing.stages
+        if form.get(stage)
+    )
+    try:
+        return preprocessing.Preprocessing(**stages) or None
+    except ValueError:
+        flask.abort(400)
+
+def uploaded_files():
+    "Uploaded GPX files."
     files = flask.request.files.values()
-    files = [file for file in files if file.filename]
+    return [file for file in files if file.filename]
 
-    car = track_gpx.Car()
+TrackResult = collections.namedtuple('TrackResult', ('filename', 'stats'))
 
-    if flask.request.method == 'POST' and files:
-        form = dict(flask.request.form)
-        form.pop('submit')
+class Result(object):
+    "Stats of a commute and of its tracks, in place of the Commute."
+
+    def __init__(self, car, preprocessing, filenames, stats):
+        self.car = car
+        self.preprocessing = preprocessing
+        track_stats, self.stats = stats
+        self.tracks = [
+            TrackResult(filename, stats)
+            for (filename, stats) in zip(filenames, track_stats)
+        ]
+
+def read_uploads(files):
+    "Contents of uploaded files, which are gone once the request ends."
+    contents = []
+    for file in files:
+        content = StringIO.StringIO(file.read())
+        content.name = file.filename
+        contents.append(content)
+    return contents
 
-        form = dict((k, float(v[0])) for (k,v) in form.iteritems())
+def result_key(car, preprocessing, contents):
+    "Digest of the file contents, the car parameters and the preprocessing."
+    sha1 = hashlib.sha1()
+    for content in contents:
+        sha1.update(hashlib.sha1(content.getvalue()).digest())
+    sha1.update(repr([float(getattr(car, name)) for name in car.parameters]))
+    sha1.update(preprocessing.key if preprocessing else '')
+    return sha1.hexdigest()
 
-        form['power'] *= 1000
-        form['max_speed'] *= 1000/3600.0
-        for efficiency in [
-            'battery_pack_efficiency',
-            'controller_efficiency',
-            'motor_efficiency',
-            'gearbox_efficiency',
-            'regen_efficiency'
-        ]:
-            form[efficiency] /= 100.0
+def compute(car, preprocessing, contents):
+    "Result of the commute of the uploaded files, cached by content."
+    key = result_key(car, preprocessing, contents)
+    stats = result_cache.get(key)
+    if stats is None:
+        commute = track_gpx.Commute(car, contents, preprocessing=preprocessing)
+        stats = [track.stats for track in commute.tracks], commute.stats
+        result_cache[key] = stats
+    return Result(car, preprocessing, [content.name for content in contents], stats)
 
-        vars(car).update(form)
+def submit(car, preprocessing, files):
+    "Queues computation of the commute of the uploaded files."
+    return job_queue.submit(compute, car, preprocessing, read_uploads(files))
 
-        for file in files:
-            file.name = file.filename
+@app.route('/', methods=['GET', 'POST'])
+def index():
+    files = uploaded_files()
+
+    car = track_gpx.Car()
+    preprocessing = None
+
+    if flask.request.method == 'POST' and files:
+        car = read_car(flask.request.form)
+        preprocessing = read_preprocessing(flask.request.form)
 
+        if app.config['BACKGROUND_JOBS']:
+            try:
+                job = submit(car, preprocessing, files)
+            except jobs.QueueFull:
+                flask.abort(503)
+            return flask.redirect(flask.url_for('job', id=job.id))
 
-        commute = track_gpx.Commute(car, files)
+        commute = compute(car, preprocessing, read_uploads(files))
     else:
         commute = None
 
     return flask.render_template('gpx2energy.html',
         commute=commute,
         car=car,
+        preprocessing=preprocessing,
         stats2table=stats2table,
         getattr=getattr
     )
 
+@app.route('/jobs/<id>')
+def job(id):
+    "Results page of a background job, refreshing until it is done."
+    job = job_queue.get(id)
+    if job is None:
+        flask.abort(404)
+
+    return flask.render_template('gpx2energy.html',
+        commute=job.result,
+        car=job.result.car if job.result else track_gpx.Car(),
+        preprocessing=job.result and job.result.preprocessing,
+        job=job,
+        stats2table=stats2table,
+        getattr=getattr
+    )
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit():
+    """Queues computation of the uploaded tracks with car parameters
+    of the form, answers with the job id."""
+    files = uploaded_files()
+    if not files:
+        flask.abort(400)
+    try:
+        job = submit(
+            read_car(flask.request.form),
+            read_preprocessing(flask.request.form),
+            files
+        )
+    except jobs.QueueFull:
+        flask.abort(503)
+    response = flask.jsonify(
+        id=job.id,
+        url=flask.url_for('api_job', id=job.id)
+    )
+    response.status_code = 202
+    return response
+
+@app.route('/api/jobs/<id>')
+def api_job(id):
+    "State of a background job, with the stats once it is finished."
+    job = job_queue.get(id)
+    if job is None:
+        flask.abort(404)
+
+    result = job.as_dict()
+    if job.result:
+        result['tracks'] = [
+            dict(filename=track.filename, stats=utils.stats_json(track.stats))
+            for track in job.result.tracks
+        ]
+        result['stats'] = utils.stats_json(job.result.stats)
+    return flask.jsonify(result)
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """Stats of many tracks for one or more cars, see batch.py.
+
+    Takes either a JSON batch request, or uploaded GPX files with
+    optional "cars" form field holding a JSON list of cars, "digest"
+    fields of cached tracks and a "preprocessing" field. With
+    ?stream=1 (or true), or when NDJSON is accepted, results are
+    streamed a line each as the tracks are computed."""
+    try:
+        if flask.request.files or flask.request.form:
+            form = flask.request.form
+            cars = [
+                batch.read_car(car)
+                for car in json.loads(form.get('cars', '[{}]'))
+            ]
+            files = [
+                batch.gpx_file(file.filename, file.read())
+                for file in uploaded_files()
+            ]
+            files.extend(batch.cached_file(digest) for digest in form.getlist('digest'))
+            preprocessing = batch.read_preprocessing(form.get('preprocessing'))
+            if not files:
+                raise batch.BatchError('no tracks')
+        else:
+            request = json.loads(batch.gunzip(flask.request.get_data()))
+            cars, files, preprocessing = batch.read_request(request)
+    except ValueError as error:
+        # BatchError or invalid JSON
+        response = flask.jsonify(error=str(error))
+        response.status_code = 400
+        return response
+
+    results = batch.evaluate(cars, files, preprocessing)
+    parameters = [
+        dict((name, getattr(car, name)) for name in car.parameters)
+        for car in cars
+    ]
+
+    stream = flask.request.args.get('stream', '').lower() in ('1', 'true') or \
+        flask.request.accept_mimetypes.best == 'application/x-ndjson'
+    if stream:
+        def lines():
+            yield json.dumps({'cars': parameters}) + '\n'
+            for result in results:
+                yield json.dumps(result) + '\n'
+        return flask.Response(lines(), mimetype='application/x-ndjson')
+
+    return flask.jsonify(cars=parameters, results=list(results))
+
+@app.route('/api/operating_points', methods=['POST'])
+def api_operating_points():
+    """Time spent at motor speeds and torques of uploaded tracks and
+    their commute, with an optional "car" form field holding a JSON
+    car as in batch.py (gear_ratio and wheel_radius included) and
+    a "preprocessing" field. JSON, or CSV with ?format=csv."""
+    try:
+        car = batch.read_car(json.loads(flask.request.form.get('car', '{}')))
+        preprocessing = batch.read_preprocessing(flask.request.form.get('preprocessing'))
+        files = [
+            batch.gpx_file(file.filename, file.read())
+            for file in uploaded_files()
+        ]
+        if not files:
+            raise batch.BatchError('no tracks')
+    except ValueError as error:
+        response = flask.jsonify(error=str(error))
+        response.status_code = 400
+        return response
+
+    commute = track_gpx.Commute(car, files, preprocessing=preprocessing)
+    if flask.request.args.get('format') == 'csv':
+        output = StringIO.StringIO()
+        utils.write_operating_points(
+            [(track.filename, track.operating_points) for track in commute.tracks] +
+            [('commute', commute.operating_points)],
+            output
+        )
+        return flask.Response(output.getvalue(), mimetype='text/csv')
+
+    return flask.jsonify(
+        tracks=[
+            dict(
+                utils.operating_points_json(track.operating_points),
+                filename=track.filename
+            )
+            for track in commute.tracks
+        ],
+        commute=utils.operating_points_json(commute.operating_points)
+    )
+
+@app.route('/api/components')
+def api_components():
+    """Power semiconductors of the component table meeting all the
+    "where" conditions, see components.py. Optional "sort" column,
+    "descending", "limit" and comma separated "columns"."""
+    args = flask.request.args
+    columns = args.get('columns')
+    columns = columns.split(',') if columns else None
+    try:
+        table = components.load()
+        rows = table.query(
+            args.getlist('where'),
+            args.get('sort'),
+            bool(args.get('descending')),
+            int(args['limit']) if args.get('limit') else None
+        )
+        columns = [table.resolve(name) for name in columns] if columns else table.names
+    except ValueError as error:
+        # QueryError or invalid limit
+        response = flask.jsonify(error=str(error))
+        response.status_code = 400
+        return response
+    return flask.jsonify(
+        columns=columns,
+        aliases=table.aliases,
+        count=len(rows),
+        rows=table.rows(rows, columns)
+    )
+
+@app.route('/metrics')
+def metrics():
+    "Job queue depth, counts and latencies, result cache counters."
+    metrics = job_queue.metrics()
+    metrics['result_cache'] = result_cache.counters()
+    return flask.jsonify(metrics)
+
 @app.route('/manual')
 def manual():
     return flask.render_template('manual.html')
 
+@app.route('/profile')
+def profile():
+    """Accesses and computation times of cached properties as JSON,
+    ?reset=1 starts over."""
+    if utils.profile is None:
+        return flask.jsonify(enabled=False, properties={})
+    properties = utils.profile.as_dict()
+    if flask.request.args.get('reset'):
+        utils.start_profiling()
+    return flask.jsonify(enabled=True, properties=properties)
+
 log_handler = logging.StreamHandler()
 log_handler.setLevel(logging.WARNING)
 app.logger.addHandler(log_handler)
@@ -0,0 +1,176 @@
+"""
+Mergeable summaries of distributions of values.
+
+A sketch takes values in batches (whole arrays at a time) and keeps
+a fixed amount of state, however many values it has seen, so sketches
+of tracks can be merged into sketches of commutes or fleets without
+keeping the values themselves.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy
+
+
+class Histogram(object):
+    """Total weight of values falling into fixed bins.
+
+    Bin i covers [edges[i - 1], edges[i]), with two more bins
+    for values below the first edge and from the last edge on."""
+
+    def __init__(self, edges):
+        self.edges = numpy.asarray(edges, float)
+        self.counts = numpy.zeros(len(self.edges) + 1)
+
+    @classmethod
+    def linear(cls, start, stop, step):
+        "Histogram with bins of step between start and stop."
+        return cls(numpy.arange(start, stop + step / 2.0, step))
+
+    def add(self, values, weights=None):
+        "Adds an array of values, each with a weight of 1 or of weights."
+        values = numpy.asarray(values, float)
+        index = numpy.searchsorted(self.edges, values.ravel(), 'right')
+        if weights is not None:
+            weights = numpy.broadcast_to(weights, values.shape).ravel()
+        self.counts += numpy.bincount(index, weights, len(self.counts))
+
+    def merge(self, other):
+        "Adds the counts of a histogram with the same bins."
+        if not numpy.array_equal(self.edges, other.edges):
+            raise ValueError('histograms have different bins')
+        self.counts += other.counts
+        return self
+
+    def copy(self):
+        histogram = type(self)(self.edges)
+        histogram.counts = self.counts.copy()
+        return histogram
+
+    @property
+    def total(self):
+        return self.counts.sum()
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1), interpolated linearly
+        within its bin; values out of the edges count as at the edges."""
+        total = self.total
+        if not total:
+            return None
+        cumulative = numpy.cumsum(self.counts)
+        target = q * total
+        index = int(numpy.searchsorted(cumulative, target, 'left'))
+        index = min(index, len(self.counts) - 1)
+        if index == 0:
+            return float(self.edges[0])
+        if index == len(self.counts) - 1:
+            return float(self.edges[-1])
+        below = cumulative[index - 1]
+        fraction = (target - below) / self.counts[index] if self.counts[index] else 0
+        low, high = self.edges[index - 1], self.edges[index]
+        return float(low + fraction * (high - low))
+
+    def as_dict(self):
+        "Edges and counts, the first and last counts being out of the edges."
+        return {
+            'edges': self.edges.tolist(),
+            'counts': self.counts.tolist(),
+        }
+
+
+class Histogram2D(object):
+    """Total weight of pairs of values falling into fixed cells,
+    with bins along each axis like those of Histogram."""
+
+    def __init__(self, x_edges, y_edges):
+        self.x_edges = numpy.asarray(x_edges, float)
+        self.y_edges = numpy.asarray(y_edges, float)
+        self.counts = numpy.zeros((len(self.x_edges) + 1, len(self.y_edges) + 1))
+
+    def add(self, x, y, weights=None):
+        "Adds arrays of pairs of values, each with a weight of 1 or of weights."
+        x = numpy.asarray(x, float).ravel()
+        y = numpy.asarray(y, float).ravel()
+        index = numpy.searchsorted(self.x_edges, x, 'right') * self.counts.shape[1]
+        index += numpy.searchsorted(self.y_edges, y, 'right')
+        if weights is not None:
+            weights = numpy.broadcast_to(weights, x.shape).ravel()
+        self.counts += numpy.bincount(index, weights, self.counts.size).reshape(
+            self.counts.shape
+        )
+
+    def merge(self, other):
+        "Adds the counts of a histogram with the same bins."
+        if not (numpy.array_equal(self.x_edges, other.x_edges) and
+                numpy.array_equal(self.y_edges, other.y_edges)):
+            raise ValueError('histograms have different bins')
+        self.counts += other.counts
+        return self
+
+    def copy(self):
+        histogram = type(self)(self.x_edges, self.y_edges)
+        histogram.counts = self.counts.copy()
+        return histogram
+
+    @property
+    def total(self):
+        return self.counts.sum()
+
+    def bounds(self, edges):
+        "(low, high) bounds of the bins along an axis, None past the edges."
+        edges = [None] + edges.tolist() + [None]
+        return zip(edges[:-1], edges[1:])
+
+    def cells(self):
+        "(x low, x high, y low, y high, count) of the cells with counts."
+        x_bounds = self.bounds(self.x_edges)
+        y_bounds = self.bounds(self.y_edges)
+        for i, j in zip(*numpy.nonzero(self.counts)):
+            yield x_bounds[i] + y_bounds[j] + (float(self.counts[i, j]),)
+
+    def envelope(self):
+        """(x low, x high, y high) of the x bins with counts, y high
+        bounding the highest of their y bins with counts."""
+        x_bounds = self.bounds(self.x_edges)
+        y_bounds = self.bounds(self.y_edges)
+        rows = numpy.nonzero(self.counts.any(1))[0]
+        highest = self.counts.shape[1] - 1 - numpy.argmax(
+            self.counts[rows, ::-1] != 0, 1
+        )
+        return [x_bounds[i] + y_bounds[j][1:] for i, j in zip(rows, highest)]
+
+    def as_dict(self):
+        "Edges and rows of counts by x, with cells out of the edges first and last."
+        return {
+            'x_edges': self.x_edges.tolist(),
+            'y_edges': self.y_edges.tolist(),
+            'counts': self.counts.tolist(),
+        }
+
+
+def merged(sketches):
+    "A sketch merging all the sketches of an iterable, None if it is empty."
+    result = None
+    for sketch in sketches:
+        if result is None:
+            result = sketch.copy()
+        else:
+            result.merge(sketch)
+    return result
@@ -0,0 +1,1355 @@
+#!/usr/bin/env python
+
+"""
+Recalculation of spreadsheets/grand_ev_calculator.fods (a flat ODS
+spreadsheet) without an office suite.
+
+The cells of all the sheets are parsed with their OpenFormula formulas
+and the named ranges, every formula is compiled into nested Python
+closures and the formula cells are put in an evaluation order of their
+dependencies. Ranges are nodes of their own, so formulas looking up
+the same table share it. Cells are addressed like LibreOffice does it,
+'Battery pack'.B9 or $'Battery pack'.$B$9, or by named ranges
+(cells_series).
+
+Setting an input cell only marks the formula cells reading it dirty,
+recalculation then computes them in the evaluation order and goes on
+to the cells reading them only if their values changed. Batch
+evaluation of many input scenarios computes only the cells depending
+on inputs which differ from the previous scenario, optionally in
+worker processes. With the values saved in the file every formula
+cell computes the value LibreOffice saved (see --verify).
+
+Values follow LibreOffice: booleans are numbers in comparisons and
+arithmetic, texts compare case insensitively and come after numbers,
+empty results are 0 and errors (#N/A, #DIV/0!, ...) are CellError
+values propagating through the formulas reading them. Functions are
+the ones the spreadsheet uses: AND, AVERAGE, CONCATENATE, DMAX, FALSE,
+IF, MAX, PI, ROUND, ROUNDUP, SQRT, SUM, TRANSPOSE, TRUE and VLOOKUP,
+other ones give #NAME?. Matrix formulas spread their results over the
+cells they span. Criteria of DMAX are plain comparisons, without
+wildcards or regular expressions.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import components
+import csv
+import heapq
+import itertools
+import math
+import multiprocessing
+import os
+import re
+import sys
+import xml.etree.cElementTree
+
+default_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    os.pardir,
+    'spreadsheets',
+    'grand_ev_calculator.fods'
+)
+
+namespaces = components.namespaces
+table_tag = components.table_tag
+row_tag = components.row_tag
+cell_tags = components.cell_tags
+paragraph_tag = components.paragraph_tag
+named_range_tag = '{%(table)s}named-range' % namespaces
+name_attribute = components.name_attribute
+address_attribute = '{%(table)s}cell-range-address' % namespaces
+formula_attribute = '{%(table)s}formula' % namespaces
+columns_repeated_attribute = components.repeated_attribute
+rows_repeated_attribute = '{%(table)s}number-rows-repeated' % namespaces
+matrix_columns_attribute = '{%(table)s}number-matrix-columns-spanned' % namespaces
+matrix_rows_attribute = '{%(table)s}number-matrix-rows-spanned' % namespaces
+type_attribute = components.type_attribute
+value_attribute = components.value_attribute
+boolean_attribute = '{%(office)s}boolean-value' % namespaces
+string_attribute = '{%(office)s}string-value' % namespaces
+
+# Cells repeated further than this are empty padding up to the end
+# of a sheet, their values are not kept.
+max_repeated = 1024
+
+
+# Error of invalid function arguments, LibreOffice has no name for it.
+invalid_argument = 'Err:502'
+
+error_pattern = re.compile(r'^(Err:[0-9]+|#N/A|#VALUE!|#REF!|#NAME\?|#NUM!|#DIV/0!|#NULL!)$')
+
+
+class FormulaError(ValueError):
+    "A formula which cannot be parsed, or circular references."
+
+
+class CellError(Exception):
+    "An error value of a cell, like #N/A."
+
+    def __init__(self, code):
+        Exception.__init__(self, code)
+        self.code = code
+
+    def __eq__(self, other):
+        return isinstance(other, CellError) and other.code == self.code
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.code)
+
+    def __repr__(self):
+        return 'CellError(%r)' % self.code
+
+
+def column_index(letters):
+    "Column number (from 0) of column letters."
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def column_letters(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+part_pattern = r"""
+    (?:\$?(?:'(?P<quoted%(n)d>(?:[^']|'')*)'|(?P<sheet%(n)d>[^'.:$\[\]]*))\.)?
+    \$?(?P<column%(n)d>[A-Za-z]{1,3})\$?(?P<row%(n)d>[0-9]+)
+"""
+address_pattern = re.compile(
+    r'\s*%s(?::%s)?\s*$' % (part_pattern % {'n': 1}, part_pattern % {'n': 2}),
+    re.X | re.U
+)
+
+
+def parse_address(address, sheet=None):
+    """(sheet, first row, first column, last row, last column) of
+    a cell or range address, rows and columns counted from 0. Parts
+    without a sheet name are on the sheet of the first part, or the
+    given one."""
+    match = address_pattern.match(address)
+    if not match:
+        raise FormulaError('invalid address: %s' % address)
+    groups = match.groupdict()
+    for n in (1, 2):
+        if groups['quoted%d' % n] is not None:
+            sheet = groups['quoted%d' % n].replace("''", "'")
+        elif groups['sheet%d' % n]:
+            sheet = groups['sheet%d' % n]
+        if n == 1:
+            first_sheet = sheet
+    if sheet is None:
+        raise FormulaError('address without a sheet: %s' % address)
+    if sheet != first_sheet:
+        raise FormulaError('range over sheets: %s' % address)
+    first = int(groups['row1']) - 1, column_index(groups['column1'])
+    last = first
+    if groups['row2']:
+        last = int(groups['row2']) - 1, column_index(groups['column2'])
+    return (
+        sheet,
+        min(first[0], last[0]),
+        min(first[1], last[1]),
+        max(first[0], last[0]),
+        max(first[1], last[1])
+    )
+
+
+def cell_name(key):
+    "Address of a (sheet, row, column) cell key."
+    sheet, row, column = key
+    if not re.match(r'^\w+$', sheet, re.U):
+        sheet = "'%s'" % sheet.replace("'", "''")
+    return u'%s.%s%d' % (sheet, column_letters(column), row + 1)
+
+
+def cell_value(cell):
+    "Value of a cell saved by the office suite, None for an empty one."
+    value_type = cell.get(type_attribute)
+    if value_type in components.number_types:
+        return float(cell.get(value_attribute))
+    if value_type == 'boolean':
+        return cell.get(boolean_attribute) == 'true'
+    if value_type is None:
+        return None
+    string = cell.get(string_attribute)
+    if string is not None:
+        return string
+    return u'\n'.join(
+        u''.join(paragraph.itertext())
+        for paragraph in cell.findall(paragraph_tag)
+    )
+
+
+def saved_error(cell, value):
+    """CellError of a formula cell showing an error, saved as
+    a zero or the text of the error, else the value."""
+    shown = u''.join(
+        u''.join(paragraph.itertext())
+        for paragraph in cell.findall(paragraph_tag)
+    )
+    if value in (0.0, shown) and error_pattern.match(shown):
+        return CellError(shown)
+    return value
+
+
+def read_cells(file):
+    """(values, formulas, matrices, names) of a flat ODS file: cell
+    values, formulas and (rows, columns) spans of matrix formulas by
+    (sheet, row, column), addresses of named ranges by lower case
+    name. Only cells with a value or a formula are kept."""
+    values = {}
+    formulas = {}
+    matrices = {}
+    names = {}
+    sheet = None
+    row = 0
+    for event, element in xml.etree.cElementTree.iterparse(file, ('start', 'end')):
+        if event == 'start':
+            if element.tag == table_tag:
+                sheet = element.get(name_attribute)
+                row = 0
+            continue
+        if element.tag == named_range_tag:
+            names[element.get(name_attribute).lower()] = element.get(address_attribute)
+        if element.tag != row_tag:
+            continue
+        rows = int(element.get(rows_repeated_attribute, 1))
+        cells = [cell for cell in element if cell.tag in cell_tags]
+        if any(cell.get(type_attribute) or cell.get(formula_attribute) for cell in cells):
+            first_row = row
+            for row in xrange(first_row, first_row + min(rows, max_repeated)):
+                column = 0
+                for cell in cells:
+                    value = cell_value(cell)
+                    formula = cell.get(formula_attribute)
+                    if formula:
+                        value = saved_error(cell, value)
+                    columns = int(cell.get(columns_repeated_attribute, 1))
+                    if value is not None or formula:
+                        for repeat in xrange(min(columns, max_repeated)):
+                            key = sheet, row, column + repeat
+                            if value is not None:
+                                values[key] = value
+                            if formula:
+                                formulas[key] = formula
+                            if cell.get(matrix_rows_attribute):
+                                matrices[key] = (
+                                    int(cell.get(matrix_rows_attribute)),
+                                    int(cell.get(matrix_columns_attribute))
+                                )
+                    column += columns
+            row = first_row + rows
+        else:
+            row += rows
+        element.clear()
+    return values, formulas, matrices, names
+
+
+# Conversions and comparisons of values.
+
+class Rows(tuple):
+    """Values of the cells of a range, a tuple of rows, indexing
+    the texts of its first column when they are first looked up."""
+
+    text_rows = None
+
+    def text_row(self, value):
+        "The first row starting with a text, in any case, or None."
+        if self.text_rows is None:
+            self.text_rows = {}
+            for row in reversed(self):
+                if is_text(row[0]):
+                    self.text_rows[row[0].lower()] = row
+        return self.text_rows.get(value.lower())
+
+
+def single(matrix):
+    "The value of a 1x1 matrix."
+    if len(matrix) != 1 or len(matrix[0]) != 1:
+        raise CellError('#VALUE!')
+    value = matrix[0][0]
+    if value.__class__ is CellError:
+        raise value
+    return value
+
+
+def number(value):
+    if value.__class__ is float:
+        return value
+    if value is None:
+        return 0.0
+    if isinstance(value, (bool, int, long)):
+        return float(value)
+    if isinstance(value, tuple):
+        return number(single(value))
+    try:
+        return float(value)
+    except ValueError:
+        raise CellError('#VALUE!')
+
+
+def approximate(value):
+    "A number rounded to 15 significant digits, as displayed."
+    return float('%.15g' % value)
+
+
+def text(value):
+    if isinstance(value, tuple):
+        value = single(value)
+    if value is None:
+        return u''
+    if isinstance(value, bool):
+        return u'TRUE' if value else u'FALSE'
+    if isinstance(value, float):
+        if abs(value) < 1e15 and value == int(value):
+            return unicode(int(value))
+        return unicode('%.15g' % value).replace('e', 'E')
+    return unicode(value)
+
+
+def is_text(value):
+    return isinstance(value, basestring)
+
+
+def approximately_equal(a, b):
+    return a == b or abs(a - b) <= abs(a) * 2**-48
+
+
+def compare(a, b):
+    """-1, 0 or 1 as a is less than, equal to or greater than b:
+    texts case insensitively and after numbers, empty values as
+    empty texts or zeros."""
+    if isinstance(a, tuple):
+        a = single(a)
+    if isinstance(b, tuple):
+        b = single(b)
+    if a is None:
+        a = u'' if is_text(b) else 0.0
+    if b is None:
+        b = u'' if is_text(a) else 0.0
+    if is_text(a):
+        if not is_text(b):
+            return 1
+        return cmp(a.lower(), b.lower())
+    if is_text(b):
+        return -1
+    a = float(a)
+    b = float(b)
+    if approximately_equal(a, b):
+        return 0
+    return cmp(a, b)
+
+
+def equal(a, b):
+    "Whether a lookup value matches a value of a cell."
+    if a is None or b is None:
+        return False
+    if is_text(a):
+        return is_text(b) and a.lower() == b.lower()
+    return not is_text(b) and approximately_equal(float(a), float(b))
+
+
+def items(value):
+    "Values of a matrix, or a scalar, in rows."
+    if isinstance(value, tuple):
+        return [item for row in value for item in row]
+    return [value]
+
+
+def numbers(arguments):
+    """Numbers of function arguments: the numbers and booleans of
+    matrices, scalars converted to numbers, empty ones skipped."""
+    for argument in arguments:
+        value = argument()
+        if isinstance(value, tuple):
+            for row in value:
+                for item in row:
+                    if item.__class__ is CellError:
+                        raise item
+                    if isinstance(item, (float, bool)):
+                        yield float(item)
+        elif value is not None:
+            yield number(value)
+
+
+def condition(value):
+    "Truth of an IF condition."
+    if isinstance(value, tuple):
+        value = single(value)
+    if is_text(value):
+        raise CellError('#VALUE!')
+    return bool(number(value))
+
+
+# Functions get their arguments as closures.
+
+def function_and(*arguments):
+    truths = []
+    for argument in arguments:
+        value = argument()
+        matrix = isinstance(value, tuple)
+        for item in items(value):
+            if item.__class__ is CellError:
+                raise item
+            if item is None or is_text(item):
+                if matrix or item is None:
+                    continue
+                raise CellError('#VALUE!')
+            truths.append(bool(item))
+    if not truths:
+        raise CellError('#VALUE!')
+    return all(truths)
+
+
+def function_average(*arguments):
+    values = list(numbers(arguments))
+    if not values:
+        raise CellError('#DIV/0!')
+    return math.fsum(values) / len(values)
+
+
+def function_concatenate(*arguments):
+    return u''.join(text(argument()) for argument in arguments)
+
+
+def function_if(test, then=lambda: True, otherwise=lambda: False):
+    if condition(test()):
+        return then()
+    return otherwise()
+
+
+def function_max(*arguments):
+    values = list(numbers(arguments))
+    return max(values) if values else 0.0
+
+
+def function_pi():
+    return math.pi
+
+
+def function_round(value, digits=lambda: 0.0):
+    factor = 10.0 ** int(number(digits()))
+    value = number(value())
+    rounded = math.floor(approximate(abs(value) * factor) + 0.5) / factor
+    return math.copysign(rounded, value)
+
+
+def function_roundup(value, digits=lambda: 0.0):
+    factor = 10.0 ** int(number(digits()))
+    value = number(value())
+    rounded = math.ceil(approximate(abs(value) * factor)) / factor
+    return math.copysign(rounded, value)
+
+
+def function_sqrt(value):
+    value = number(value())
+    if value < 0:
+        raise CellError('#NUM!')
+    return math.sqrt(value)
+
+
+def function_sum(*arguments):
+    return math.fsum(numbers(arguments))
+
+
+def function_transpose(matrix):
+    matrix = matrix()
+    if not isinstance(matrix, tuple):
+        return ((matrix,),)
+    return tuple(zip(*matrix))
+
+
+def function_vlookup(value, matrix, column, sorted=lambda: True):
+    value = value()
+    if isinstance(value, tuple):
+        value = single(value)
+    if value.__class__ is CellError:
+        raise value
+    matrix = matrix()
+    if not isinstance(matrix, tuple):
+        matrix = ((matrix,),)
+    column = int(number(column())) - 1
+    if not 0 <= column < len(matrix[0]):
+        raise CellError(invalid_argument)
+    found = None
+    if condition(sorted()):
+        # the last row not past the value, of the same kind
+        for row in matrix:
+            first = row[0]
+            if first is None or is_text(first) != is_text(value):
+                continue
+            if compare(first, value) > 0:
+                break
+            found = row
+    elif is_text(value) and isinstance(matrix, Rows):
+        found = matrix.text_row(value)
+    else:
+        for row in matrix:
+            if equal(value, row[0]):
+                found = row
+                break
+    if found is None:
+        raise CellError('#N/A')
+    result = found[column]
+    if result.__class__ is CellError:
+        raise result
+    return result
+
+
+criterion_pattern = re.compile(r'^(<>|<=|>=|<|>|=)?(.*)$', re.S)
+
+def criterion(value):
+    """Test of a database value by a criteria cell value, like
+    >=2.5 or a value to be equal to."""
+    if value.__class__ is CellError:
+        raise value
+    if not is_text(value):
+        return lambda item: item is not None and not is_text(item) and \
+            approximately_equal(float(item), float(value))
+    operator, operand = criterion_pattern.match(value).groups()
+    operator = operator or '='
+    try:
+        operand = float(operand)
+    except ValueError:
+        if operator == '=' and not operand:
+            return lambda item: item is None or item == u''
+    else:
+        if operator == '=':
+            return lambda item: item is not None and not is_text(item) and \
+                approximately_equal(float(item), operand)
+    test = comparison_operators[operator]
+    if is_text(operand):
+        return lambda item: (is_text(item) or operator == '<>') and \
+            test(compare(item if is_text(item) else None, operand))
+    return lambda item: item is not None and not is_text(item) and \
+        test(compare(item, operand))
+
+
+def field_index(headers, field):
+    "Column of a database field given by its header or number (from 1)."
+    if is_text(field):
+        for index, header in enumerate(headers):
+            if is_text(header) and header.lower() == field.lower():
+                return index
+        raise CellError('#VALUE!')
+    index = int(number(field)) - 1
+    if not 0 <= index < len(headers):
+        raise CellError('#VALUE!')
+    return index
+
+
+def function_dmax(database, field, criteria):
+    """Highest value of a field of the database rows meeting all the
+    criteria of any row of the criteria (after their header row)."""
+    database = database()
+    criteria = criteria()
+    if not isinstance(database, tuple) or not isinstance(criteria, tuple):
+        raise CellError('#VALUE!')
+    headers = database[0]
+    field = field()
+    if isinstance(field, tuple):
+        field = single(field)
+    column = field_index(headers, field)
+    alternatives = [
+        [
+            (field_index(headers, header), criterion(value))
+            for header, value in zip(criteria[0], row)
+            if value is not None and header is not None
+        ]
+        for row in criteria[1:]
+    ]
+    values = []
+    for row in database[1:]:
+        if any(all(test(row[index]) for index, test in tests) for tests in alternatives):
+            value = row[column]
+            if value.__class__ is CellError:
+                raise value
+            if isinstance(value, (float, bool)):
+                values.append(float(value))
+    return max(values) if values else 0.0
+
+
+functions = {
+    'AND': function_and,
+    'AVERAGE': function_average,
+    'CONCATENATE': function_concatenate,
+    'DMAX': function_dmax,
+    'FALSE': lambda: False,
+    'IF': function_if,
+    'MAX': function_max,
+    'PI': function_pi,
+    'ROUND': function_round,
+    'ROUNDUP': function_roundup,
+    'SQRT': function_sqrt,
+    'SUM': function_sum,
+    'TRANSPOSE': function_transpose,
+    'TRUE': lambda: True,
+    'VLOOKUP': function_vlookup,
+}
+
+
+# Operators of numbers, Python errors of them become cell errors.
+
+def divide(a, b):
+    if not b:
+        raise CellError('#DIV/0!')
+    return a / b
+
+
+def power(a, b):
+    try:
+        return a ** b
+    except (ValueError, ZeroDivisionError, OverflowError):
+        raise CellError('#NUM!')
+
+
+arithmetic_operators = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': divide,
+    '^': power,
+}
+
+comparison_operators = {
+    '=': lambda order: order == 0,
+    '<>': lambda order: order != 0,
+    '<': lambda order: order < 0,
+    '<=': lambda order: order <= 0,
+    '>': lambda order: order > 0,
+    '>=': lambda order: order >= 0,
+}
+
+token_pattern = re.compile(r'''
+    \s*(?:
+        (?P<reference>\[[^\]]*\]) |
+        (?P<string>"(?:[^"]|"")*") |
+        (?P<number>(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?) |
+        (?P<name>[A-Za-z_\\][\w.]*) |
+        (?P<operator><>|<=|>=|[-+*/^&=<>%();])
+    )
+''', re.X | re.U)
+
+
+def tokenize(formula):
+    "(kind, text) tokens of a formula."
+    tokens = []
+    position = 0
+    formula = formula.rstrip()
+    while position < len(formula):
+        match = token_pattern.match(formula, position)
+        if not match:
+            raise FormulaError('invalid formula at %r' % formula[position:])
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+
+def error_value(code):
+    def evaluate():
+        raise CellError(code)
+    return evaluate
+
+
+class Compiler(object):
+    """Recursive descent parser of an OpenFormula formula of a cell,
+    returning a closure which evaluates it and collecting the cells
+    it reads into precedents."""
+
+    def __init__(self, book, key):
+        self.book = book
+        self.sheet = key[0]
+        self.precedents = set()
+
+    def compile(self, formula):
+        if formula.startswith('of:'):
+            formula = formula[3:]
+        # an extra = after the one starting a formula is ignored
+        self.tokens = tokenize(formula.lstrip('='))
+        self.position = 0
+        expression = self.comparison()
+        if self.position < len(self.tokens):
+            raise FormulaError('unexpected %s in %s' % (self.peek(), formula))
+        return expression
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position][1]
+        return None
+
+    def take(self, *operators):
+        "The next token if it is one of the operators, else None."
+        token = self.peek()
+        if token in operators and self.tokens[self.position][0] == 'operator':
+            self.position += 1
+            return token
+        return None
+
+    def expect(self, operator):
+        if not self.take(operator):
+            raise FormulaError('expected %s, got %s' % (operator, self.peek()))
+
+    def comparison(self):
+        left = self.concatenation()
+        while True:
+            operator = self.take(*comparison_operators)
+            if not operator:
+                return left
+            left = self.compare(comparison_operators[operator], left, self.concatenation())
+
+    @staticmethod
+    def compare(test, left, right):
+        return lambda: test(compare(left(), right()))
+
+    def concatenation(self):
+        left = self.additive()
+        while self.take('&'):
+            left = self.concatenate(left, self.additive())
+        return left
+
+    @staticmethod
+    def concatenate(left, right):
+        return lambda: text(left()) + text(right())
+
+    def binary(self, operand, operators):
+        left = operand()
+        while True:
+            operator = self.take(*operators)
+            if not operator:
+                return left
+            left = self.arithmetic(arithmetic_operators[operator], left, operand())
+
+    @staticmethod
+    def arithmetic(operator, left, right):
+        return lambda: operator(number(left()), number(right()))
+
+    def additive(self):
+        return self.binary(self.multiplicative, ('+', '-'))
+
+    def multiplicative(self):
+        return self.binary(self.power, ('*', '/'))
+
+    def power(self):
+        return self.binary(self.unary, ('^',))
+
+    def unary(self):
+        operator = self.take('-', '+')
+        if operator == '-':
+            operand = self.unary()
+            return lambda: -number(operand())
+        if operator == '+':
+            return self.unary()
+        return self.postfix()
+
+    def postfix(self):
+        operand = self.primary()
+        while self.take('%'):
+            operand = self.percent(operand)
+        return operand
+
+    @staticmethod
+    def percent(operand):
+        return lambda: number(operand()) / 100
+
+    def primary(self):
+        if self.position >= len(self.tokens):
+            raise FormulaError('unexpected end of formula')
+        kind, token = self.tokens[self.position]
+        self.position += 1
+        if kind == 'number':
+            value = float(token)
+            return lambda: value
+        if kind == 'string':
+            value = unicode(token[1:-1].replace('""', '"'))
+            return lambda: value
+        if kind == 'reference':
+            return self.reference(token[1:-1])
+        if kind == 'name':
+            if self.take('('):
+                return self.function(token)
+            return self.name(token)
+        if token == '(':
+            expression = self.comparison()
+            self.expect(')')
+            return expression
+        raise FormulaError('unexpected %s' % token)
+
+    def function(self, name):
+        arguments = []
+        if not self.take(')'):
+            while True:
+                if self.peek() in (';', ')') and self.tokens[self.position][0] == 'operator':
+                    arguments.append(lambda: None)
+                else:
+                    arguments.append(self.comparison())
+                if self.take(')'):
+                    break
+                self.expect(';')
+        function = functions.get(name.upper())
+        if function is None:
+            return error_value('#NAME?')
+        return lambda: function(*arguments)
+
+    def name(self, name):
+        address = self.book.names.get(name.lower())
+        if address is not None:
+            return self.address(address)
+        if name.upper() in ('TRUE', 'FALSE'):
+            value = name.upper() == 'TRUE'
+            return lambda: value
+        return error_value('#NAME?')
+
+    def reference(self, address):
+        try:
+            return self.address(address)
+        except FormulaError:
+            return error_value('#REF!')
+
+    def address(self, address):
+        sheet, first_row, first_column, last_row, last_column = \
+            parse_address(address, self.sheet)
+        if sheet not in self.book.sheets:
+            return error_value('#REF!')
+        values = self.book.values
+        if (first_row, first_column) == (last_row, last_column):
+            key = sheet, first_row, first_column
+            self.precedents.add(key)
+            def read():
+                value = values.get(key)
+                if value.__class__ is CellError:
+                    raise value
+                return value
+            return read
+        key = self.book.range_node(sheet, first_row, first_column, last_row, last_column)
+        self.precedents.add(key)
+        return lambda: values[key]
+
+
+def result(value):
+    "Value of a formula cell for the value of its formula."
+    if isinstance(value, tuple):
+        value = single(value)
+    if value is None:
+        return 0.0
+    if value.__class__ is float and (math.isinf(value) or math.isnan(value)):
+        raise CellError('#NUM!')
+    return value
+
+
+def calculate(compute):
+    "Value of a formula cell, the error if there is one."
+    try:
+        return compute()
+    except CellError as error:
+        return error
+    except ZeroDivisionError:
+        return CellError('#DIV/0!')
+    except (OverflowError, ValueError):
+        return CellError('#NUM!')
+
+
+def same(a, b):
+    return a.__class__ is b.__class__ and a == b
+
+
+def agree(computed, saved, tolerance):
+    "Whether a computed value matches one saved by the office suite."
+    if isinstance(computed, CellError) or isinstance(saved, CellError):
+        return computed == saved
+    if is_text(computed) or is_text(saved):
+        return text(computed) == text(saved)
+    computed = float(computed)
+    saved = float(saved)
+    return abs(computed - saved) <= tolerance * max(abs(computed), abs(saved), 1e-300)
+
+
+class Book(object):
+    """Cells of a spreadsheet with compiled formulas. values holds
+    the current value of every non empty cell by (sheet, row, column),
+    starting with the ones saved by the office suite, and the rows of
+    every range read by the formulas by (sheet, first row, first
+    column, last row, last column)."""
+
+    def __init__(self, values, formulas, matrices, names):
+        self.saved = values
+        self.values = dict(values)
+        self.formulas = formulas
+        self.names = names
+        self.sheets = set(key[0] for key in values.keys() + formulas.keys())
+        self.arrays = {}
+        self.compute = {}
+        self.dependents = {}
+        self.evaluations = 0
+
+        for key, formula in formulas.iteritems():
+            compiler = Compiler(self, key)
+            expression = compiler.compile(formula)
+            if key in matrices:
+                self.compile_matrix(key, expression, *matrices[key])
+            else:
+                self.compute[key] = self.formula_cell(expression)
+            for precedent in compiler.precedents:
+                self.dependents.setdefault(precedent, set()).add(key)
+
+        self.order = self.evaluation_order()
+        self.cells = [key for key in self.order if len(key) == 3]
+        self.position = dict((key, position) for (position, key) in enumerate(self.order))
+        # positions in order of the dirty cells, as a heap
+        self.dirty = range(len(self.order))
+        self.queued = set(self.dirty)
+
+    @classmethod
+    def parse(cls, file):
+        values, formulas, matrices, names = read_cells(file)
+        return cls(values, formulas, matrices, names)
+
+    def range_node(self, sheet, first_row, first_column, last_row, last_column):
+        """Key of a range, computed like a formula cell into the tuple
+        of rows of the values of its cells, for formulas reading the
+        range to share it."""
+        key = sheet, first_row, first_column, last_row, last_column
+        if key not in self.compute:
+            rows = tuple(
+                tuple((sheet, row, column) for column in xrange(first_column, last_column + 1))
+                for row in xrange(first_row, last_row + 1)
+            )
+            values = self.values
+            self.compute[key] = lambda: Rows(
+                tuple(values.get(cell) for cell in row) for row in rows
+            )
+            for row in rows:
+                for cell in row:
+                    self.dependents.setdefault(cell, set()).add(key)
+        return key
+
+    @staticmethod
+    def formula_cell(expression):
+        return lambda: result(expression())
+
+    def compile_matrix(self, key, expression, rows, columns):
+        """Closures of the cells spanned by a matrix formula, each
+        taking its element of the matrix the formula gives; vectors
+        repeat over the span, other cells out of it get #N/A."""
+        arrays = self.arrays
+        def evaluate():
+            try:
+                matrix = expression()
+                if not isinstance(matrix, tuple):
+                    matrix = ((matrix,),)
+            except CellError as error:
+                matrix = ((error,),)
+            arrays[key] = matrix
+            return element(0, 0)()
+        def element(row, column):
+            def evaluate():
+                matrix = arrays[key]
+                i = 0 if len(matrix) == 1 else row
+                j = 0 if len(matrix[0]) == 1 else column
+                if i >= len(matrix) or j >= len(matrix[i]):
+                    raise CellError('#N/A')
+                value = matrix[i][j]
+                if value.__class__ is CellError:
+                    raise value
+                return result(value)
+            return evaluate
+        self.compute[key] = evaluate
+        sheet, first_row, first_column = key
+        for row in xrange(rows):
+            for column in xrange(columns):
+                if row or column:
+                    cell = sheet, first_row + row, first_column + column
+                    self.compute[cell] = element(row, column)
+                    self.dependents.setdefault(key, set()).add(cell)
+
+    def evaluation_order(self):
+        "Formula cells ordered so that each comes after the ones it reads."
+        waiting = dict((key, 0) for key in self.compute)
+        for precedent, dependents in self.dependents.iteritems():
+            if precedent in self.compute:
+                for dependent in dependents:
+                    waiting[dependent] += 1
+        ready = sorted(key for (key, count) in waiting.iteritems() if not count)
+        order = []
+        while ready:
+            key = ready.pop()
+            order.append(key)
+            for dependent in self.dependents.get(key, ()):
+                waiting[dependent] -= 1
+                if not waiting[dependent]:
+                    ready.append(dependent)
+        if len(order) < len(self.compute):
+            circular = sorted(
+                key for (key, count) in waiting.iteritems()
+                if count and len(key) == 3
+            )
+            raise FormulaError('circular references through %s' % ', '.join(
+                cell_name(key) for key in circular[:10]
+            ))
+        return order
+
+    def reference(self, name):
+        "(sheet, first row, first column, last row, last column) of a name or an address."
+        address = self.names.get(name.lower(), name)
+        try:
+            reference = parse_address(address)
+        except FormulaError:
+            raise FormulaError('unknown name or invalid address: %s' % name)
+        if reference[0] not in self.sheets:
+            raise FormulaError('unknown sheet: %s' % reference[0])
+        return reference
+
+    def cell(self, name):
+        "Key of the cell of a name or an address."
+        sheet, first_row, first_column, last_row, last_column = self.reference(name)
+        if (first_row, first_column) != (last_row, last_column):
+            raise FormulaError('%s is a range, not a cell' % name)
+        return sheet, first_row, first_column
+
+    def input(self, name):
+        "Key of a cell which can be set."
+        key = self.cell(name)
+        if key in self.compute:
+            raise FormulaError('%s is a formula cell' % name)
+        return key
+
+    def mark(self, key):
+        "Marks the formula cells reading a cell dirty."
+        for dependent in self.dependents.get(key, ()):
+            position = self.position[dependent]
+            if position not in self.queued:
+                self.queued.add(position)
+                heapq.heappush(self.dirty, position)
+
+    def set(self, name, value):
+        "Sets the value of an input cell, None empties it."
+        key = self.input(name)
+        if same(self.values.get(key), value):
+            return
+        if value is None:
+            self.values.pop(key, None)
+        else:
+            self.values[key] = value
+        self.mark(key)
+
+    def recalculate(self):
+        """Computes the dirty cells, marking the ones reading them
+        dirty if their values change. Returns the number of cells
+        computed."""
+        values = self.values
+        count = 0
+        while self.dirty:
+            position = heapq.heappop(self.dirty)
+            self.queued.discard(position)
+            key = self.order[position]
+            value = calculate(self.compute[key])
+            count += 1
+            if not same(values.get(key), value) or key in self.arrays:
+                values[key] = value
+                self.mark(key)
+        self.evaluations += count
+        return count
+
+    def get(self, name):
+        """Value of a cell of a name or an address, a tuple of rows
+        of values for a range."""
+        self.recalculate()
+        sheet, first_row, first_column, last_row, last_column = self.reference(name)
+        if (first_row, first_column) == (last_row, last_column):
+            return self.values.get((sheet, first_row, first_column))
+        return tuple(
+            tuple(
+                self.values.get((sheet, row, column))
+                for column in xrange(first_column, last_column + 1)
+            )
+            for row in xrange(first_row, last_row + 1)
+        )
+
+    def affected(self, keys):
+        "Formula cells reading any of the cells, directly or not, in evaluation order."
+        positions = set()
+        stack = list(keys)
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                position = self.position[dependent]
+                if position not in positions:
+                    positions.add(position)
+                    stack.append(dependent)
+        return [self.order[position] for position in sorted(positions)]
+
+    def evaluate(self, inputs, scenarios, outputs):
+        """Lists of the values of the outputs for every scenario, a
+        sequence of values of the inputs (names or addresses). The
+        book is left as it was.
+
+        Scenarios are taken in an order with the inputs read by the
+        most cells changing the least often, and a cell is computed
+        only if an input it depends on differs from the previous
+        scenario."""
+        self.recalculate()
+        inputs = [self.input(name) for name in inputs]
+        outputs = [self.cell(name) for name in outputs]
+        scenarios = list(scenarios)
+        cells = self.affected(inputs)
+        masks = dict((key, 0) for key in cells)
+        for index, key in enumerate(inputs):
+            for cell in self.affected([key]):
+                masks[cell] |= 1 << index
+        computes = [(key, self.compute[key], masks[key]) for key in cells]
+
+        readers = [sum(1 for mask in masks.itervalues() if mask >> index & 1)
+                   for index in xrange(len(inputs))]
+        priority = sorted(xrange(len(inputs)), key=lambda index: -readers[index])
+        order = sorted(
+            xrange(len(scenarios)),
+            key=lambda n: [scenarios[n][index] for index in priority]
+        )
+
+        values = self.values
+        saved = [(key, values.get(key)) for key in inputs + cells]
+        arrays = dict(self.arrays)
+        results = [None] * len(scenarios)
+        previous = None
+        try:
+            for n in order:
+                scenario = scenarios[n]
+                changed = 0
+                for index, (key, value) in enumerate(zip(inputs, scenario)):
+                    if previous is not None and same(previous[index], value):
+                        continue
+                    changed |= 1 << index
+                    if value is None:
+                        values.pop(key, None)
+                    else:
+                        values[key] = value
+                for key, compute, mask in computes:
+                    if mask & changed:
+                        values[key] = calculate(compute)
+                        self.evaluations += 1
+                results[n] = [values.get(key) for key in outputs]
+                previous = scenario
+        finally:
+            for key, value in saved:
+                if value is None:
+                    values.pop(key, None)
+                else:
+                    values[key] = value
+            self.arrays.update(arrays)
+        return results
+
+    def mismatches(self, tolerance=1e-12):
+        """(cell, computed value, saved value) of the formula cells
+        with other values than the office suite saved."""
+        self.recalculate()
+        return [
+            (key, self.values.get(key), self.saved.get(key))
+            for key in self.cells
+            if not agree(self.values.get(key), self.saved.get(key), tolerance)
+        ]
+
+    def parse_value(self, name, value):
+        """Value of a text for an input cell, of the kind of the
+        value it has: a number, a boolean or a text."""
+        current = self.values.get(self.input(name))
+        if value == '':
+            return None
+        if isinstance(current, bool):
+            if value.lower() not in ('true', 'false', '1', '0'):
+                raise ValueError('%s takes TRUE or FALSE, not %s' % (name, value))
+            return value.lower() in ('true', '1')
+        if is_text(current):
+            return unicode(value)
+        try:
+            return float(value)
+        except ValueError:
+            return unicode(value)
+
+
+books = {}
+
+
+def load(path=default_path):
+    """Book of a spreadsheet, parsed and compiled again only when
+    its modification time changes."""
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime
+    if path not in books or books[path][0] != mtime:
+        with open(path, 'rb') as file:
+            books[path] = mtime, Book.parse(file)
+    return books[path][1]
+
+
+# Worker process state, every worker loads the book itself.
+worker_state = {}
+
+def worker_init(path, settings):
+    book = load(path)
+    for name, value in settings:
+        book.set(name, value)
+    worker_state['book'] = book
+
+def worker_evaluate(chunk):
+    inputs, scenarios, outputs = chunk
+    return worker_state['book'].evaluate(inputs, scenarios, outputs)
+
+
+def sweep(path, inputs, scenarios, outputs, settings=(), workers=1):
+    """Values of the outputs for every scenario of values of the
+    inputs, with (name, value) settings of other inputs made first.
+    Blocks of scenarios are spread over worker processes if there
+    is more than one worker."""
+    scenarios = list(scenarios)
+    if workers <= 1 or len(scenarios) < 2:
+        # load() shares the book, so the settings only last as long
+        # as the evaluation
+        book = load(path)
+        saved = [(name, book.values.get(book.input(name))) for (name, value) in settings]
+        try:
+            for name, value in settings:
+                book.set(name, value)
+            return book.evaluate(inputs, scenarios, outputs)
+        finally:
+            for name, value in reversed(saved):
+                book.set(name, value)
+            book.recalculate()
+
+    size = max(1, -(-len(scenarios) // (workers * 4)))
+    chunks = [
+        (inputs, scenarios[i:i + size], outputs)
+        for i in xrange(0, len(scenarios), size)
+    ]
+    pool = multiprocessing.Pool(workers, worker_init, (path, settings))
+    try:
+        results = pool.map(worker_evaluate, chunks)
+    finally:
+        pool.close()
+        pool.join()
+    return [values for result in results for values in result]
+
+
+def output_value(value):
+    "Text of a value for the output, rows separated by ; for ranges."
+    if isinstance(value, tuple):
+        return '; '.join(', '.join(output_value(item) for item in row) for row in value)
+    if isinstance(value, CellError):
+        return value.code
+    if isinstance(value, float):
+        return repr(value)
+    return text(value).encode('utf-8')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Recalculate the EV calculator spreadsheet.',
+        epilog='Cells are named ranges like cells_series or addresses '
+               "like 'Battery pack'.B9."
+    )
+    parser.add_argument('outputs', metavar='cell', nargs='*',
+        help='cells to show')
+    parser.add_argument('--file', default=default_path,
+        help='flat ODS spreadsheet')
+    parser.add_argument('--set', metavar='CELL=VALUE', action='append', default=[],
+        help='input value, set before computing the outputs')
+    parser.add_argument('--sweep', metavar='CELL=VALUES', action='append', default=[],
+        help='comma separated input values, every combination is a scenario')
+    parser.add_argument('--grid', type=argparse.FileType('r'),
+        help='CSV file with input cells as columns, a scenario per row')
+    parser.add_argument('--workers', type=int, default=1,
+        help='number of worker processes for the scenarios')
+    parser.add_argument('--output', type=argparse.FileType('w'),
+        default=sys.stdout, help='CSV output file of the scenarios')
+    parser.add_argument('--verify', action='store_true',
+        help='compare all the formula cells with the values saved in the file')
+    parser.add_argument('--list-names', action='store_true',
+        help='show the named ranges with their addresses and values')
+    options = parser.parse_args()
+
+    book = load(options.file)
+
+    if options.list_names:
+        for name in sorted(book.names):
+            value = book.get(name)
+            print '%-40s %-40s %s' % (
+                name,
+                book.names[name].encode('utf-8'),
+                '(range)' if isinstance(value, tuple) else output_value(value)
+            )
+        sys.exit()
+
+    if options.verify:
+        mismatches = book.mismatches()
+        for key, computed, saved in mismatches:
+            print '%s: computed %s, saved %s' % (
+                cell_name(key).encode('utf-8'), output_value(computed), output_value(saved)
+            )
+        print '%d formula cells, %d mismatches' % (len(book.cells), len(mismatches))
+        sys.exit(1 if mismatches else 0)
+
+    book.recalculate()
+    try:
+        settings = []
+        for assignment in options.set:
+            name, value = assignment.split('=', 1)
+            settings.append((name, book.parse_value(name, value)))
+            book.set(*settings[-1])
+
+        if options.sweep or options.grid:
+            if options.grid:
+                reader = csv.reader(options.grid)
+                inputs = next(reader)
+                rows = [row for row in reader if row]
+            else:
+                inputs = [assignment.split('=', 1)[0] for assignment in options.sweep]
+                rows = itertools.product(*[
+                    assignment.split('=', 1)[1].split(',')
+                    for assignment in options.sweep
+                ])
+            scenarios = [
+                [book.parse_value(name, value) for (name, value) in zip(inputs, row)]
+                for row in rows
+            ]
+            results = sweep(
+                options.file, inputs, scenarios, options.outputs, settings, options.workers
+            )
+            writer = csv.writer(options.output)
+            writer.writerow(inputs + options.outputs)
+            for scenario, values in zip(scenarios, results):
+                writer.writerow([output_value(value) for value in scenario + values])
+            sys.exit()
+
+        computed = book.recalculate()
+        if options.set:
+            print '%d cells recalculated' % computed
+        for name in options.outputs:
+            print '%s %s' % (name, output_value(book.get(name)))
+    except ValueError as error:
+        # FormulaError or an invalid value
+        parser.error(str(error))
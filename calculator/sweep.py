@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+"""
+Parameter sweeps: energy and power figures of many Car variants
+over a single track.
+
+The car parameters are given as a table with a row per variant.
+Dynamics of the track are computed for a block of variants at once,
+with every car parameter being a column vector broadcasting against
+the track point arrays (variants x points). Metrics of variants whose
+power at wheels is out of the range plausible for the car are NaN.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import copy
+import csv
+import itertools
+import multiprocessing
+import numpy
+import sys
+import track_gpx
+import track_physics
+import windows
+
+from utils import prop
+
+# Car parameters which can be swept. max_speed is left out, as it
+# filters track points and so changes the kinematics of the track,
+# and power, as it only bounds the plausible power at wheels.
+parameters = (
+    'mass',
+    'cx',
+    'frontal_area',
+    'rrc',
+    'battery_pack_efficiency',
+    'controller_efficiency',
+    'motor_efficiency',
+    'gearbox_efficiency',
+    'regen_efficiency',
+)
+
+metrics = (
+    'energy',
+    'energy_rate',
+    'peak_output_power',
+    'peak_regen_power',
+    'average_motor_power',
+)
+
+# Upper bound of variants times points evaluated at once,
+# each intermediate array takes 8 bytes per element.
+block = 1 << 22
+
+
+def grid(**values):
+    "Table of all the combinations of given parameter values."
+    names = [name for name in parameters if name in values]
+    rows = list(itertools.product(*[values[name] for name in names]))
+    return numpy.array(rows, dtype=[(name, float) for name in names])
+
+
+def read_grid(file):
+    "Table of car parameters from a CSV file with a header row."
+    reader = csv.reader(file)
+    names = next(reader)
+    for name in names:
+        if name not in parameters:
+            raise ValueError('unknown car parameter: %s' % name)
+    rows = [tuple(float(value) for value in row) for row in reader if row]
+    return numpy.array(rows, dtype=[(name, float) for name in names])
+
+
+def write_csv(table, file):
+    "Writes a table as CSV with a header row."
+    writer = csv.writer(file)
+    writer.writerow(table.dtype.names)
+    for row in table:
+        writer.writerow([repr(float(value)) for value in row])
+
+
+def cars(table, car=None):
+    """A copy of car (a default Car if it is None) whose parameters
+    found in the table are column vectors. Quantities cached by the car
+    which derive from its parameters are dropped, the ones of Car
+    subclasses, like the efficiency map of a MappedCar, are kept."""
+    if car is None:
+        variants = track_physics.Car()
+    else:
+        variants = copy.copy(car)
+    for name, value in vars(track_physics.Car).iteritems():
+        if isinstance(value, prop):
+            vars(variants).pop(name, None)
+    for name in table.dtype.names:
+        setattr(variants, name, table[name].astype(float)[:, numpy.newaxis])
+    return variants
+
+
+def evaluate(kinematics, table, car=None,
+             peak_windows=track_physics.Track.peak_windows):
+    "Metrics of every car variant of the table over track kinematics."
+    dynamics = track_physics.Dynamics(kinematics, cars(table, car))
+    dynamics.check_power = False
+    valid = dynamics.within_power(dynamics.power_at_wheels).all(axis=-1)
+
+    result = numpy.empty(len(table), dtype=[(name, float) for name in metrics])
+    result['energy'] = dynamics.energy.sum(axis=-1) / 3600
+    result['energy_rate'] = result['energy'] / (kinematics.distance.sum() / 1000)
+    result['average_motor_power'] = dynamics.motor_power.mean(axis=-1)
+
+    for name in 'peak_output_power', 'peak_regen_power':
+        window = peak_windows[name]
+        first, last = windows.bounds(
+            len(kinematics),
+            window.width,
+            windows.positions(kinematics, window.unit)
+        )
+        values = windows.aggregates[window.aggregate](
+            getattr(dynamics, window.attribute),
+            first,
+            last
+        )
+        if window.peak == 'max':
+            result[name] = values.max(axis=-1)
+        else:
+            result[name] = values.min(axis=-1)
+
+    for name in metrics:
+        result[name][~valid] = numpy.nan
+
+    return result
+
+
+# Worker process state, kinematics are sent once per worker.
+worker_state = {}
+
+def worker_init(kinematics, car):
+    worker_state['kinematics'] = kinematics
+    worker_state['car'] = car
+
+def worker_evaluate(table):
+    return evaluate(worker_state['kinematics'], table, worker_state['car'])
+
+
+def sweep(kinematics, table, car=None, workers=1):
+    """Car parameter table extended with metrics of every variant
+    over track kinematics. Blocks of variants are spread over
+    worker processes if there is more than one worker."""
+    size = max(1, block // len(kinematics))
+    chunks = [table[i:i + size] for i in xrange(0, len(table), size)]
+
+    if workers > 1 and len(chunks) > 1:
+        # compute the kinematics before they get copied to workers
+        kinematics.acceleration
+        kinematics.incline_sine
+        kinematics.incline_cosine
+
+        pool = multiprocessing.Pool(workers, worker_init, (kinematics, car))
+        try:
+            results = pool.map(worker_evaluate, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [evaluate(kinematics, chunk, car) for chunk in chunks]
+
+    results = numpy.concatenate(results)
+    swept = numpy.empty(len(table), dtype=table.dtype.descr + results.dtype.descr)
+    for name in table.dtype.names:
+        swept[name] = table[name]
+    for name in results.dtype.names:
+        swept[name] = results[name]
+    return swept
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+        description='Evaluate a grid of car variants over a GPX track.'
+    )
+    parser.add_argument('file', help='GPX file')
+    parser.add_argument('--grid', type=argparse.FileType('r'),
+        help='CSV file with car parameters as columns, a variant per row')
+    for name in parameters:
+        parser.add_argument('--' + name, metavar='VALUES',
+            type=lambda values: [float(value) for value in values.split(',')],
+            help='comma separated values of %s' % name)
+    parser.add_argument('--workers', type=int, default=1,
+        help='number of worker processes')
+    parser.add_argument('--output', type=argparse.FileType('w'),
+        default=sys.stdout, help='CSV output file')
+    options = parser.parse_args()
+
+    values = dict(
+        (name, getattr(options, name)) for name in parameters
+        if getattr(options, name)
+    )
+    if options.grid:
+        table = read_grid(options.grid)
+    elif values:
+        table = grid(**values)
+    else:
+        parser.error('no car parameters to sweep')
+
+    car = track_gpx.Car()
+    commute = track_gpx.Commute(car, [options.file])
+    track, = commute.tracks
+
+    write_csv(sweep(track.kinematics, table, car, options.workers), options.output)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+Deterministic synthetic GPX tracks for benchmarks.
+
+A track is a drive along a meandering route over rolling hills with
+the speed varying between stops and open road. The GPS receiver is
+simulated by quantizing the elevation to whole metres, adding noise
+and throwing in occasional bad fixes. The same parameters and seed
+always give the same file.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import numpy
+import sys
+import time
+import track_physics
+
+Earth = track_physics.Earth
+
+header = '''<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="gpx2energy synthetic" xmlns="http://www.topografix.com/GPX/1/1">
+<trk><name>%s</name>
+'''
+
+trkpt = ('<trkpt lat="%.7f" lon="%.7f"><ele>%.1f</ele>'
+         '<time>%s.%03dZ</time></trkpt>\n')
+
+# points formatted at once
+chunk = 65536
+
+
+class Route(object):
+    "Parameters of a synthetic track."
+
+    def __init__(self, length=30, period=1.0, speed=50, noise=0.5,
+                 outliers=0.001, segments=1, seed=0,
+                 start=(50.06, 19.94, 220.0), start_time=1367391600):
+        self.length = length # [km]
+        self.period = period # sampling period [s]
+        self.speed = speed # average speed [km/h]
+        self.noise = noise # elevation noise [m]
+        self.outliers = outliers # fraction of bad fixes
+        self.segments = segments
+        self.seed = seed
+        self.start = start # lat, lon, elevation
+        self.start_time = start_time # [s since the epoch]
+
+    @property
+    def points(self):
+        "Number of points of the track."
+        duration = self.length / float(self.speed) * 3600
+        return max(int(duration / self.period), 2)
+
+    def columns(self):
+        "lat, lon, elevation and time arrays of the track."
+        random = numpy.random.RandomState(self.seed)
+        count = self.points
+        time = self.start_time + numpy.arange(count) * self.period
+
+        # speed oscillating around the average with stops in between
+        phase = numpy.cumsum(random.uniform(0.5, 1.5, count)) * self.period
+        speed = self.speed / 3.6 * (1 + 0.6 * numpy.sin(phase / 120.0))
+        speed = numpy.clip(speed + random.normal(0, 0.3, count), 0, None)
+        step = speed * self.period
+
+        heading = numpy.cumsum(random.normal(0, 0.02, count))
+        lat0, lon0, elevation0 = self.start
+        metres_per_degree = numpy.radians(1) * Earth.radius
+        lat = lat0 + numpy.cumsum(step * numpy.cos(heading)) / metres_per_degree
+        lon = lon0 + numpy.cumsum(step * numpy.sin(heading)) / (
+            metres_per_degree * numpy.cos(numpy.radians(lat0))
+        )
+
+        distance = numpy.cumsum(step)
+        elevation = elevation0 + 40 * numpy.sin(distance / 3000.0) \
+            + 15 * numpy.sin(distance / 700.0)
+        # phones log whole metres
+        elevation = numpy.round(elevation) + random.normal(0, self.noise, count)
+
+        # bad fixes are either off by kilometres or by tens of metres up
+        bad = random.random_sample(count) < self.outliers
+        jump = bad & (random.random_sample(count) < 0.5)
+        spike = bad & ~jump
+        lat[jump] += random.normal(0, 0.02, jump.sum())
+        lon[jump] += random.normal(0, 0.02, jump.sum())
+        elevation[spike] += random.normal(0, 50, spike.sum())
+
+        return lat, lon, elevation, time
+
+    def write(self, file, name='synthetic'):
+        "Writes the track as GPX."
+        lat, lon, elevation, time = self.columns()
+        bounds = numpy.linspace(0, len(lat), self.segments + 1).astype(int)
+
+        file.write(header % name)
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            file.write('<trkseg>\n')
+            for start in xrange(first, last, chunk):
+                end = min(start + chunk, last)
+                file.write(''.join(
+                    trkpt % (
+                        lat[i], lon[i], elevation[i],
+                        timestamp(time[i]), int(time[i] * 1000) % 1000
+                    )
+                    for i in xrange(start, end)
+                ))
+            file.write('</trkseg>\n')
+        file.write('</trk>\n</gpx>\n')
+
+
+def timestamp(seconds):
+    "ISO 8601 date and time of seconds since the epoch, without fraction."
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Write a synthetic GPX track.')
+    parser.add_argument('--length', type=float, default=30, help='[km]')
+    parser.add_argument('--period', type=float, default=1.0,
+        help='sampling period [s]')
+    parser.add_argument('--speed', type=float, default=50,
+        help='average speed [km/h]')
+    parser.add_argument('--noise', type=float, default=0.5,
+        help='elevation noise [m]')
+    parser.add_argument('--outliers', type=float, default=0.001,
+        help='fraction of bad fixes')
+    parser.add_argument('--segments', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=argparse.FileType('w'),
+        default=sys.stdout)
+    options = parser.parse_args()
+
+    Route(
+        options.length,
+        options.period,
+        options.speed,
+        options.noise,
+        options.outliers,
+        options.segments,
+        options.seed
+    ).write(options.output)
@@ -0,0 +1,109 @@
+"""
+Tests of the vectorized battery simulation against the stepwise one.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import battery
+import logging
+import numpy
+import StringIO
+import synthetic
+import track_gpx
+import unittest
+
+
+class SimulationTest(unittest.TestCase):
+
+    def assertSameSolution(self, simulation):
+        soc, current, limited = simulation.solution
+        stepwise_soc, stepwise_current, stepwise_limited = simulation.stepwise()
+        numpy.testing.assert_allclose(soc, stepwise_soc, rtol=0, atol=1e-9)
+        numpy.testing.assert_allclose(current, stepwise_current, rtol=1e-9, atol=1e-6)
+        numpy.testing.assert_array_equal(limited, stepwise_limited)
+
+    def test_track(self):
+        file = StringIO.StringIO()
+        synthetic.Route(length=5, segments=2).write(file)
+        file.seek(0)
+        file.name = 'synthetic.gpx'
+        track, = track_gpx.Commute(track_gpx.Car(), [file]).tracks
+        start, power, period = battery.track_power(track)
+        self.assertSameSolution(battery.Simulation(battery.Pack(), power, period))
+
+    def test_limits_and_charges(self):
+        random = numpy.random.RandomState(0)
+        power = random.normal(5000, 20000, 3000)
+        period = random.uniform(0, 2, 3000)
+        pack = battery.Pack()
+        # small enough to hit the current limits and run low
+        pack.cell_capacity = 20
+        pack.initial_soc = 0.9
+        simulation = battery.Simulation(pack, power, period, (700, 1800))
+        self.assertTrue(simulation.solution[2].any())
+        self.assertSameSolution(simulation)
+
+    def test_consistent(self):
+        random = numpy.random.RandomState(1)
+        pack = battery.Pack()
+        pack.cell_capacity = 20
+        simulation = battery.Simulation(
+            pack, random.normal(5000, 20000, 500), numpy.ones(500)
+        )
+        soc, current, limited = simulation.solution
+        expected, expected_limited = pack.current(
+            simulation.power, pack.open_circuit_voltage(soc)
+        )
+        numpy.testing.assert_array_equal(current, expected)
+        numpy.testing.assert_array_equal(limited, expected_limited)
+
+    def test_not_converged(self):
+        random = numpy.random.RandomState(1)
+        simulation = battery.Simulation(
+            battery.Pack(), random.normal(5000, 20000, 500), numpy.ones(500)
+        )
+        simulation.max_passes = 1
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        battery.log.addHandler(handler)
+        try:
+            soc, current, limited = simulation.solution
+        finally:
+            battery.log.removeHandler(handler)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].levelno, logging.WARNING)
+        numpy.testing.assert_array_equal(
+            current,
+            simulation.pack.current(
+                simulation.power,
+                simulation.pack.open_circuit_voltage(soc)
+            )[0]
+        )
+
+    def test_empty(self):
+        simulation = battery.Simulation(battery.Pack(), [], [])
+        soc, current, limited = simulation.solution
+        self.assertEqual((len(soc), len(current), len(limited)), (0, 0, 0))
+        self.assertEqual(len(simulation.soc), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests of cars with motor and inverter efficiency maps.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import efficiency
+import numpy
+import StringIO
+import synthetic
+import track_gpx
+import unittest
+
+
+def map_csv(efficiency_map):
+    "CSV file object of a map."
+    file = StringIO.StringIO()
+    writer = csv.writer(file)
+    writer.writerow([''] + [repr(value) for value in efficiency_map.torque])
+    for rpm, row in zip(efficiency_map.rpm, efficiency_map.efficiency):
+        writer.writerow([repr(rpm)] + [repr(value) for value in row])
+    file.seek(0)
+    return file
+
+
+def energy(car):
+    "Energy of a car over a short synthetic track [Wh]."
+    file = StringIO.StringIO()
+    synthetic.Route(length=3).write(file)
+    file.seek(0)
+    file.name = 'synthetic.gpx'
+    track, = track_gpx.Commute(car, [file]).tracks
+    return track.energy
+
+
+class MappedCarTest(unittest.TestCase):
+
+    def test_load(self):
+        model = efficiency.EfficiencyMap.model()
+        loaded = efficiency.EfficiencyMap.load(map_csv(model))
+        numpy.testing.assert_array_equal(loaded.rpm, model.rpm)
+        numpy.testing.assert_array_equal(loaded.torque, model.torque)
+        numpy.testing.assert_array_equal(loaded.efficiency, model.efficiency)
+
+        car = efficiency.MappedCar(loaded)
+        self.assertIs(car.efficiency_map, loaded)
+        self.assertEqual(energy(car), energy(efficiency.MappedCar()))
+
+    def test_constant_map(self):
+        car = track_gpx.Car()
+        value = car.controller_efficiency * car.motor_efficiency
+        constant = efficiency.EfficiencyMap(
+            [0, 6000, 12000], [0, 100, 300], numpy.ones((3, 3)) * value
+        )
+        mapped = efficiency.MappedCar(
+            efficiency.EfficiencyMap.load(map_csv(constant))
+        )
+        self.assertAlmostEqual(energy(mapped), energy(car), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Tests of fleet runs over directory trees of tracks.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import collections
+import fleet
+import os
+import shutil
+import sketches
+import StringIO
+import synthetic
+import tempfile
+import time
+import track_gpx
+import unittest
+
+day = 86400
+
+
+class Interrupt(Exception):
+    pass
+
+
+class InterruptingLog(StringIO.StringIO):
+    "A log interrupting the run after a number of checkpoints."
+
+    def __init__(self, checkpoints):
+        StringIO.StringIO.__init__(self)
+        self.checkpoints = checkpoints
+
+    def write(self, text):
+        StringIO.StringIO.write(self, text)
+        if 'files done' in text:
+            self.checkpoints -= 1
+            if not self.checkpoints:
+                raise Interrupt()
+
+
+def rows(path):
+    with open(path, 'rb') as file:
+        return list(csv.DictReader(file))
+
+
+class FleetTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.tracks = os.path.join(cls.directory, 'tracks')
+        cls.paths = []
+        # two tracks a day, in a tree of directories
+        for number in xrange(7):
+            path = os.path.join('2013', 'week%d' % (number // 3), 'track%d.gpx' % number)
+            parent = os.path.dirname(os.path.join(cls.tracks, path))
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+            with open(os.path.join(cls.tracks, path), 'w') as file:
+                synthetic.Route(
+                    length=1,
+                    seed=number,
+                    start_time=1367391600 + number // 2 * day + number % 2 * 36000
+                ).write(file)
+            cls.paths.append(path)
+        with open(os.path.join(cls.tracks, '2013', 'broken.gpx'), 'w') as file:
+            file.write('<gpx>')
+        cls.paths.insert(0, os.path.join('2013', 'broken.gpx'))
+
+        cls.reference = os.path.join(cls.directory, 'reference.csv')
+        fleet.run(cls.tracks, cls.reference, track_gpx.Car(), log=StringIO.StringIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.chunk = fleet.chunk
+        fleet.chunk = 2
+
+    def tearDown(self):
+        fleet.chunk = self.chunk
+
+    def test_walk(self):
+        self.assertEqual(list(fleet.walk(self.tracks)), sorted(
+            self.paths, key=fleet.order
+        ))
+        self.assertEqual(
+            [row['file'] for row in rows(self.reference)],
+            list(fleet.walk(self.tracks))
+        )
+
+    def test_resume(self):
+        output = os.path.join(self.directory, 'resumed.csv')
+        for workers in 1, 2:
+            self.assertRaises(
+                Interrupt,
+                fleet.run, self.tracks, output, track_gpx.Car(), workers,
+                log=InterruptingLog(1)
+            )
+            done = len(rows(output))
+            self.assertEqual(done, fleet.chunk * workers)
+
+            # rows of the next chunk, the last one cut short
+            with open(output, 'ab') as file:
+                file.write('2013/week2/track6.gpx,0123,2013-05-0')
+
+            log = StringIO.StringIO()
+            fleet.run(self.tracks, output, track_gpx.Car(), workers,
+                      resume=True, log=log)
+            # only the files after the checkpoint are computed again
+            last = log.getvalue().splitlines()[-1]
+            self.assertTrue(last.startswith('%d files done' % (len(self.paths) - done)))
+            with open(output, 'rb') as file, open(self.reference, 'rb') as reference:
+                self.assertEqual(file.read(), reference.read())
+
+    def test_aggregate(self):
+        aggregates = fleet.aggregate(self.reference)
+        self.assertEqual(aggregates['files'], len(self.paths))
+        self.assertEqual(aggregates['failed'], 1)
+
+        energy_rate = sketches.Histogram.linear(0, 1000, 1)
+        peak_output_power = sketches.Histogram.linear(0, 200000, 1000)
+        daily_energy = collections.defaultdict(float)
+        energy = 0
+        for path in self.paths[1:]:
+            track, = track_gpx.Commute(
+                track_gpx.Car(), [os.path.join(self.tracks, path)]
+            ).tracks
+            energy += track.energy
+            energy_rate.add([track.energy_rate])
+            peak_output_power.add([track.peak_output_power[0]])
+            date = time.strftime('%Y-%m-%d', time.gmtime(track.start_time))
+            daily_energy[date] += track.energy
+
+        self.assertAlmostEqual(aggregates['energy'], energy, 9)
+        self.assertEqual(
+            aggregates['peak_output_power_histogram'],
+            peak_output_power.as_dict()
+        )
+        self.assertEqual(
+            aggregates['energy_rate_percentiles']['p50'],
+            energy_rate.quantile(0.5)
+        )
+        self.assertEqual(len(aggregates['daily_energy']), 4)
+        for entry in aggregates['daily_energy']:
+            self.assertAlmostEqual(entry['energy'], daily_energy[entry['date']], 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
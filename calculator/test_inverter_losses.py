@@ -0,0 +1,60 @@
+"""
+Tests of inverter loss estimates for the devices of the component table.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import battery
+import components
+import inverter_losses
+import StringIO
+import synthetic
+import track_gpx
+import unittest
+
+
+class EstimateTest(unittest.TestCase):
+
+    def test_default_ranking(self):
+        files = []
+        for seed in 0, 1:
+            file = StringIO.StringIO()
+            synthetic.Route(length=5, outliers=0, seed=seed).write(file)
+            file.seek(0)
+            file.name = 'track%d.gpx' % seed
+            files.append(file)
+        commute = track_gpx.Commute(track_gpx.Car(), files)
+
+        table = components.load(components.default_path)
+        devices = inverter_losses.Devices(table, table.query([]))
+        estimate = inverter_losses.Estimate(
+            devices,
+            inverter_losses.Inverter(),
+            *inverter_losses.commute_samples(commute, battery.Pack())
+        )
+        ranking = estimate.ranking()
+        self.assertTrue(ranking)
+        energies = [result['energy'] for result in ranking]
+        self.assertEqual(energies, sorted(energies))
+        self.assertTrue(all(result['fits'] for result in ranking))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests of live tracks against the same tracks read from GPX files.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import live
+import StringIO
+import synthetic
+import track_gpx
+import unittest
+import warnings
+
+
+def track(route, duplicates=()):
+    """Track of a synthetic route, with the points at the given
+    indices recorded at the same time as the points before them."""
+    lat, lon, elevation, time = route.columns()
+    for index in duplicates:
+        time[index] = time[index - 1]
+
+    file = StringIO.StringIO()
+    file.write(synthetic.header % 'test')
+    file.write('<trkseg>\n')
+    for i in xrange(len(lat)):
+        if i and i % (len(lat) // route.segments) == 0:
+            file.write('</trkseg>\n<trkseg>\n')
+        file.write(synthetic.trkpt % (
+            lat[i], lon[i], elevation[i],
+            synthetic.timestamp(time[i]), int(time[i] * 1000) % 1000
+        ))
+    file.write('</trkseg>\n</trk>\n</gpx>\n')
+    file.seek(0)
+    file.name = 'test.gpx'
+    track, = track_gpx.Commute(track_gpx.Car(), [file]).tracks
+    return track
+
+
+def feed(track):
+    "LiveTrack fed with the points of a track."
+    columns = track.columns
+    starts = set(columns.starts)
+    live_track = live.LiveTrack(track.car)
+    for index in xrange(len(columns)):
+        live_track.append(
+            float(columns.lat[index]),
+            float(columns.lon[index]),
+            float(columns.elevation[index]),
+            float(columns.time[index]),
+            index in starts
+        )
+        live_track.state()
+    return live_track
+
+
+class LiveTrackTest(unittest.TestCase):
+
+    def assertSameStats(self, live_stats, stats):
+        "Running sums round differently, but only slightly."
+        self.assertEqual(sorted(live_stats), sorted(stats))
+        for name, value in stats.iteritems():
+            live_value = live_stats[name]
+            if isinstance(value, tuple):
+                self.assertEqual(live_value[1], value[1])
+                live_value, value = live_value[0], value[0]
+            self.assertAlmostEqual(
+                live_value, value, delta=1e-9 * max(1, abs(value))
+            )
+
+    def test_stats(self):
+        batch = track(synthetic.Route(length=4, outliers=0.01, segments=3))
+        self.assertSameStats(feed(batch).stats, batch.stats)
+
+    def test_duplicate_timestamps(self):
+        with warnings.catch_warnings():
+            # points with no period must not warn about invalid values
+            warnings.simplefilter('error')
+            batch = track(synthetic.Route(length=2, seed=1), (10, 11, 100))
+            batch.stats
+        live_track = feed(batch)
+        self.assertSameStats(live_track.stats, batch.stats)
+
+        live_track.append(
+            live_track.previous[0] + 0.0001,
+            live_track.previous[1],
+            live_track.previous[2],
+            live_track.previous[3]
+        )
+        self.assertEqual(live_track.state()['points'], len(batch.columns) + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""
+Tests of the JSON API of the web interface.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import batch
+import json
+import StringIO
+import server
+import synthetic
+import time
+import track_gpx
+import unittest
+import utils
+
+# Server form values of the default car, in form units.
+form = {
+    'mass': '880',
+    'frontal_area': '1.95',
+    'cx': '0.37',
+    'rrc': '0.01355',
+    'power': '40',
+    'max_speed': '100',
+    'gearbox_efficiency': '90',
+    'motor_efficiency': '87',
+    'controller_efficiency': '95',
+    'battery_pack_efficiency': '95',
+    'regen_efficiency': '100',
+}
+
+
+def gpx(seed=0):
+    "Contents of a short synthetic track."
+    file = StringIO.StringIO()
+    synthetic.Route(length=2, seed=seed).write(file)
+    return file.getvalue()
+
+
+class ServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.track_cache = track_gpx.Track.track_cache
+        track_gpx.Track.track_cache = None
+        self.client = server.app.test_client()
+
+    def tearDown(self):
+        track_gpx.Track.track_cache = self.track_cache
+
+    def test_job_stats_units(self):
+        data = dict(form)
+        data['gpx1'] = (StringIO.StringIO(gpx()), 'track.gpx')
+        response = self.client.post('/api/jobs', data=data)
+        self.assertEqual(response.status_code, 202)
+        url = json.loads(response.data)['url']
+
+        deadline = time.time() + 60
+        while True:
+            job = json.loads(self.client.get(url).data)
+            if job['state'] in ('finished', 'failed') or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        self.assertEqual(job['state'], 'finished')
+
+        track, = job['tracks']
+        for stats in job['stats'], track['stats']:
+            for stat, unit in utils.stats_units:
+                self.assertEqual(stats[stat]['unit'], unit)
+                self.assertIsInstance(stats[stat]['value'], (int, float))
+
+    def batch(self, query=''):
+        request = {'tracks': [{'name': 'track.gpx', 'gpx': gpx()}]}
+        return self.client.post(
+            '/api/batch' + query,
+            data=json.dumps(request),
+            content_type='application/json'
+        )
+
+    def test_batch_stream(self):
+        for query in '', '?stream=0', '?stream=false', '?stream=no':
+            response = self.batch(query)
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertEqual(len(json.loads(response.data)['results']), 2)
+        for query in '?stream=1', '?stream=true':
+            response = self.batch(query)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            self.assertEqual(len(response.data.splitlines()), 3)
+
+    def test_batch_commute(self):
+        request = {
+            'tracks': [{'gpx': gpx(seed)} for seed in (0, 1)],
+            'cars': [{}, {'mass': 1200}],
+        }
+        response = self.client.post(
+            '/api/batch',
+            data=json.dumps(request),
+            content_type='application/json'
+        )
+        results = json.loads(response.data)['results']
+        self.assertEqual(len(results), 6)
+        for number, car in enumerate(request['cars']):
+            commute = track_gpx.Commute(
+                batch.read_car(car),
+                [batch.gpx_file('track%d' % seed, gpx(seed)) for seed in (0, 1)]
+            )
+            self.assertEqual(
+                results[4 + number]['stats'],
+                json.loads(json.dumps(utils.stats_json(commute.stats)))
+            )
+
+    def test_batch_digest(self):
+        for digest in '../../etc/passwd', 'a' * 39, 'g' * 40, 42:
+            response = self.client.post(
+                '/api/batch',
+                data=json.dumps({'tracks': [{'digest': digest}]}),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('invalid track digest', json.loads(response.data)['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
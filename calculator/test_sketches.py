@@ -0,0 +1,119 @@
+"""
+Tests of mergeable histograms.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy
+import sketches
+import unittest
+
+
+def tracks(seed=0):
+    "Values and weights of a few tracks of different lengths."
+    random = numpy.random.RandomState(seed)
+    return [
+        (random.gamma(2, 10, count), random.uniform(0.5, 2, count))
+        for count in (10, 500, 1, 2000)
+    ]
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_merge(self):
+        parts = tracks()
+        for weighted in False, True:
+            histograms = []
+            for values, weights in parts:
+                histogram = sketches.Histogram.linear(0, 100, 2.5)
+                histogram.add(values, weights if weighted else None)
+                histograms.append(histogram)
+
+            whole = sketches.Histogram.linear(0, 100, 2.5)
+            whole.add(
+                numpy.concatenate([values for values, weights in parts]),
+                numpy.concatenate([weights for values, weights in parts])
+                if weighted else None
+            )
+            merged = sketches.merged(histograms)
+            numpy.testing.assert_allclose(merged.counts, whole.counts)
+            # merging copies, the first histogram stays as it was
+            self.assertEqual(histograms[0].total, 10 if not weighted else
+                             parts[0][1].sum())
+
+    def test_merge_other_bins(self):
+        self.assertRaises(
+            ValueError,
+            sketches.Histogram.linear(0, 100, 1).merge,
+            sketches.Histogram.linear(0, 100, 2)
+        )
+
+    def test_quantile(self):
+        values = numpy.concatenate([values for values, weights in tracks(1)])
+        values = values[values < 100]
+        step = 2.5
+        histogram = sketches.Histogram.linear(0, 100, step)
+        histogram.add(values)
+        for q in 0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1:
+            self.assertLessEqual(
+                abs(histogram.quantile(q) - numpy.percentile(values, q * 100)),
+                step
+            )
+        self.assertIsNone(sketches.Histogram.linear(0, 1, 1).quantile(0.5))
+
+
+class Histogram2DTest(unittest.TestCase):
+
+    def setUp(self):
+        random = numpy.random.RandomState(2)
+        self.x = random.uniform(-10, 6000, 3000)
+        self.y = random.uniform(0, 1, 3000) * (200 - self.x / 40)
+        self.x_edges = numpy.arange(0, 5001, 250.0)
+        self.y_edges = numpy.arange(0, 151, 5.0)
+
+    def test_merge(self):
+        whole = sketches.Histogram2D(self.x_edges, self.y_edges)
+        whole.add(self.x, self.y)
+        parts = []
+        for part in numpy.array_split(numpy.arange(len(self.x)), 7):
+            histogram = sketches.Histogram2D(self.x_edges, self.y_edges)
+            histogram.add(self.x[part], self.y[part])
+            parts.append(histogram)
+        numpy.testing.assert_array_equal(
+            sketches.merged(parts).counts, whole.counts
+        )
+
+    def test_envelope(self):
+        histogram = sketches.Histogram2D(self.x_edges, self.y_edges)
+        histogram.add(self.x, self.y)
+        x_edges = [None] + self.x_edges.tolist() + [None]
+        y_edges = self.y_edges.tolist() + [None]
+
+        expected = []
+        x_bins = numpy.searchsorted(self.x_edges, self.x, 'right')
+        y_bins = numpy.searchsorted(self.y_edges, self.y, 'right')
+        for i in sorted(set(x_bins)):
+            j = y_bins[x_bins == i].max()
+            expected.append((x_edges[i], x_edges[i + 1], y_edges[j]))
+        self.assertEqual(histogram.envelope(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
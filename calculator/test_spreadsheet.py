@@ -0,0 +1,91 @@
+"""
+Tests of the recalculation of the EV calculator spreadsheet.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import itertools
+import spreadsheet
+import unittest
+
+inputs = ['cells_series', 'cells_parallel', 'battery_model']
+outputs = [
+    'cell_count',
+    'commute_battery_power',
+    'commute_energy_per_km',
+]
+
+
+class BookTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(spreadsheet.default_path, 'rb') as file:
+            cls.book = spreadsheet.Book.parse(file)
+        models = cls.book.get('battery_model')
+        cls.scenarios = [
+            list(scenario) for scenario in itertools.product(
+                [30.0, 43.0, 60.0],
+                [1.0, 2.0],
+                [models, u'no such model'],
+            )
+        ]
+
+    def test_verify(self):
+        self.assertEqual(self.book.mismatches(), [])
+
+    def test_evaluate_matches_recalculate(self):
+        book = self.book
+        before = [book.get(name) for name in inputs + outputs]
+        results = book.evaluate(inputs, self.scenarios, outputs)
+        self.assertEqual([book.get(name) for name in inputs + outputs], before)
+
+        for scenario, values in zip(self.scenarios, results):
+            for name, value in zip(inputs, scenario):
+                book.set(name, value)
+            self.assertEqual([book.get(name) for name in outputs], values)
+        for name, value in zip(inputs, before):
+            book.set(name, value)
+        self.assertEqual(book.mismatches(), [])
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_settings_do_not_stay(self):
+        book = spreadsheet.load()
+        before = [book.get(name) for name in outputs]
+        settings = [('cells_series', 50.0)]
+        scenarios = [[1.0], [2.0]]
+
+        serial = spreadsheet.sweep(
+            spreadsheet.default_path, ['cells_parallel'], scenarios, outputs, settings
+        )
+        self.assertEqual([book.get(name) for name in outputs], before)
+        self.assertEqual(book.get('cells_series'), 43.0)
+
+        parallel = spreadsheet.sweep(
+            spreadsheet.default_path, ['cells_parallel'], scenarios, outputs, settings, 2
+        )
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial[0][0], 50.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Tests of parameter sweeps over car variants.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import efficiency
+import numpy
+import StringIO
+import sweep
+import synthetic
+import track_gpx
+import track_physics
+import unittest
+
+
+def kinematics():
+    "Kinematics of a short synthetic track."
+    file = StringIO.StringIO()
+    synthetic.Route(length=3).write(file)
+    file.seek(0)
+    file.name = 'synthetic.gpx'
+    track, = track_gpx.Commute(track_gpx.Car(), [file]).tracks
+    return track.kinematics
+
+
+class SweepTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.kinematics = kinematics()
+        cls.car = track_gpx.Car()
+        cls.table = sweep.grid(
+            mass=[700, 880, 1200],
+            cx=[0.3, 0.37],
+            regen_efficiency=[0, 0.5],
+        )
+
+    def test_variants_match_single_cars(self):
+        swept = sweep.sweep(self.kinematics, self.table, self.car)
+        for row in swept:
+            car = track_gpx.Car()
+            for name in self.table.dtype.names:
+                setattr(car, name, float(row[name]))
+            dynamics = track_physics.Dynamics(self.kinematics, car)
+            self.assertAlmostEqual(
+                row['energy'], dynamics.energy.sum() / 3600, 6
+            )
+            self.assertAlmostEqual(
+                row['average_motor_power'], dynamics.motor_power.mean(), 6
+            )
+
+    def test_car_subclass(self):
+        car = efficiency.MappedCar(efficiency.EfficiencyMap.model(fixed_loss=1000))
+        # cached quantities of the car must not stand for the variants
+        car.cda
+        car.weight
+        swept = sweep.sweep(self.kinematics, self.table, car)
+        for row in swept:
+            variant = efficiency.MappedCar(car.efficiency_map)
+            for name in self.table.dtype.names:
+                setattr(variant, name, float(row[name]))
+            dynamics = track_physics.Dynamics(self.kinematics, variant)
+            self.assertAlmostEqual(
+                row['energy'], dynamics.energy.sum() / 3600, 6
+            )
+
+    def test_invalid_variant(self):
+        table = sweep.grid(mass=[880, 1e6])
+        swept = sweep.sweep(self.kinematics, table, self.car)
+        for name in sweep.metrics:
+            self.assertTrue(numpy.isfinite(swept[name][0]))
+            self.assertTrue(numpy.isnan(swept[name][1]))
+
+    def test_workers(self):
+        block = sweep.block
+        sweep.block = len(self.kinematics) * 2
+        try:
+            serial = sweep.sweep(self.kinematics, self.table, self.car)
+            parallel = sweep.sweep(self.kinematics, self.table, self.car, 3)
+        finally:
+            sweep.block = block
+        self.assertEqual(serial.tolist(), parallel.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
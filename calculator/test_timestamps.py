@@ -0,0 +1,115 @@
+"""
+Tests of the batched timestamp decoding against datetime parsing.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import datetime
+import re
+import timestamps
+import unittest
+
+epoch = datetime.datetime(1970, 1, 1)
+
+
+def reference(timestamp):
+    """Seconds since the epoch of a timestamp, parsed point by point
+    with datetime.strptime like the points used to be."""
+    match = re.match(r'(.{19})(\.\d+)?(Z|[+-]\d\d(?::?\d\d)?)?$', timestamp)
+    when, fraction, zone = match.groups()
+    time = datetime.datetime.strptime(
+        when.replace(' ', 'T') + (fraction or '.0'), '%Y-%m-%dT%H:%M:%S.%f'
+    )
+    if zone and zone != 'Z':
+        digits = zone[1:].replace(':', '')
+        offset = datetime.timedelta(
+            hours=int(digits[:2]), minutes=int(digits[2:] or 0)
+        )
+        time = time - offset if zone[0] == '+' else time + offset
+    return (time - epoch).total_seconds()
+
+
+def times(count, layout, start=1367391600, step=1.25):
+    "Timestamps of the layout, a strftime format possibly with %%f."
+    result = []
+    for index in xrange(count):
+        time = epoch + datetime.timedelta(seconds=start + index * step)
+        result.append(time.strftime(layout))
+    return result
+
+
+class ParseTest(unittest.TestCase):
+
+    def assertParsed(self, values):
+        parsed = timestamps.parse(values)
+        self.assertEqual(len(parsed), len(values))
+        for value, seconds in zip(values, parsed):
+            self.assertAlmostEqual(seconds, reference(value), 6, value)
+            self.assertAlmostEqual(
+                timestamps.parse_one(value), reference(value), 6, value
+            )
+
+    def test_fractions(self):
+        self.assertParsed(times(100, '%Y-%m-%dT%H:%M:%S.%fZ'))
+        self.assertParsed([value[:-4] + 'Z' for value in times(100, '%Y-%m-%dT%H:%M:%S.%fZ')])
+        self.assertParsed(times(100, '%Y-%m-%dT%H:%M:%SZ'))
+        self.assertParsed(times(10, '%Y-%m-%d %H:%M:%S'))
+
+    def test_zones(self):
+        for zone in '+02:00', '-05:30', '+0100', '-03', 'Z':
+            self.assertParsed(times(50, '%Y-%m-%dT%H:%M:%S.%f' + zone))
+            self.assertParsed(times(50, '%Y-%m-%dT%H:%M:%S' + zone))
+
+    def test_dates(self):
+        # leap days, the ends of years and centuries
+        self.assertParsed([
+            '2000-02-29T12:00:00Z',
+            '1999-12-31T23:59:59.999Z',
+            '2100-03-01T00:00:00Z',
+            '1970-01-01T00:00:00Z',
+            '2016-02-29T23:59:59+01:00',
+        ])
+
+    def test_mixed(self):
+        # lengths and layouts change within the batch, and strings of
+        # the same length as a good layout fail its checks
+        values = times(20, '%Y-%m-%dT%H:%M:%S.%fZ') + [
+            '2013-05-01T07:00:00Z',
+            '2013-05-01T07:00:00.5+02:00',
+            '2013-05-01 07:00:00.250Z',
+            '2013-05-01T07:00:00.123456-0130',
+            '2013-05-01T07:00:00',
+        ] + times(20, '%Y-%m-%dT%H:%M:%SZ')
+        self.assertParsed(values)
+
+    def test_fallback(self):
+        # the first string of a length sets the layout of the others
+        values = ['2013-05-01T07:00:00+02:00', '2013-05-01T07:00:00.1234Z']
+        self.assertParsed(values)
+        self.assertParsed(values[::-1])
+
+    def test_invalid(self):
+        self.assertEqual(len(timestamps.parse([])), 0)
+        for value in '2013-13-01T07:00:00Z', 'yesterday', '2013-05-01T07:00Z':
+            self.assertRaises(ValueError, timestamps.parse, [value])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Tests of tracks read from GPX files.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import subprocess
+import synthetic
+import sys
+import tempfile
+import track_cache
+import track_gpx
+import unittest
+
+from utils import LRUCache
+
+
+class TrackTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.files = []
+        for seed, segments in enumerate((1, 3)):
+            name = os.path.join(cls.directory, 'track%d.gpx' % seed)
+            with open(name, 'w') as file:
+                synthetic.Route(
+                    length=3, segments=segments, seed=seed
+                ).write(file)
+            cls.files.append(name)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_segments(self):
+        commute = track_gpx.Commute(track_gpx.Car(), self.files[1:])
+        track, = commute.tracks
+        starts = list(track.columns.starts)
+        self.assertEqual(len(starts), 3)
+
+        points = track.points
+        self.assertAlmostEqual(
+            sum(point.distance for point in points) / 1000, track.distance, 9
+        )
+        for start in starts:
+            self.assertEqual(points[start].flat_distance, 0)
+            self.assertEqual(points[start].climb, 0)
+            self.assertEqual(points[start].distance, 0)
+
+    def test_workers(self):
+        car = track_gpx.Car()
+        serial = track_gpx.Commute(car, self.files)
+        parallel = track_gpx.Commute(car, self.files, workers=2)
+        for track, summary in zip(serial.tracks, parallel.tracks):
+            self.assertIsInstance(summary, track_gpx.Summary)
+            self.assertEqual(track.stats, summary.stats)
+        self.assertEqual(serial.stats, parallel.stats)
+        for name, histogram in serial.distributions.iteritems():
+            self.assertEqual(
+                histogram.counts.tolist(),
+                parallel.distributions[name].counts.tolist()
+            )
+
+    def test_points_match_columns(self):
+        track, = track_gpx.Commute(track_gpx.Car(), self.files[1:]).tracks
+        columns = track.columns
+        points = track.points
+        for name in (
+            'distance',
+            'speed',
+            'acceleration',
+            'force',
+            'power_at_wheels',
+            'motor_power',
+            'energy',
+        ):
+            values = [getattr(point, name) for point in points]
+            for value, column_value in zip(values, getattr(columns, name)):
+                self.assertAlmostEqual(
+                    value, column_value, delta=1e-9 * max(1, abs(column_value))
+                )
+
+    def test_track_cache(self):
+        cache = track_cache.TrackCache(os.path.join(self.directory, 'cache'))
+        kinematics_cache = track_gpx.Track.kinematics_cache
+        try:
+            track_gpx.Track.track_cache = cache
+            stats = []
+            for run in xrange(2):
+                # parsed in the first run, loaded from the cache in the second
+                track_gpx.Track.kinematics_cache = LRUCache(16)
+                commute = track_gpx.Commute(track_gpx.Car(), self.files)
+                stats.append(commute.stats)
+                for track in commute.tracks:
+                    self.assertIn(track.digest, cache)
+        finally:
+            track_gpx.Track.track_cache = None
+            track_gpx.Track.kinematics_cache = kinematics_cache
+        self.assertEqual(stats[0], stats[1])
+
+    def test_cli_drivetrain(self):
+        "--gear-ratio and --wheel-radius count without an efficiency map too."
+        outputs = []
+        for arguments in [], ['--gear-ratio', '9'], ['--gear-ratio', '5'], \
+                ['--wheel-radius', '0.35']:
+            output = os.path.join(self.directory, 'operating_points.json')
+            subprocess.check_call(
+                [sys.executable, track_gpx.__file__.replace('.pyc', '.py'),
+                 '--no-cache', '--operating-points', output, self.files[0]]
+                + arguments,
+                stdout=open(os.devnull, 'w')
+            )
+            with open(output) as file:
+                outputs.append(file.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertNotEqual(outputs[1], outputs[2])
+        self.assertNotEqual(outputs[1], outputs[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Tests of the sliding window aggregates against brute force.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy
+import unittest
+import windows
+
+
+class Columns(object):
+    "Just enough of track columns for the windows."
+
+    def __init__(self, count, seed=0):
+        random = numpy.random.RandomState(seed)
+        self.time = numpy.cumsum(random.randint(0, 4, count)).astype(float)
+        self.distance = random.uniform(0, 30, count)
+        self.distance[random.random_sample(count) < 0.1] = 0
+        self.value = random.normal(0, 1, count)
+        # ties make the extremes deques drop equal values
+        self.value[random.random_sample(count) < 0.2] = 0.5
+
+    def __len__(self):
+        return len(self.time)
+
+    def head(self, count):
+        "Columns of the first count points."
+        head = Columns(0)
+        for name in 'time', 'distance', 'value':
+            setattr(head, name, getattr(self, name)[:count])
+        return head
+
+
+shapes = (
+    ('points', 1), ('points', 5), ('points', 40),
+    ('seconds', 0), ('seconds', 7), ('seconds', 60),
+    ('metres', 25), ('metres', 300),
+)
+
+
+def brute_force(columns, unit, width):
+    "Windows of values, each as a list, listed one by one."
+    values = columns.value
+    count = len(values)
+    if unit == 'points':
+        return [
+            (first, values[first:first + width])
+            for first in xrange(count - width)
+        ]
+
+    positions = windows.positions(columns, unit)
+    result = []
+    for first in xrange(count):
+        end = positions[first] + width
+        if end > positions[-1]:
+            # incomplete, no point past it
+            break
+        inside = (positions >= positions[first]) & (positions <= end)
+        inside[:first] = False
+        result.append((first, values[inside]))
+    return result
+
+
+class AggregatesTest(unittest.TestCase):
+
+    def test_aggregates(self):
+        columns = Columns(500)
+        functions = {'mean': numpy.mean, 'min': numpy.min, 'max': numpy.max}
+        for unit, width in shapes:
+            expected = brute_force(columns, unit, width)
+            for name, function in functions.iteritems():
+                values, first, last = windows.aggregate(
+                    columns, 'value', width, unit, name
+                )
+                self.assertEqual(
+                    list(first), [index for (index, window) in expected]
+                )
+                self.assertEqual(
+                    list(last - first + 1),
+                    [len(window) for (index, window) in expected]
+                )
+                numpy.testing.assert_allclose(
+                    values,
+                    [function(window) for (index, window) in expected]
+                )
+
+    def test_stacked(self):
+        stack = numpy.random.RandomState(1).normal(0, 1, (3, 2, 200))
+        first, last = windows.bounds(200, 17)
+        for name in ('min', 'max'):
+            values = windows.aggregates[name](stack, first, last)
+            self.assertEqual(values.shape, (3, 2, len(first)))
+            for row, result in zip(stack.reshape(6, -1), values.reshape(6, -1)):
+                numpy.testing.assert_array_equal(
+                    result, windows.aggregates[name](row, first, last)
+                )
+
+
+class RunningTest(unittest.TestCase):
+
+    def test_running_matches_peaks(self):
+        columns = Columns(400, seed=2)
+        # checked after these many points, the peaks of the feed so far
+        checks = 57, 58, 131, 290, 400
+        for unit, width in shapes:
+            positions = windows.positions(columns, unit)
+            for aggregate in windows.aggregates:
+                for peak in ('min', 'max'):
+                    window = windows.Window('value', width, unit, aggregate, peak)
+                    running = windows.Running(window)
+                    for index, point in enumerate(columns.value):
+                        running.add(
+                            point,
+                            None if positions is None else positions[index],
+                            index
+                        )
+                        if index + 1 in checks:
+                            value, first, last = windows.peaks(
+                                columns.head(index + 1), {'peak': window}
+                            )['peak']
+                            self.assertAlmostEqual(running.peak[0], value)
+                            self.assertEqual(running.peak[1:], (first, last))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+"""
+Batched decoding of ISO 8601 timestamps into seconds since the epoch.
+
+GPX files hold one <time> per point, nearly always in the same layout,
+so timestamps are decoded a batch at a time: strings sharing a length
+are laid out as a matrix of characters and their fields are read by
+column. Strings not fitting the layout of their batch go through the
+slower regular expression path.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import calendar
+import numpy
+import re
+
+pattern = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(\.\d+)?'
+    r'(Z|[+-]\d\d(?::?\d\d)?)?$'
+)
+
+
+def parse_one(timestamp):
+    "Seconds since the epoch of a single timestamp."
+    match = pattern.match(timestamp.strip())
+    if not match:
+        raise ValueError('invalid timestamp: %r' % timestamp)
+
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    seconds = calendar.timegm((
+        int(year), int(month), int(day),
+        int(hour), int(minute), int(second)
+    ))
+    if fraction:
+        seconds += float(fraction)
+    if zone and zone != 'Z':
+        offset = int(zone[1:3]) * 3600 + int(zone[-2:] if len(zone) > 3 else 0) * 60
+        if zone[0] == '+':
+            seconds -= offset
+        else:
+            seconds += offset
+    return float(seconds)
+
+
+def days_from_civil(year, month, day):
+    "Days since the epoch of proleptic Gregorian dates."
+    # http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * (month + numpy.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def layout(timestamp):
+    """Positions of the fraction digits and the zone offset
+    in timestamps laid out like the given one."""
+    fraction = []
+    position = 19
+    if timestamp[position:position + 1] == '.':
+        position += 1
+        while timestamp[position:position + 1].isdigit():
+            fraction.append(position)
+            position += 1
+        if not fraction:
+            return None
+
+    zone = timestamp[position:]
+    if zone in ('', 'Z'):
+        return fraction, None
+    elif re.match(r'[+-]\d\d(:?\d\d)?$', zone):
+        return fraction, (position, len(zone))
+    else:
+        return None
+
+
+def parse(timestamps):
+    "Seconds since the epoch of a sequence of timestamps."
+    result = numpy.empty(len(timestamps))
+    if not len(timestamps):
+        return result
+
+    chars = numpy.array(timestamps, dtype=str)
+    lengths = numpy.char.str_len(chars)
+    matrix = chars.view(numpy.uint8).reshape(len(chars), -1)
+    # digits become 0-9, anything else lands outside of that range
+    digits = matrix.astype(numpy.int64) - ord('0')
+
+    def number(rows, first, count):
+        value = numpy.zeros(len(rows), numpy.int64)
+        for column in xrange(first, first + count):
+            value = value * 10 + digits[rows, column]
+        return value
+
+    def is_digit(rows, columns):
+        cells = digits[rows][:, columns]
+        return ((cells >= 0) & (cells <= 9)).all(axis=1)
+
+    fallback = numpy.zeros(len(chars), bool)
+
+    for length in numpy.unique(lengths):
+        rows = numpy.flatnonzero(lengths == length)
+        positions = layout(str(chars[rows[0]])) if length >= 19 else None
+        if positions is None:
+            fallback[rows] = True
+            continue
+        fraction, zone = positions
+
+        valid = is_digit(rows, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18] + fraction)
+        for column, separators in ((4, '-'), (7, '-'), (10, 'T '), (13, ':'), (16, ':')):
+            valid &= numpy.in1d(matrix[rows, column], [ord(c) for c in separators])
+        if fraction:
+            valid &= matrix[rows, 19] == ord('.')
+        if zone:
+            position, size = zone
+            valid &= numpy.in1d(matrix[rows, position], [ord('+'), ord('-')])
+            valid &= is_digit(rows, [position + 1, position + 2] + (
+                [position + size - 2, position + size - 1] if size > 3 else []
+            ))
+            if size == 6:
+                valid &= matrix[rows, position + 3] == ord(':')
+        elif length > 19 + bool(fraction) + len(fraction):
+            valid &= matrix[rows, length - 1] == ord('Z')
+
+        month = number(rows, 5, 2)
+        day = number(rows, 8, 2)
+        hour = number(rows, 11, 2)
+        minute = number(rows, 14, 2)
+        second = number(rows, 17, 2)
+        valid &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+        valid &= (hour < 24) & (minute < 60) & (second <= 60)
+
+        fallback[rows[~valid]] = True
+        rows = rows[valid]
+
+        seconds = days_from_civil(number(rows, 0, 4), month[valid], day[valid]) * 86400
+        seconds += hour[valid] * 3600 + minute[valid] * 60 + second[valid]
+        if zone:
+            position, size = zone
+            offset = number(rows, position + 1, 2) * 3600
+            if size > 3:
+                offset += number(rows, position + size - 2, 2) * 60
+            sign = numpy.where(matrix[rows, position] == ord('-'), -1, 1)
+            seconds -= sign * offset
+
+        result[rows] = seconds
+        if fraction:
+            result[rows] += number(rows, fraction[0], len(fraction)) / 10.0 ** len(fraction)
+
+    for index in numpy.flatnonzero(fallback):
+        result[index] = parse_one(timestamps[index])
+
+    return result
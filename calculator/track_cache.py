@@ -0,0 +1,139 @@
+"""
+On-disk cache of parsed tracks.
+
+Columns of a track are stored as a single float64 .npy matrix named
+after the digest of the GPX file and the format version, and are
+memory-mapped when loaded, so a cached track costs no XML parsing.
+Loading a track marks it as recently used; the least recently used
+tracks are removed when the cache outgrows its size.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import errno
+import numpy
+import os
+import tempfile
+
+# Bump when the stored rows change.
+version = 1
+
+# Rows of the stored matrix, the segment row is 1 at segment starts.
+rows = ('lat', 'lon', 'elevation', 'time', 'segment')
+
+# Derived kinematics stored as further rows, when enabled.
+derived_rows = ('flat_distance',)
+
+default_directory = os.environ.get(
+    'GPX2ENERGY_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'gpx2energy')
+)
+
+
+class TrackCache(object):
+    "Least recently used, size bounded cache of parsed tracks."
+
+    def __init__(self, directory=default_directory, size=256 << 20,
+                 derived=True):
+        self.directory = directory
+        self.size = size
+        self.derived = derived
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+
+    def path(self, digest):
+        "Path of the cache file of a track."
+        return os.path.join(
+            self.directory,
+            '%s-v%d.npy' % (digest, version)
+        )
+
+    def __contains__(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def load(self, digest):
+        "Columns of a cached track or None."
+        path = self.path(digest)
+        try:
+            matrix = numpy.load(path, mmap_mode='r')
+            # the modification time orders tracks by their last use
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        columns = dict(zip(rows + derived_rows, matrix))
+        columns['starts'] = numpy.flatnonzero(columns.pop('segment'))
+        return columns
+
+    def store(self, digest, kinematics):
+        "Stores columns of track kinematics."
+        segment = numpy.zeros(len(kinematics))
+        segment[kinematics.starts] = 1
+        matrix = [
+            kinematics.lat,
+            kinematics.lon,
+            kinematics.elevation,
+            kinematics.time,
+            segment,
+        ]
+        if self.derived:
+            matrix.extend(getattr(kinematics, row) for row in derived_rows)
+
+        # write to a temporary file first, so that readers
+        # never see a partially written track
+        descriptor, temporary = tempfile.mkstemp(
+            dir=self.directory,
+            suffix='.tmp'
+        )
+        with os.fdopen(descriptor, 'wb') as file:
+            numpy.save(file, numpy.vstack(matrix))
+        os.rename(temporary, self.path(digest))
+
+        self.evict()
+
+    def entries(self):
+        "(modification time, size, path) of all cached tracks."
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        "Removes least recently used tracks until the cache fits its size."
+        entries = sorted(self.entries())
+        total = sum(size for (mtime, size, path) in entries)
+        for mtime, size, path in entries:
+            if total <= self.size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -24,44 +24,68 @@ License:
     along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-import datetime
-import math
-import sys
+import StringIO
+import argparse
+import efficiency
+import array
+import hashlib
+import json
+import multiprocessing
+import numpy
+import preprocessing
 import urllib
+import timestamps
+import track_cache
 import track_physics
-import xml.etree.ElementTree
+import xml.etree.cElementTree
 
-from utils import prop, print_stats
+import utils
+from utils import prop, slot_prop, cache_slots, print_stats, LRUCache
 
 gpx_namespaces = {'gpx': 'http://www.topografix.com/GPX/1/1'}
 
 Earth = track_physics.Earth
 Car = track_physics.Car
 
+
+def map_url(point, other=None):
+    """Google maps URL of a point or a route from the point to another,
+    points being anything with lat and lon."""
+
+    url = 'https://maps.google.pl/maps?%s'
+    if other:
+        query = 'from: %s %s to: %s %s' % (
+            point.lat, point.lon,
+            other.lat, other.lon
+        )
+    else:
+        query = '%s %s' % (point.lat, point.lon)
+    return url % urllib.urlencode({'q': query})
+
+
 class Point(track_physics.Point):
     "Class representing a single point of a track."
 
-    gpx_path = '{%s}trkpt' % gpx_namespaces['gpx']
-    ele_path = '{%s}ele' % gpx_namespaces['gpx']
-    time_path = '{%s}time' % gpx_namespaces['gpx']
-
-    def __init__(self, track, index, trkpt):
+    def __init__(self, track, index):
         self.track = track
-        self.car = track.car
         self.index = index
-        self.lat = float(trkpt.attrib['lat'])
-        self.lon = float(trkpt.attrib['lon'])
-        self.elevation = float(trkpt.find(self.ele_path).text)
-        time = trkpt.find(self.time_path).text
-        self.time = datetime.datetime.strptime(time[:-1],'%Y-%m-%dT%H:%M:%S.%f')
+        columns = track.columns
+        self.lat = float(columns.lat[index])
+        self.lon = float(columns.lon[index])
+        self.elevation = float(columns.elevation[index])
+        self.time = float(columns.time[index])
 
-    @prop
+    @property
+    def car(self):
+        return self.track.car
+
+    @slot_prop
     def previous(self):
         "Previous point of the track."
         if self.index > 0:
             return self.track.points[self.index - 1]
 
-    @prop
+    @slot_prop
     def next(self):
         "Next point of the track."
         if self.index < len(self.track.points) - 1:
@@ -70,35 +94,12 @@ class Point(track_physics.Point):
     def url(self, other=None):
         """Google maps URL of the point or
         a route from the point to another."""
+        return map_url(self, other)
 
-        url = 'https://maps.google.pl/maps?%s'
-        if other:
-            query = 'from: %s %s to: %s %s' % (
-                self.lat, self.lon,
-                other.lat, other.lon
-            )
-        else:
-            query = '%s %s' % (self.lat, self.lon)
-        return url % urllib.urlencode({'q': query})
-
-    @prop
+    @slot_prop
     def flat_distance(self):
         "Distance from the previous point as seen from the sky [m]."
-        # http://en.wikipedia.org/wiki/Haversine_formula
-        
-        if self.previous:
-            dlat = math.radians(self.lat - self.previous.lat)
-            dlon = math.radians(self.lon - self.previous.lon)
-
-            a = math.sin(dlat/2) ** 2 + math.cos(math.radians(self.lat)) \
-                * math.cos(math.radians(self.previous.lat)) * \
-                math.sin(dlon/2) ** 2
-
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-
-            return Earth.radius * c
-        else:
-            return 0
+        return float(self.track.columns.flat_distance[self.index])
 
     def __repr__(self):
         return '%s(%f, %f)' % (
@@ -107,18 +108,144 @@ class Point(track_physics.Point):
             self.lon
         )
 
+    __slots__ = (
+        'track',
+        'index',
+        'lat',
+        'lon',
+        'elevation',
+        'time',
+    ) + cache_slots(locals())
+
+
+class Kinematics(track_physics.Kinematics):
+    "Car independent quantities of the points of a track."
+
+    trkseg_tag = '{%s}trkseg' % gpx_namespaces['gpx']
+    trkpt_tag = '{%s}trkpt' % gpx_namespaces['gpx']
+    ele_path = '{%s}ele' % gpx_namespaces['gpx']
+    time_path = '{%s}time' % gpx_namespaces['gpx']
+
+    # <time> strings are decoded in batches of this many
+    batch = 8192
+
+    def __init__(self, columns, max_speed, preprocessing=None):
+        """Kinematics of columns, a mapping from lat, lon, elevation,
+        time, starts and possibly precomputed quantities to arrays."""
+        vars(self).update(columns)
+        self.max_speed = max_speed
+        self.preprocessing = preprocessing
+
+    @classmethod
+    def read(cls, file):
+        "Columns of points read from a GPX file."
+        lat = array.array('d')
+        lon = array.array('d')
+        elevation = array.array('d')
+        time = array.array('d')
+        starts = array.array('l')
+        times = []
+
+        # Stream the document, so that only the current trkpt
+        # is held in memory and points of all the trk/trkseg
+        # blocks get read straight into the arrays.
+        segment = None
+        events = xml.etree.cElementTree.iterparse(file, ('start', 'end'))
+        for event, element in events:
+            if event == 'start':
+                if element.tag == cls.trkseg_tag:
+                    segment = element
+                    starts.append(len(lat))
+            elif element.tag == cls.trkpt_tag:
+                lat.append(float(element.attrib['lat']))
+                lon.append(float(element.attrib['lon']))
+                elevation.append(float(element.find(cls.ele_path).text))
+                times.append(element.find(cls.time_path).text)
+                if len(times) == cls.batch:
+                    time.fromstring(timestamps.parse(times).tostring())
+                    del times[:]
+                if segment is not None:
+                    segment.clear()
+            elif element.tag == cls.trkseg_tag:
+                segment = None
+                if starts[-1] == len(lat):
+                    # empty segment
+                    starts.pop()
+
+        time.fromstring(timestamps.parse(times).tostring())
+
+        return {
+            'lat': numpy.frombuffer(lat),
+            'lon': numpy.frombuffer(lon),
+            'elevation': numpy.frombuffer(elevation),
+            'time': numpy.frombuffer(time),
+            'starts': numpy.frombuffer(starts, long),
+        }
+
+    @prop
+    def flat_distance(self):
+        "Distance from the previous point as seen from the sky [m]."
+        # http://en.wikipedia.org/wiki/Haversine_formula
+        lat = numpy.radians(self.lat)
+        previous_lat = numpy.empty(len(self))
+        previous_lat[0] = lat[0]
+        previous_lat[1:] = lat[:-1]
+
+        dlat = lat - previous_lat
+        dlon = numpy.zeros(len(self))
+        dlon[1:] = numpy.radians(numpy.diff(self.lon))
+
+        a = numpy.sin(dlat/2) ** 2 + numpy.cos(lat) \
+            * numpy.cos(previous_lat) * \
+            numpy.sin(dlon/2) ** 2
+
+        c = 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1-a))
+        c[self.starts] = 0
+
+        return Earth.radius * c
+
+
+def digest(file):
+    "SHA-1 digest of the contents of a file or a file name."
+    sha1 = hashlib.sha1()
+    if hasattr(file, 'read'):
+        for chunk in iter(lambda: file.read(1 << 16), ''):
+            sha1.update(chunk)
+        file.seek(0)
+    else:
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), ''):
+                sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class CachedFile(object):
+    """A GPX file known only by its digest, standing in for the file
+    of a track which is in the kinematics or the parsed track cache."""
+
+    def __init__(self, digest, name=None):
+        self.digest = digest
+        self.name = name or digest
+
+    def read(self, size=-1):
+        raise IOError('track %s is not cached' % self.digest)
+
 
 class Track(track_physics.Track):
     "Class representing a track recorded with a GPS device."
 
-    gpx_path = '{%s}trk/{%s}trkseg' % (
-        gpx_namespaces['gpx'],
-        gpx_namespaces['gpx']
-    )
+    # Kinematics of recently used tracks keyed by file digest,
+    # max_speed and preprocessing, so that re-running a track
+    # for another car only computes the dynamics.
+    kinematics_cache = LRUCache(16)
+
+    # Optional track_cache.TrackCache keeping parsed columns on disk.
+    track_cache = None
 
     def __init__(self, commute, file):
         self.commute = commute
         self.car = commute.car
+        self.preprocessing = getattr(commute, 'preprocessing', None)
         if hasattr(file, 'read'):
             self.file = file
             self.filename = self.file.name
@@ -126,27 +253,68 @@ class Track(track_physics.Track):
             self.file = file
             self.filename = file
 
-    @property
-    def tree(self):
-        "Parsed XML tree."
-        return xml.etree.ElementTree.parse(self.file)
+    @prop
+    def digest(self):
+        "SHA-1 digest of the GPX file."
+        if isinstance(self.file, CachedFile):
+            return self.file.digest
+        return digest(self.file)
+
+    @classmethod
+    def is_cached(cls, digest):
+        "Whether a track of the given digest can be had without its file."
+        if cls.track_cache is not None and digest in cls.track_cache:
+            return True
+        return any(key[0] == digest for key in cls.kinematics_cache.keys())
 
-    @property
-    def trk(self):
-        "Track segment from the XML tree."
-        # For now I assume one trkseg per file.
-        trk, = self.tree.findall(self.gpx_path)
-        return trk
+    @prop
+    def kinematics(self):
+        "Car independent quantities of the track points."
+        preprocessing = self.preprocessing
+        if not preprocessing:
+            return self.raw_kinematics
+
+        key = self.digest, self.car.max_speed, preprocessing.key
+        kinematics = self.kinematics_cache.get(key)
+        if kinematics is None:
+            kinematics = Kinematics(
+                preprocessing.columns(self.raw_kinematics),
+                self.car.max_speed,
+                preprocessing
+            )
+            self.kinematics_cache[key] = kinematics
+        return kinematics
 
     @prop
-    def points(self):
-        "A list of track points."
-        trkpts = self.trk.findall(Point.gpx_path)
-        return  [
-            Point(self, index, trkpt) for
-            (index, trkpt) in enumerate(trkpts)
-        ]
-        
+    def raw_kinematics(self):
+        "Car independent quantities of the track points as recorded."
+        key = self.digest, self.car.max_speed
+        kinematics = self.kinematics_cache.get(key)
+        if kinematics is None:
+            columns = None
+            if self.track_cache is not None:
+                columns = self.track_cache.load(self.digest)
+
+            if columns is None:
+                columns = Kinematics.read(self.file)
+                kinematics = Kinematics(columns, self.car.max_speed)
+                if self.track_cache is not None:
+                    self.track_cache.store(self.digest, kinematics)
+            else:
+                kinematics = Kinematics(columns, self.car.max_speed)
+
+            self.kinematics_cache[key] = kinematics
+        return kinematics
+
+    @prop
+    def columns(self):
+        "Track points in columnar form."
+        return track_physics.Dynamics(self.kinematics, self.car)
+
+    def point(self, index):
+        "A single point of the track."
+        return Point(self, index)
+
     @prop
     def stats(self):
         "Track stats."
@@ -180,22 +348,99 @@ class Track(track_physics.Track):
         }
 
 
+class Summary(object):
+    """Compact results of a track computed in a worker process,
+    usable in place of the Track by the Commute aggregates.
+    Peaks are (value,) tuples, without the points.
+
+    Without histograms only the Commute stats can be had of it,
+    the distributions and operating points are not computed."""
+
+    totals = (
+        'distance',
+        'duration',
+        'energy',
+        'average_motor_power',
+    )
+
+    histograms = (
+        'distributions',
+        'speed_power',
+        'operating_points',
+    )
+
+    peaks = (
+        'top_speed',
+        'peak_output_power',
+        'peak_regen_power',
+        'steepest_incline',
+        'steepest_decline',
+    )
+
+    def __init__(self, track, histograms=True):
+        self.filename = track.filename
+        self.stats = track.stats
+        attributes = self.totals
+        if histograms:
+            attributes += self.histograms
+        for attribute in attributes:
+            setattr(self, attribute, getattr(track, attribute))
+        for attribute in self.peaks:
+            setattr(self, attribute, getattr(track, attribute)[:1])
+
+
+def summarize(job):
+    """Summary of a track for a (car, file, preprocessing) job,
+    file being a file name or a (name, contents) pair."""
+    car, file, preprocessing = job
+    if isinstance(file, tuple):
+        name, contents = file
+        file = StringIO.StringIO(contents)
+        file.name = name
+    track, = Commute(car, [file], preprocessing=preprocessing).tracks
+    return Summary(track)
+
+
 class Commute(track_physics.Commute):
     """Groups together tracks, for example two tracks
-    for both directions of the commute."""
+    for both directions of the commute.
+
+    With more than one worker the tracks are parsed and computed
+    in worker processes, and are represented by their Summaries."""
 
-    def __init__(self, car, files):
+    def __init__(self, car, files, workers=1, preprocessing=None):
         self.car = car
         self.files = files
+        self.workers = workers
+        self.preprocessing = preprocessing
 
     @prop
     def tracks(self):
         "Tracks making up this commute."
+        if self.workers > 1 and len(self.files) > 1:
+            return self.summaries
         tracks = []
         for file in self.files:
             tracks.append(Track(self, file))
         return tracks
 
+    @prop
+    def summaries(self):
+        "Summaries of the tracks computed by a pool of workers."
+        jobs = []
+        for file in self.files:
+            if hasattr(file, 'read'):
+                # open files can't be sent to another process
+                file = file.name, file.read()
+            jobs.append((self.car, file, self.preprocessing))
+
+        pool = multiprocessing.Pool(min(self.workers, len(jobs)))
+        try:
+            return pool.map(summarize, jobs, 1)
+        finally:
+            pool.close()
+            pool.join()
+
     @prop
     def stats(self):
         "Commute stats."
@@ -216,18 +461,116 @@ class Commute(track_physics.Commute):
 
 if __name__ == '__main__':
 
-    if len(sys.argv) > 1:
-        commute = Commute(Car(), sys.argv[1:])
+    parser = argparse.ArgumentParser(
+        description='Calculate power and energy needs of a commute.'
+    )
+    parser.add_argument('files', metavar='file.gpx', nargs='+')
+    parser.add_argument('--workers', type=int, default=1,
+        help='number of worker processes computing tracks')
+    parser.add_argument('--cache', metavar='DIRECTORY',
+        default=track_cache.default_directory,
+        help='directory of the parsed track cache')
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=256,
+        help='size limit of the parsed track cache')
+    parser.add_argument('--no-cache', action='store_true',
+        help='always parse the GPX files')
+    parser.add_argument('--preprocess', metavar='STAGES',
+        type=preprocessing.Preprocessing.parse,
+        help='smoothing and resampling of the tracks, for example '
+             'resample=distance:10,elevation=savgol:15:2,speed=mean:5 '
+             '(see preprocessing.py)')
+    parser.add_argument('--efficiency-map', metavar='CSV', nargs='?', const='',
+        help='use a motor and inverter efficiency map (see efficiency.py), '
+             'the example model map if no file is given')
+    parser.add_argument('--gear-ratio', type=float,
+        help='motor revolutions per wheel revolution')
+    parser.add_argument('--wheel-radius', metavar='M', type=float,
+        help='radius of the driven wheels')
+    parser.add_argument('--distributions', metavar='FILE',
+        type=argparse.FileType('w'),
+        help='write histograms and percentiles of time spent at powers '
+             'and speeds of the tracks and the commute as JSON')
+    parser.add_argument('--operating-points', metavar='FILE',
+        type=argparse.FileType('w'),
+        help='write time spent at motor speeds and torques of the tracks '
+             'and the commute, as CSV if FILE ends with .csv, else JSON')
+    parser.add_argument('--profile', action='store_true',
+        help='print accesses and computation times of cached properties '
+             '(of this process only, with --workers 1 that is all of them)')
+    options = parser.parse_args()
+
+    if options.profile:
+        utils.start_profiling()
+
+    if not options.no_cache:
+        Track.track_cache = track_cache.TrackCache(
+            options.cache,
+            options.cache_size << 20
+        )
 
-        for track in commute.tracks:
-            print 'Track', track.filename
-            print_stats(track.stats)
-            print
+    car = Car()
+    if options.efficiency_map is not None:
+        car = efficiency.MappedCar(
+            options.efficiency_map and
+            efficiency.EfficiencyMap.load(options.efficiency_map) or None
+        )
+    if options.gear_ratio:
+        car.gear_ratio = options.gear_ratio
+    if options.wheel_radius:
+        car.wheel_radius = options.wheel_radius
+
+    commute = Commute(
+        car,
+        options.files,
+        options.workers,
+        options.preprocess
+    )
 
-        print 'Total commute'
-        print_stats(commute.stats)
-    else:
-        sys.stderr.write('Usage: %s file.gps [...]\n' % sys.argv[0])
-        sys.exit(1)
-        
+    for track in commute.tracks:
+        print 'Track', track.filename
+        print_stats(track.stats)
+        print
+
+    print 'Total commute'
+    print_stats(commute.stats)
+
+    if options.distributions:
+        json.dump(
+            {
+                'tracks': [
+                    dict(
+                        utils.distributions_json(track),
+                        file=track.filename
+                    )
+                    for track in commute.tracks
+                ],
+                'commute': utils.distributions_json(commute),
+            },
+            options.distributions
+        )
+
+    if options.operating_points:
+        if options.operating_points.name.endswith('.csv'):
+            utils.write_operating_points(
+                [(track.filename, track.operating_points) for track in commute.tracks] +
+                [('commute', commute.operating_points)],
+                options.operating_points
+            )
+        else:
+            json.dump(
+                {
+                    'tracks': [
+                        dict(
+                            utils.operating_points_json(track.operating_points),
+                            file=track.filename
+                        )
+                        for track in commute.tracks
+                    ],
+                    'commute': utils.operating_points_json(commute.operating_points),
+                },
+                options.operating_points
+            )
 
+    if options.profile:
+        print
+        utils.print_profile(utils.stop_profiling())
@@ -25,7 +25,10 @@ License:
 """
 
 import math
-from utils import prop, total_seconds
+import numpy
+import sketches
+import windows
+from utils import prop, slot_prop, cache_slots, forward_fill
 
 class Earth(object):
     "Class representing the Earth."
@@ -46,6 +49,23 @@ class Car(object):
     """A Car class with example default properties of
     Smart Fortwo W450."""
 
+    # Names of the attributes describing the car.
+    parameters = (
+        'cx',
+        'frontal_area',
+        'mass',
+        'rrc',
+        'power',
+        'max_speed',
+        'battery_pack_efficiency',
+        'controller_efficiency',
+        'motor_efficiency',
+        'gearbox_efficiency',
+        'regen_efficiency',
+        'gear_ratio',
+        'wheel_radius',
+    )
+
     # Drag coefficient
     # http://clubsmartcar.com/index.php?showtopic=9972
     cx = 0.37
@@ -76,6 +96,12 @@ class Car(object):
     # no losses for AC (it is symmetrical)
     regen_efficiency = 1.0
 
+    # motor revolutions per wheel revolution
+    gear_ratio = 9.0
+
+    # http://en.wikipedia.org/wiki/Tire_code, about 175/55 R15
+    wheel_radius = 0.29 # [m]
+
     @prop
     def cda(self):
         "Drag area [m^2]."
@@ -105,132 +131,112 @@ class Car(object):
     @prop
     def total_regen_efficiency(self):
         return self.efficiency * self.regen_efficiency
+
+    def motor_rpm(self, speed):
+        "Motor speed [rpm] at vehicle speeds [m/s]."
+        return speed / (2 * math.pi * self.wheel_radius) * 60 * self.gear_ratio
+
+    def motor_torque(self, force):
+        "Motor torque [Nm] for driving forces [N], regen included."
+        return numpy.abs(force) * self.wheel_radius / self.gear_ratio
+
+    # Efficiencies at points (a Point or a Dynamics), the same at
+    # all of them here; subclasses may vary them with the operating
+    # point, using the speed and the force of the points.
+
+    def electrical_efficiency_at(self, points):
+        return self.electrical_efficiency
+
+    def regen_efficiency_at(self, points):
+        return self.electrical_efficiency_at(points) * \
+               self.mechanical_efficiency * \
+               self.regen_efficiency
         
 
 class Point(object):
     "Class representing a single point of a track."
 
-    @prop
+    # Distances and climbs come from the columns too, which
+    # do not connect the first point of a track segment
+    # to the last one of the previous segment.
+
+    @slot_prop
     def distance(self):
         "Actual road distance from the previous point [m]."
-        # http://en.wikipedia.org/wiki/Pythagorean_theorem
-        return math.sqrt(self.flat_distance**2 + self.climb**2)
+        return float(self.track.columns.distance[self.index])
 
-    @prop
+    @slot_prop
     def climb(self):
         "Height increase [m]."
         # unfortunately my Android phone provides 1m elevation
         # resolution, which affects momentary
         # calculations precision badly
-        if self.previous:
-            return self.elevation - self.previous.elevation
-        else:
-            return 0
+        return float(self.track.columns.climb[self.index])
 
-    @prop
+    # Out of range speeds, accelerations and inclines are replaced
+    # with the value of the previous point. It is done for the whole
+    # track at once, in order, by its columns: looking back from
+    # point to point would recurse through every bad point of a run.
+
+    @slot_prop
     def incline_sine(self):
         "Sine of the climb angle."
-        try:
-            # http://en.wikipedia.org/wiki/Trigonometric_functions#Right-angled_triangle_definitions
-            sine = self.climb / self.distance
-        except ZeroDivisionError:
-            sine = 1
-
-        if -0.25 < sine < 0.25:
-            # reasonable value
-            return sine
-        else:
-            if self.previous:
-                return self.previous.incline_sine
-            else:
-                return 0
+        return float(self.track.columns.incline_sine[self.index])
 
-    @prop
+    @slot_prop
     def incline_cosine(self):
         "Cosine of the climb angle."
-        try:
-            # http://en.wikipedia.org/wiki/Trigonometric_functions#Right-angled_triangle_definitions
-            cosine = self.flat_distance / self.distance
-        except ZeroDivisionError:
-            cosine = 0
-        if 0.75 < cosine <= 1: 
-            # reasonable value
-            return cosine
-        else:
-            if self.previous:
-                return self.previous.incline_cosine
-            else:
-                return 1
+        return float(self.track.columns.incline_cosine[self.index])
 
-    @prop
+    @slot_prop
     def period(self):
         "Time since the previous point [s]."
         if self.previous:
-            return total_seconds(self.time - self.previous.time)
+            return self.time - self.previous.time
         else:
             return 1
 
-    @prop
+    @slot_prop
     def speed(self):
         "Vehicle speed [m/s]."
-        # http://en.wikipedia.org/wiki/Speed#Definition
-        speed = self.distance / self.period
-        if 0 <= speed < self.car.max_speed:
-            return speed
-        elif self.previous:
-            return self.previous.speed
-        else:
-            return 0
-
+        return float(self.track.columns.speed[self.index])
 
-    @prop
+    @slot_prop
     def acceleration(self):
         "Vehicle acceleration [m/s^2]."
-        if self.previous and self.previous.previous:
-            # http://en.wikipedia.org/wiki/Acceleration#Definition_and_properties
-            acceleration = (self.speed - self.previous.speed)/self.period
-        else:
-            acceleration = 0
-
-        # car accelerating/decelerating more than g/2 is unlikely
-        if Earth.g/2 < acceleration < Earth.g/2:
-            return acceleration
-        elif self.previous:
-            return self.previous.acceleration
-        else:
-            return 0
+        return float(self.track.columns.acceleration[self.index])
 
-    @prop
+    @slot_prop
     def air_drag(self):
         "Force of air drag [N]."
         # http://en.wikipedia.org/wiki/Drag_equation
         return 0.5 * Earth.air_density * self.car.cda * self.speed**2
 
-    @prop
+    @slot_prop
     def rolling_resistance(self):
         "Force of rolling resistance [N]."
         # http://en.wikipedia.org/wiki/Rolling_resistance#Rolling_resistance_coefficient
         return self.car.rrc * self.car.weight * self.incline_cosine
 
-    @prop
+    @slot_prop
     def incline_force(self):
         "Gravitational backwards force of the incline [N]."
         # http://en.wikipedia.org/wiki/Inclined_plane#Frictionless_inclined_plane
         return self.car.weight * self.incline_sine
 
 
-    @prop
+    @slot_prop
     def acceleration_force(self):
         "Force needed for acceleration [N]."
         # http://en.wikipedia.org/wiki/Force
         return self.car.mass * self.acceleration
 
-    @prop
+    @slot_prop
     def force(self):
         "Total force generated by the drivetrain [N]."
         return self.air_drag + self.rolling_resistance + self.incline_force + self.acceleration_force
 
-    @prop
+    @slot_prop
     def power_at_wheels(self):
         "Driving power without drivetrain losses [W]."
         # http://en.wikipedia.org/wiki/Power_(physics)#Mechanical_power
@@ -240,7 +246,7 @@ class Point(object):
 
         return power
 
-    @prop
+    @slot_prop
     def output_power(self):
         "Power generated by the motor [W]."
         if self.power_at_wheels > 0:
@@ -248,15 +254,15 @@ class Point(object):
         else:
             return 0
 
-    @prop
+    @slot_prop
     def regen_power(self):
         "Regen power reaching the batteries [W]."
         if self.power_at_wheels > 0:
             return 0
         else:
-            return - self.power_at_wheels * self.car.total_regen_efficiency
+            return - self.power_at_wheels * self.regen_efficiency
 
-    @prop
+    @slot_prop
     def motor_power(self):
         "Motor power requirement [W]."
         if self.power_at_wheels > 0:
@@ -265,36 +271,259 @@ class Point(object):
             # Regen stresses the motor too
             return - self.power_at_wheels * self.car.mechanical_efficiency
 
-    @prop
+    @slot_prop
     def energy(self):
         "Energy used to travel from the previous point [J]."
-        power = self.output_power / self.car.electrical_efficiency
+        power = self.output_power / self.electrical_efficiency
         power -= self.regen_power 
         # http://en.wikipedia.org/wiki/Power_(physics)#Average_power
         return power * self.period
 
+    @slot_prop
+    def electrical_efficiency(self):
+        "Efficiency of the battery, the controller and the motor."
+        return float(self.car.electrical_efficiency_at(self))
+
+    @slot_prop
+    def regen_efficiency(self):
+        "Efficiency of regen from the wheels to the battery."
+        return float(self.car.regen_efficiency_at(self))
+
+    __slots__ = cache_slots(locals())
+
+class Kinematics(object):
+    """Columnar representation of the points of a track,
+    limited to the quantities which do not depend on the car.
+
+    Every property mirrors the one of the same name in Point,
+    but holds an array with values for all the points at once.
+    The only car parameter involved is max_speed, which filters
+    out bad points rather than describing the vehicle."""
+
+    # Indices of the first points of track segments. The first point
+    # of a segment is not connected to the last one of the previous.
+    starts = numpy.zeros(1, int)
+
+    # Optional preprocessing.Preprocessing, smoothing the speed.
+    preprocessing = None
+
+    def __len__(self):
+        return len(self.time)
+
+    @prop
+    def distance(self):
+        "Actual road distance from the previous point [m]."
+        return numpy.sqrt(self.flat_distance**2 + self.climb**2)
+
+    @prop
+    def climb(self):
+        "Height increase [m]."
+        climb = numpy.zeros(len(self))
+        climb[1:] = numpy.diff(self.elevation)
+        climb[self.starts] = 0
+        return climb
+
+    @prop
+    def incline_sine(self):
+        "Sine of the climb angle."
+        # http://en.wikipedia.org/wiki/Trigonometric_functions#Right-angled_triangle_definitions
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            sine = numpy.where(
+                self.distance != 0,
+                self.climb / self.distance,
+                1
+            )
+            # NaN compares as invalid, without a warning
+            return forward_fill(sine, (-0.25 < sine) & (sine < 0.25), 0)
+
+    @prop
+    def incline_cosine(self):
+        "Cosine of the climb angle."
+        # http://en.wikipedia.org/wiki/Trigonometric_functions#Right-angled_triangle_definitions
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            cosine = numpy.where(
+                self.distance != 0,
+                self.flat_distance / self.distance,
+                0
+            )
+            return forward_fill(cosine, (0.75 < cosine) & (cosine <= 1), 1)
+
+    @prop
+    def period(self):
+        "Time since the previous point [s]."
+        period = numpy.ones(len(self))
+        period[1:] = numpy.diff(self.time)
+        return period
+
+    @prop
+    def speed(self):
+        "Vehicle speed [m/s]."
+        # http://en.wikipedia.org/wiki/Speed#Definition
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            speed = self.distance / self.period
+            speed = forward_fill(
+                speed,
+                (0 <= speed) & (speed < self.max_speed),
+                0
+            )
+        if self.preprocessing:
+            speed = self.preprocessing.speed(speed, self.starts)
+        return speed
+
+    @prop
+    def acceleration(self):
+        "Vehicle acceleration [m/s^2]."
+        acceleration = numpy.zeros(len(self))
+        # http://en.wikipedia.org/wiki/Acceleration#Definition_and_properties
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            acceleration[2:] = numpy.diff(self.speed)[1:] / self.period[2:]
+
+            # car accelerating/decelerating more than g/2 is unlikely
+            return forward_fill(
+                acceleration,
+                (Earth.g/2 < acceleration) & (acceleration < Earth.g/2),
+                0
+            )
+
+
+class Dynamics(object):
+    """Columnar representation of the points of a track for a car.
+
+    Holds the car dependent quantities, computed from kinematics
+    of the track, which can be shared by many cars. Kinematic
+    quantities can be accessed through it as well."""
+
+    def __init__(self, kinematics, car):
+        self.kinematics = kinematics
+        self.car = car
+
+    def __len__(self):
+        return len(self.kinematics)
+
+    def __getattr__(self, attribute):
+        return getattr(self.kinematics, attribute)
+
+    @prop
+    def air_drag(self):
+        "Force of air drag [N]."
+        return 0.5 * Earth.air_density * self.car.cda * self.speed**2
+
+    @prop
+    def rolling_resistance(self):
+        "Force of rolling resistance [N]."
+        return self.car.rrc * self.car.weight * self.incline_cosine
+
+    @prop
+    def incline_force(self):
+        "Gravitational backwards force of the incline [N]."
+        return self.car.weight * self.incline_sine
+
+    @prop
+    def acceleration_force(self):
+        "Force needed for acceleration [N]."
+        return self.car.mass * self.acceleration
+
+    @prop
+    def force(self):
+        "Total force generated by the drivetrain [N]."
+        return self.air_drag + self.rolling_resistance + self.incline_force + self.acceleration_force
+
+    # Whether power_at_wheels asserts that it is within the limits
+    # of the car. Sweeps over car variants check each one instead.
+    check_power = True
+
+    @prop
+    def power_at_wheels(self):
+        "Driving power without drivetrain losses [W]."
+        power = self.force * self.speed
+
+        if self.check_power:
+            assert numpy.all(self.within_power(power))
+
+        return power
+
+    def within_power(self, power):
+        "Whether powers at wheels [W] are plausible for the car."
+        return (-self.car.power * 2 < power) & (power < self.car.power * 1.2)
+
+    @prop
+    def output_power(self):
+        "Power generated by the motor [W]."
+        return numpy.where(
+            self.power_at_wheels > 0,
+            self.power_at_wheels / self.car.mechanical_efficiency,
+            0
+        )
+
+    @prop
+    def regen_power(self):
+        "Regen power reaching the batteries [W]."
+        return numpy.where(
+            self.power_at_wheels > 0,
+            0,
+            - self.power_at_wheels * self.regen_efficiency
+        )
+
+    @prop
+    def motor_power(self):
+        "Motor power requirement [W]."
+        # Regen stresses the motor too
+        return numpy.where(
+            self.power_at_wheels > 0,
+            self.power_at_wheels / self.car.mechanical_efficiency,
+            - self.power_at_wheels * self.car.mechanical_efficiency
+        )
+
+    @prop
+    def energy(self):
+        "Energy used to travel from the previous point [J]."
+        return self.battery_power * self.period
+
+    @prop
+    def battery_power(self):
+        "Power drawn from the battery, negative when charging [W]."
+        return self.output_power / self.electrical_efficiency - self.regen_power
+
+    @prop
+    def electrical_efficiency(self):
+        "Efficiency of the battery, the controller and the motor."
+        return self.car.electrical_efficiency_at(self)
+
+    @prop
+    def regen_efficiency(self):
+        "Efficiency of regen from the wheels to the battery."
+        return self.car.regen_efficiency_at(self)
+
 class Track(object):
     "Class representing a track recorded with a GPS device."
 
+    @prop
+    def points(self):
+        "A list of track points."
+        return [self.point(index) for index in xrange(len(self.columns))]
+
     @prop
     def start_time(self):
-        "Start time of the journey."
-        return self.points[0].time
+        "Start time of the journey [s since the epoch]."
+        return self.columns.time[0]
 
     @prop
     def end_time(self):
-        "End time of the journey."
-        return self.points[-1].time
+        "End time of the journey [s since the epoch]."
+        return self.columns.time[-1]
 
     @prop
     def duration(self):
-        "Duration of the journey [s]."
-        return total_seconds(self.end_time - self.start_time) / 60.0
+        "Duration of the journey excluding breaks between segments [min]."
+        time = self.columns.time
+        starts = self.columns.starts
+        ends = numpy.append(starts[1:], len(time)) - 1
+        return (time[ends] - time[starts]).sum() / 60.0
 
     @prop
     def distance(self):
         "Travelled distance [km]."
-        return sum(point.distance for point in self.points) / 1000
+        return self.columns.distance.sum() / 1000
 
     @prop
     def average_speed(self):
@@ -304,56 +533,140 @@ class Track(object):
     @prop
     def energy(self):
         "Energy needed for this track [Wh]"
-        return sum(point.energy for point in self.points)/3600
+        return self.columns.energy.sum()/3600
 
     @prop
     def energy_rate(self):
         "Energy needed per km [Wh/km]."
         return self.energy/self.distance
 
-    def sliding_window(self, attribute, width=20):
-        "Sliding average window with width points."
-        for i in xrange(len(self.points)-width):
-            window = self.points[i:i+width]
-            values = [getattr(point, attribute) for point in window]
-            yield sum(values)/len(values), window
-    
+    def sliding_window(self, attribute, width=20, unit='points',
+                       aggregate='mean'):
+        """Sliding window aggregate of attribute, returns arrays of
+        the aggregates and indices of the first and last points."""
+        return windows.aggregate(
+            self.columns,
+            attribute,
+            width,
+            unit,
+            aggregate
+        )
+
+    # Windowed metrics backing the peak stats; override on a subclass
+    # or an instance to change window widths, units or aggregates.
+    peak_windows = {
+        'top_speed': windows.Window('speed', 15),
+        'peak_output_power': windows.Window('output_power'),
+        'peak_regen_power': windows.Window('regen_power'),
+        'steepest_incline': windows.Window('incline_sine'),
+        'steepest_decline': windows.Window('incline_sine', peak='min'),
+    }
+
+    @prop
+    def peaks(self):
+        "Peaks of all the windowed metrics, evaluated together."
+        return windows.peaks(self.columns, self.peak_windows)
+
+    def peak(self, name):
+        "Peak of a windowed metric and points where it has been reached."
+        value, first, last = self.peaks[name]
+        return value, self.point(first), self.point(last)
+
     @prop
     def top_speed(self):
         "Max speed [km/h] and points where it has been rached."
-        peak = max(self.sliding_window('speed', 15))
-        return peak[0]*3600/1000, peak[1][0], peak[1][-1]
+        peak = self.peak('top_speed')
+        return (peak[0]*3600/1000,) + peak[1:]
 
     @prop
     def peak_output_power(self):
         "Peak power needed [W] and points where it was needed."
-        peak = max(self.sliding_window('output_power'))
-        return peak[0], peak[1][0], peak[1][-1]
+        return self.peak('peak_output_power')
 
     @prop
     def peak_regen_power(self):
         "Peak power available for regen [W] and points where it was available."
-        peak = max(self.sliding_window('regen_power'))
-        return peak[0], peak[1][0], peak[1][-1]
+        return self.peak('peak_regen_power')
 
     @prop
     def average_motor_power(self):
         "Average power generated and regen'd by the motor [W]."
-        return sum(point.motor_power for point in self.points)/len(self.points)
+        return self.columns.motor_power.mean()
 
     @prop
     def steepest_incline(self):
         "Steepest incline [%]."
-        steepest = max(self.sliding_window('incline_sine'))
+        steepest = self.peak('steepest_incline')
 
-        return steepest[0]*100, steepest[1][0], steepest[1][-1]
+        return (steepest[0]*100,) + steepest[1:]
    
     @prop
     def steepest_decline(self):
         "Steepest decline [%]."
-        steepest = min(self.sliding_window('incline_sine'))
-
-        return -steepest[0]*100, steepest[1][0], steepest[1][-1]
+        steepest = self.peak('steepest_decline')
+
+        return (-steepest[0]*100,) + steepest[1:]
+
+    # Bins of the distributions of columns [SI units]; override on
+    # a subclass or an instance like peak_windows. Distributions
+    # can only be merged between tracks with the same bins.
+    power_bins = numpy.arange(0, 200001, 1000.0)
+    speed_bins = numpy.arange(0, 70.01, 0.5)
+    distribution_bins = {
+        'motor_power': power_bins,
+        'output_power': power_bins,
+        'regen_power': power_bins,
+        'speed': speed_bins,
+    }
+
+    @prop
+    def time_at_point(self):
+        "Time spent at every point, breaks between segments excluded [s]."
+        period = self.columns.period.copy()
+        period[self.columns.starts] = 0
+        return period
+
+    @prop
+    def distributions(self):
+        "Histograms of time spent [s] at values of the columns, by name."
+        distributions = {}
+        for name, edges in self.distribution_bins.iteritems():
+            histogram = sketches.Histogram(edges)
+            histogram.add(getattr(self.columns, name), self.time_at_point)
+            distributions[name] = histogram
+        return distributions
+
+    # Bins of the motor operating points.
+    rpm_bins = numpy.arange(0, 12001, 250.0)
+    torque_bins = numpy.arange(0, 301, 5.0)
+
+    @prop
+    def operating_points(self):
+        """Histograms of time spent [s] at motor speeds [rpm] and
+        torques [Nm], separately 'motoring' and in 'regen'."""
+        columns = self.columns
+        rpm = self.car.motor_rpm(columns.speed)
+        torque = self.car.motor_torque(columns.force)
+        operating_points = {}
+        for mode, points in (
+            ('motoring', columns.power_at_wheels > 0),
+            ('regen', columns.power_at_wheels < 0),
+        ):
+            histogram = sketches.Histogram2D(self.rpm_bins, self.torque_bins)
+            histogram.add(rpm[points], torque[points], self.time_at_point[points])
+            operating_points[mode] = histogram
+        return operating_points
+
+    @prop
+    def speed_power(self):
+        "Histogram of time spent [s] at speeds [m/s] and motor powers [W]."
+        histogram = sketches.Histogram2D(self.speed_bins, self.power_bins)
+        histogram.add(
+            self.columns.speed,
+            self.columns.motor_power,
+            self.time_at_point
+        )
+        return histogram
 
 
 class Commute(object):
@@ -414,3 +727,28 @@ class Commute(object):
     def steepest_decline(self):
         "Steepest decline during the commute [%]."
         return max(track.steepest_decline[0] for track in self.tracks)
+
+    @prop
+    def distributions(self):
+        "Histograms of time spent at values of the columns, merged over the tracks."
+        return dict(
+            (name, sketches.merged(
+                track.distributions[name] for track in self.tracks
+            ))
+            for name in self.tracks[0].distributions
+        )
+
+    @prop
+    def speed_power(self):
+        "Histogram of time spent at speeds and motor powers, merged over the tracks."
+        return sketches.merged(track.speed_power for track in self.tracks)
+
+    @prop
+    def operating_points(self):
+        "Motor operating point histograms merged over the tracks."
+        return dict(
+            (mode, sketches.merged(
+                track.operating_points[mode] for track in self.tracks
+            ))
+            for mode in ('motoring', 'regen')
+        )
@@ -24,12 +24,37 @@ License:
     along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
 """
 
+import collections
+import csv
 import functools
+import numpy
+import threading
+import time
+
+from timeit import default_timer as timer
 
 class prop(property):
     "A property that caches the result for future accesses."
 
+    # every prop ever created, so that profiling can be switched on and off
+    instances = []
+
     def __init__(self, function):
+        self.function = function
+        prop.instances.append(self)
+        self.switch(profile)
+
+    def switch(self, profile):
+        "Uses a getter recording to profile, or a plain one if it is None."
+        if profile is None:
+            getter = self.cached(self.function)
+        else:
+            getter = profiled(self.function, profile, self.load, self.store)
+        super(prop, self).__init__(getter)
+
+    @staticmethod
+    def cached(function):
+        "Getter caching the result of function in the instance dict."
 
         attribute = function.__name__
 
@@ -42,7 +67,235 @@ class prop(property):
                 vars(obj)[attribute] = value
                 return value
 
-        super(prop, self).__init__(cached)
+        return cached
+
+    @staticmethod
+    def load(obj, attribute):
+        return vars(obj)[attribute]
+
+    @staticmethod
+    def store(obj, attribute, value):
+        vars(obj)[attribute] = value
+
+class slot_prop(prop):
+    """A prop caching the result in a slot instead of the instance
+    dict, for classes with __slots__. The slot is named after the
+    property with a leading underscore, see cache_slots."""
+
+    @staticmethod
+    def cached(function):
+        "Getter caching the result of function in a slot."
+
+        slot = '_' + function.__name__
+
+        @functools.wraps(function)
+        def cached(obj):
+            value = getattr(obj, slot, missing)
+            if value is missing:
+                value = function(obj)
+                setattr(obj, slot, value)
+            return value
+
+        return cached
+
+    @staticmethod
+    def load(obj, attribute):
+        value = getattr(obj, '_' + attribute, missing)
+        if value is missing:
+            raise KeyError(attribute)
+        return value
+
+    @staticmethod
+    def store(obj, attribute, value):
+        setattr(obj, '_' + attribute, value)
+
+# Value of an empty slot.
+missing = object()
+
+def cache_slots(namespace):
+    """Names of the slots needed by the slot_props of a class body,
+    to be used as: __slots__ = (...) + cache_slots(locals())"""
+    return tuple(sorted(
+        '_' + value.function.__name__
+        for value in namespace.values()
+        if isinstance(value, slot_prop)
+    ))
+
+def profiled(function, profile, load, store):
+    "Caching getter recording accesses and computations in profile."
+
+    attribute = function.__name__
+
+    @functools.wraps(function)
+    def cached(obj):
+        name = type(obj).__name__ + '.' + attribute
+        try:
+            value = load(obj, attribute)
+        except KeyError:
+            pass
+        else:
+            profile.hit(name)
+            return value
+
+        profile.enter(name)
+        start = timer()
+        try:
+            value = function(obj)
+        finally:
+            profile.leave(name, timer() - start)
+        store(obj, attribute, value)
+        return value
+
+    return cached
+
+class Profile(object):
+    """Accesses, cache hits and misses, cumulative and self time
+    of computations of props, by class and property name."""
+
+    fields = ('calls', 'hits', 'misses', 'cumulative', 'self')
+
+    def __init__(self):
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def counter(self, name):
+        try:
+            return self.counters[name]
+        except KeyError:
+            return self.counters.setdefault(name, [0, 0, 0, 0.0, 0.0])
+
+    def hit(self, name):
+        with self.lock:
+            counter = self.counter(name)
+            counter[0] += 1
+            counter[1] += 1
+
+    def enter(self, name):
+        # time spent in nested computations, per computation in progress
+        stack = vars(self.local).setdefault('stack', [])
+        stack.append(0.0)
+
+    def leave(self, name, elapsed):
+        stack = self.local.stack
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        with self.lock:
+            counter = self.counter(name)
+            counter[0] += 1
+            counter[2] += 1
+            counter[3] += elapsed
+            counter[4] += elapsed - nested
+
+    def rows(self):
+        "(name, calls, hits, misses, cumulative, self) by self time."
+        with self.lock:
+            rows = [(name,) + tuple(counter)
+                    for (name, counter) in self.counters.iteritems()]
+        return sorted(rows, key=lambda row: (-row[5], row[0]))
+
+    def as_dict(self):
+        return dict(
+            (row[0], dict(zip(self.fields, row[1:])))
+            for row in self.rows()
+        )
+
+# The active Profile, None when profiling is off.
+profile = None
+
+def start_profiling():
+    "Starts recording accesses to all props, returns the Profile."
+    global profile
+    profile = Profile()
+    for instance in prop.instances:
+        instance.switch(profile)
+    return profile
+
+def stop_profiling():
+    "Stops recording accesses to props, returns the last Profile."
+    global profile
+    last, profile = profile, None
+    for instance in prop.instances:
+        instance.switch(None)
+    return last
+
+def print_profile(profile):
+    print '%-40s %10s %10s %10s %12s %12s' % (
+        'property', 'calls', 'hits', 'misses', 'cumulative', 'self'
+    )
+    for name, calls, hits, misses, cumulative, self in profile.rows():
+        print '%-40s %10d %10d %10d %10.3f s %10.3f s' % (
+            name, calls, hits, misses, cumulative, self
+        )
+
+class LRUCache(object):
+    """A mapping keeping up to size most recently used items,
+    each for up to ttl seconds if ttl is given."""
+
+    def __init__(self, size, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        # key: (value, expiry time or None)
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, expires = self.items.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.time():
+                self.expired += 1
+                self.misses += 1
+                return default
+            self.items[key] = value, expires
+            self.hits += 1
+            return value
+
+    def __setitem__(self, key, value):
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = time.time() + self.ttl
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value, expires
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+    def keys(self):
+        with self.lock:
+            return self.items.keys()
+
+    def counters(self):
+        "Size, hits, misses, expired items and the hit rate."
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.items),
+                'capacity': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': float(self.hits) / lookups if lookups else None,
+            }
+
+def forward_fill(values, valid, default):
+    """Replaces invalid values with the last valid value
+    preceding them, or with default if there is none."""
+    index = numpy.where(valid, numpy.arange(len(values)), -1)
+    numpy.maximum.accumulate(index, out=index)
+    return numpy.where(index >= 0, values[index], default)
 
 stats_units = (
     ('distance', 'km'),
@@ -58,6 +311,76 @@ stats_units = (
     ('steepest decline', '%')
 )
 
+def stats_json(stats):
+    """Stats as a JSON-friendly mapping of stat names
+    to their value, unit and optional map URL."""
+    result = {}
+    for stat, unit in stats_units:
+        value = stats[stat]
+        entry = {'unit': unit}
+        if isinstance(value, tuple):
+            if len(value) > 1:
+                entry['url'] = value[1]
+            value = value[0]
+        entry['value'] = value
+        result[stat] = entry
+    return result
+
+# Units of the columns with distributions.
+distribution_units = {
+    'motor_power': 'W',
+    'output_power': 'W',
+    'regen_power': 'W',
+    'speed': 'm/s',
+}
+
+def distributions_json(owner, percentiles=(5, 25, 50, 75, 95, 99)):
+    """Distributions of a Track or a Commute as a JSON-friendly mapping:
+    histograms and percentiles of time spent at values of the columns,
+    and the speed_power histogram."""
+    result = {}
+    for name, histogram in owner.distributions.iteritems():
+        entry = histogram.as_dict()
+        entry['unit'] = distribution_units.get(name)
+        entry['percentiles'] = dict(
+            ('p%d' % p, histogram.quantile(p / 100.0)) for p in percentiles
+        )
+        result[name] = entry
+    result['speed_power'] = owner.speed_power.as_dict()
+    return result
+
+def operating_points_json(operating_points):
+    """Motor operating point histograms of a Track or a Commute as
+    a JSON-friendly mapping of modes to the histograms and their
+    envelopes of the highest torque in every speed bin."""
+    result = {}
+    for mode, histogram in operating_points.iteritems():
+        entry = histogram.as_dict()
+        entry['envelope'] = [
+            {'rpm_low': rpm_low, 'rpm_high': rpm_high, 'max_torque': torque}
+            for (rpm_low, rpm_high, torque) in histogram.envelope()
+        ]
+        entry['units'] = {'x': 'rpm', 'y': 'Nm', 'counts': 's'}
+        result[mode] = entry
+    return result
+
+operating_points_fields = (
+    'name', 'mode', 'rpm_low', 'rpm_high', 'torque_low', 'torque_high', 'seconds'
+)
+
+def write_operating_points(named_operating_points, file):
+    """Writes CSV rows of the cells with time in them of operating
+    points of (name, operating points) pairs, a bound past the
+    edges of the bins being empty."""
+    writer = csv.writer(file)
+    writer.writerow(operating_points_fields)
+    for name, operating_points in named_operating_points:
+        for mode in sorted(operating_points):
+            for cell in operating_points[mode].cells():
+                writer.writerow((name, mode) + tuple(
+                    '' if value is None else value for value in cell
+                ))
+
 def print_stats(stats):
     for stat, unit in stats_units:
         value = stats[stat]
@@ -78,5 +401,5 @@ def print_stats(stats):
 def total_seconds(delta):
 	total = delta.seconds
 	total += delta.days * 60*60*24
-	total += delta.microseconds/1000.0
+	total += delta.microseconds/1e6
 	return total
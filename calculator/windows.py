@@ -0,0 +1,309 @@
+"""
+Sliding window aggregates over track columns.
+
+Windows can span a number of points, seconds or metres. Means are
+computed from prefix sums and minima/maxima from monotonic deques in
+linear time, so no window is ever materialized and all the windows
+sharing a shape are evaluated together.
+
+Author: Filip Zyzniewski <filip.zyzniewski@gmail.com>
+
+License:
+
+    This file is part of gpx2energy.
+
+    gpx2energy is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    Foobar is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gpx2energy.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import collections
+import numpy
+import operator
+
+units = ('points', 'seconds', 'metres')
+
+class Window(object):
+    """Specification of a windowed metric: the column to aggregate,
+    the window width in units, the aggregate taken over each window
+    ('mean', 'min' or 'max') and the window picked as the peak
+    ('max' or 'min')."""
+
+    def __init__(self, attribute, width=20, unit='points',
+                 aggregate='mean', peak='max'):
+        assert unit in units
+        assert aggregate in aggregates
+        assert peak in ('max', 'min')
+        self.attribute = attribute
+        self.width = width
+        self.unit = unit
+        self.aggregate = aggregate
+        self.peak = peak
+
+    @property
+    def shape(self):
+        "Windows with the same shape share their bounds."
+        return self.unit, self.width
+
+    def __repr__(self):
+        return '%s(%r, %r, %r, %r, %r)' % (
+            type(self).__name__,
+            self.attribute,
+            self.width,
+            self.unit,
+            self.aggregate,
+            self.peak
+        )
+
+
+def positions(columns, unit):
+    "Position of every point along the track in the given unit."
+    if unit == 'seconds':
+        return columns.time
+    elif unit == 'metres':
+        return numpy.cumsum(columns.distance)
+
+
+def bounds(count, width, positions=None):
+    """Indices of the first and last point of every complete window.
+
+    Without positions a window spans width points, otherwise it spans
+    the points whose positions are within width from its first point."""
+    if positions is None:
+        # this mirrors the original window count of count - width
+        first = numpy.arange(max(count - width, 0))
+        return first, first + width - 1
+
+    ends = positions + width
+    first = numpy.arange(numpy.searchsorted(ends, positions[-1], 'right'))
+    last = numpy.searchsorted(positions, ends[first], 'right') - 1
+    return first, last
+
+
+def mean(values, first, last):
+    "Mean of values in each window, along the last axis."
+    sums = numpy.zeros(values.shape[:-1] + (values.shape[-1] + 1,))
+    numpy.cumsum(values, axis=-1, out=sums[..., 1:])
+    return (sums[..., last + 1] - sums[..., first]) / (last - first + 1)
+
+
+class Extremes(object):
+    """Points which can still become the minimum or maximum
+    (depending on aggregate) of a window sliding forward, as a deque
+    of (index, value) with the extreme at its head."""
+
+    def __init__(self, aggregate):
+        if aggregate == 'max':
+            self.dominates = operator.ge
+        else:
+            self.dominates = operator.le
+        self.candidates = collections.deque()
+
+    def add(self, index, value):
+        "Adds the next point, dropping the ones it dominates."
+        candidates = self.candidates
+        dominates = self.dominates
+        while candidates and dominates(value, candidates[-1][1]):
+            candidates.pop()
+        candidates.append((index, value))
+
+    def drop(self, first):
+        "Drops the points before index first."
+        candidates = self.candidates
+        while candidates and candidates[0][0] < first:
+            candidates.popleft()
+
+    @property
+    def value(self):
+        return self.candidates[0][1]
+
+    def value_from(self, first):
+        "Extreme of the points from index first on."
+        for index, value in self.candidates:
+            if index >= first:
+                return value
+
+
+def extreme(aggregate, values, first, last):
+    """Minimum or maximum (depending on aggregate) of values
+    in each window, along the last axis.
+
+    Both window bounds only move forward, so every point enters
+    and leaves the Extremes of a row once."""
+    rows = values.reshape(-1, values.shape[-1])
+    result = numpy.empty((len(rows), len(first)))
+    bounds = zip(first.tolist(), last.tolist())
+    for row, out in zip(rows, result):
+        row = row.tolist()
+        extremes = Extremes(aggregate)
+        added = 0
+        for window, (start, end) in enumerate(bounds):
+            while added <= end:
+                extremes.add(added, row[added])
+                added += 1
+            extremes.drop(start)
+            out[window] = extremes.value
+    return result.reshape(values.shape[:-1] + (len(first),))
+
+
+def minimum(values, first, last):
+    "Minimum of values in each window, along the last axis."
+    return extreme('min', values, first, last)
+
+
+def maximum(values, first, last):
+    "Maximum of values in each window, along the last axis."
+    return extreme('max', values, first, last)
+
+
+aggregates = {
+    'mean': mean,
+    'min': minimum,
+    'max': maximum,
+}
+
+
+def aggregate(columns, attribute, width=20, unit='points', function='mean'):
+    """Aggregates of attribute over all the windows of the columns
+    and indices of their first and last points."""
+    first, last = bounds(len(columns), width, positions(columns, unit))
+    values = aggregates[function](getattr(columns, attribute), first, last)
+    return values, first, last
+
+
+def peaks(columns, windows):
+    """Peaks of windowed metrics, a mapping from names to Windows.
+
+    Returns a mapping from names to (value, first, last) tuples.
+    Metrics sharing a window shape and aggregate are evaluated
+    together with one pass over a stack of their columns."""
+
+    groups = {}
+    for name, window in windows.iteritems():
+        key = window.shape, window.aggregate
+        groups.setdefault(key, []).append(name)
+
+    results = {}
+    for ((unit, width), function), names in groups.iteritems():
+        first, last = bounds(len(columns), width, positions(columns, unit))
+        if not len(first):
+            raise ValueError('track too short for %s windows' % (
+                ', '.join(sorted(names))
+            ))
+
+        attributes = sorted(set(windows[name].attribute for name in names))
+        stack = numpy.vstack([
+            getattr(columns, attribute) for attribute in attributes
+        ])
+        values = aggregates[function](stack, first, last)
+
+        for name in names:
+            window = windows[name]
+            row = values[attributes.index(window.attribute)]
+            if window.peak == 'max':
+                index = row.argmax()
+            else:
+                index = row.argmin()
+            results[name] = row[index], first[index], last[index]
+
+    return results
+
+
+class Running(object):
+    """Incremental evaluation of the peak of a Window over points
+    added one at a time, in O(1) amortized time per point.
+
+    Only the points of windows which are not complete yet are kept.
+    Windows and their completeness follow bounds(): a window spanning
+    points completes once a point past it arrives, a window spanning
+    positions once the last point reaches its end."""
+
+    def __init__(self, window):
+        self.window = window
+        self.count = 0
+        # (index, position, value, location) of the points
+        # from the first point of the oldest open window on
+        self.pending = collections.deque()
+        # points which can still become the extreme of a window,
+        # for min and max aggregates
+        self.extremes = None
+        if window.aggregate != 'mean':
+            self.extremes = Extremes(window.aggregate)
+        self.total = 0.0
+        # peak of the windows which can't grow anymore
+        self.closed = None
+
+    def add(self, value, position=None, location=None):
+        """Adds the value of the next point, its position in the window
+        unit (unless it is points) and an object identifying it."""
+        window = self.window
+        if window.unit == 'points':
+            if len(self.pending) == window.width:
+                self.close()
+        else:
+            while self.pending and self.pending[0][1] + window.width < position:
+                self.close()
+
+        index = self.count
+        self.count += 1
+        self.pending.append((index, position, value, location))
+        self.total += value
+        if self.extremes is not None:
+            self.extremes.add(index, value)
+
+    @property
+    def peak(self):
+        """(value, location of the first point, location of the last point)
+        of the peak window so far, None before the first one completes.
+
+        Windows reaching the position of the last point are complete,
+        but a point recorded at the same position would still join them."""
+        peak = self.closed
+        window = self.window
+        if window.unit != 'points':
+            pending = self.pending
+            offset = 0
+            while offset < len(pending) and \
+                    pending[offset][1] + window.width == pending[-1][1]:
+                peak = self.better(peak, self.evaluate(offset))
+                offset += 1
+        return peak
+
+    def better(self, peak, other):
+        "The peak of two (value, first, last) windows, peak may be None."
+        if peak is None:
+            return other
+        if self.window.peak == 'max':
+            return other if other[0] > peak[0] else peak
+        return other if other[0] < peak[0] else peak
+
+    def evaluate(self, offset):
+        """(value, first location, last location) of the window
+        from the pending point at offset to the last point."""
+        pending = self.pending
+        if self.window.aggregate == 'mean':
+            total = self.total
+            for i in xrange(offset):
+                total -= pending[i][2]
+            value = total / (len(pending) - offset)
+        else:
+            value = self.extremes.value_from(pending[offset][0])
+        return value, pending[offset][3], pending[-1][3]
+
+    def close(self):
+        "Completes the oldest open window, spanning all pending points."
+        self.closed = self.better(self.closed, self.evaluate(0))
+
+        index, position, first, location = self.pending.popleft()
+        self.total -= first
+        if self.extremes is not None:
+            self.extremes.drop(index + 1)